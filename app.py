@@ -1,13 +1,24 @@
 import os
-import sys
+import re
+import json
+import math
+import uuid
+import wave
+import shutil
+import asyncio
+import tempfile
 import subprocess
 import base64
 
-from fastapi import FastAPI, Form
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi import FastAPI, Form, HTTPException, Request
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, RedirectResponse, StreamingResponse
 from dotenv import load_dotenv
-from groq import Groq
-from sarvamai import SarvamAI
+
+import media
+import lipsync
+import metrics
+from jobs import JobManager, QueueFull, DONE
+from upstream import GroqClient, SarvamClient, UpstreamUnavailable
 
 # -------------------------------------------------
 # Load environment variables
@@ -29,14 +40,13 @@ VIDEO_FACE = os.path.join(BASE_DIR, "inputs", "face_ref.mp4")
 VIDEO_WELCOME = os.path.join(BASE_DIR, "inputs", "welcome.mp4")
 VIDEO_IDLE = os.path.join(BASE_DIR, "inputs", "idle.mp4")
 
-AUDIO_OUTPUT = os.path.join(BASE_DIR, "temp", "tts.wav")
-RAW_VIDEO_OUTPUT = os.path.join(BASE_DIR, "outputs", "result_raw.mp4")
-FINAL_VIDEO_OUTPUT = os.path.join(BASE_DIR, "outputs", "result_browser.mp4")
+JOB_WORKSPACE_DIR = os.path.join(BASE_DIR, "temp", "jobs")
+JOB_OUTPUT_DIR = os.path.join(BASE_DIR, "outputs", "jobs")
 
-WAV2LIP_SCRIPT = os.path.join(BASE_DIR, "inference_onnxModel.py")
-WAV2LIP_MODEL = os.path.join(BASE_DIR, "checkpoints", "wav2lip_gan.onnx")
+STREAM_DIR = os.path.join(BASE_DIR, "temp", "stream")
 
 os.makedirs(os.path.join(BASE_DIR, "temp"), exist_ok=True)
+os.makedirs(STREAM_DIR, exist_ok=True)
 os.makedirs(os.path.join(BASE_DIR, "outputs"), exist_ok=True)
 
 # -------------------------------------------------
@@ -44,35 +54,249 @@ os.makedirs(os.path.join(BASE_DIR, "outputs"), exist_ok=True)
 # -------------------------------------------------
 app = FastAPI()
 
-groq_client = Groq(api_key=GROQ_API_KEY)
-sarvam_client = SarvamAI(api_subscription_key=SARVAM_API_KEY)
+groq_client = GroqClient(GROQ_API_KEY)
+sarvam_client = SarvamClient(SARVAM_API_KEY)
+
+# Sentences are synthesized ahead of the renderer, which stays sequential
+# because every segment continues the avatar frame index of the previous one.
+TTS_AHEAD = 2
+
+job_manager = JobManager(
+    JOB_WORKSPACE_DIR,
+    JOB_OUTPUT_DIR,
+    max_workers=int(os.getenv("JOB_WORKERS", "2")),
+    max_pending=int(os.getenv("JOB_MAX_PENDING", "16"))
+)
+
+# welcome/idle loops are small and requested on every page load
+assets = {}
+
+@app.on_event("startup")
+def load_assets():
+    for name, path in (("welcome", VIDEO_WELCOME), ("idle", VIDEO_IDLE)):
+        if os.path.exists(path):
+            assets[name] = media.MemoryAsset(path)
+
+@app.on_event("startup")
+def register_gauges():
+    metrics.JOBS_IN_PROGRESS.set_function(job_manager.pending)
+    if lipsync.RENDER_MODE == "queue":
+        metrics.QUEUE_DEPTH.set_function(lambda: lipsync.get_queue().depth())
+
+@app.on_event("shutdown")
+async def close_clients():
+    await groq_client.close()
+    await sarvam_client.close()
+
+@app.exception_handler(UpstreamUnavailable)
+async def upstream_unavailable(request, exc):
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
 
 # -------------------------------------------------
 # Helper: Make text TTS-safe
 # -------------------------------------------------
-def make_tts_safe(text: str) -> str:
-    resp = groq_client.chat.completions.create(
-        model="llama-3.1-8b-instant",
-        messages=[
-            {
-                "role": "system",
-                "content": """
+async def make_tts_safe(text: str) -> str:
+    return await groq_client.chat([
+        {
+            "role": "system",
+            "content": """
 Convert the input into natural spoken English suitable for text-to-speech.
 Rules:
 - No symbols, emojis, markdown, or code
 - Convert math and symbols into words
 - Plain conversational English only
 """
-            },
-            {"role": "user", "content": text}
-        ]
-    )
-    return resp.choices[0].message.content.strip()
+        },
+        {"role": "user", "content": text}
+    ])
+
+# -------------------------------------------------
+# Streaming helpers
+# -------------------------------------------------
+STREAM_SYSTEM_PROMPT = """
+Respond in spoken English only. Your reply is read aloud by text-to-speech.
+Rules:
+- No symbols, emojis, markdown, or code
+- Convert math and symbols into words
+- Plain conversational English only
+"""
+
+# Short fragments ("Sure.") are merged into the next sentence so the
+# renderer does not pay per-segment overhead for half a second of video.
+MIN_SENTENCE_CHARS = 40
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+# Mirrors the mel chunking in inference_onnxModel.main() (16 kHz, hop 200,
+# 80 mel frames per second, 16-frame window) so the next segment can start
+# at the frame index where the previous one stopped.
+MEL_SAMPLE_RATE = 16000
+MEL_HOP_SIZE = 200
+MEL_STEP_SIZE = 16
+
+
+def clean_for_tts(text: str) -> str:
+    text = re.sub(r"[*_#`~>|\[\]{}]", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+async def stream_sentences(query: str):
+    """Yield the LLM reply sentence by sentence while it is still generating."""
+    stream = groq_client.stream_chat([
+        {"role": "system", "content": STREAM_SYSTEM_PROMPT},
+        {"role": "user", "content": query}
+    ])
+
+    buffer = ""
+    async for delta in stream:
+        buffer += delta
+        parts = SENTENCE_END.split(buffer)
+        buffer = parts.pop()
+
+        pending = ""
+        for part in parts:
+            pending = (pending + " " + part).strip()
+            if len(pending) >= MIN_SENTENCE_CHARS:
+                yield clean_for_tts(pending)
+                pending = ""
+        if pending:
+            buffer = pending + " " + buffer
+
+    buffer = clean_for_tts(buffer)
+    if buffer:
+        yield buffer
+
+
+async def synthesize(text: str, out_path: str) -> str:
+    audio_b64 = await sarvam_client.tts(text)
+    with open(out_path, "wb") as f:
+        f.write(base64.b64decode(audio_b64))
+    return out_path
+
+
+def probe_fps(path: str) -> float:
+    rate = subprocess.run([
+        "ffprobe", "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "stream=r_frame_rate",
+        "-of", "csv=p=0",
+        path
+    ], check=True, capture_output=True, text=True).stdout.strip()
+    num, _, den = rate.partition("/")
+    return float(num) / float(den or 1)
+
+
+def count_frames(wav_path: str, fps: float) -> int:
+    with wave.open(wav_path, "rb") as w:
+        samples = math.ceil(w.getnframes() * MEL_SAMPLE_RATE / w.getframerate())
+
+    mel_len = 1 + samples // MEL_HOP_SIZE
+    mel_idx_multiplier = 80. / fps
+    i = 0
+    while int(i * mel_idx_multiplier) + MEL_STEP_SIZE <= mel_len:
+        i += 1
+    return i + 1
+
+
+async def stream_segments(query: str):
+    """
+    LLM -> TTS -> lip-sync, one sentence at a time.
+
+    Yields one NDJSON line per segment as soon as its render starts, so
+    the page can play the first sentence while it and later ones are
+    still being produced.
+    """
+    session_id = uuid.uuid4().hex
+    session_dir = os.path.join(STREAM_DIR, session_id)
+    os.makedirs(session_dir, exist_ok=True)
+
+    # started before the producer task so its llm/tts spans land here too
+    trace = metrics.start(session_id)
+
+    pending = asyncio.Queue()
+    tts_slots = asyncio.Semaphore(TTS_AHEAD)
+
+    async def synthesize_ahead(sentence, audio_path):
+        async with tts_slots:
+            return await synthesize(sentence, audio_path)
+
+    async def produce():
+        try:
+            i = 0
+            async for sentence in stream_sentences(query):
+                audio_path = os.path.join(session_dir, f"{i}.wav")
+                pending.put_nowait((sentence, asyncio.create_task(synthesize_ahead(sentence, audio_path))))
+                i += 1
+        except Exception as e:
+            pending.put_nowait(e)
+        pending.put_nowait(None)
+
+    producer = asyncio.create_task(produce())
+
+    try:
+        fps = await asyncio.to_thread(probe_fps, VIDEO_FACE)
+        frame_offset = 0
+        index = 0
+
+        while True:
+            item = await pending.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+
+            sentence, tts_task = item
+            audio_path = await tts_task
+
+            # announced before rendering: the page plays the fragmented mp4
+            # from the live URL while its frames are still being produced
+            segment_path = os.path.join(session_dir, f"{index}.mp4")
+            live = media.open_live(segment_path)
+            yield json.dumps({
+                "status": "segment",
+                "index": index,
+                "text": sentence,
+                "url": live.live_url
+            }) + "\n"
+
+            url = None
+            try:
+                with tempfile.TemporaryDirectory(dir=session_dir) as workdir:
+                    await lipsync.render_async(
+                        VIDEO_FACE,
+                        audio_path,
+                        segment_path,
+                        workdir,
+                        frame_offset=frame_offset,
+                        progressive=True
+                    )
+                url = await asyncio.to_thread(media.publish, segment_path, live)
+            finally:
+                media.close_live(live, url)
+
+            frame_offset += count_frames(audio_path, fps)
+            index += 1
+
+        yield json.dumps({"status": "done", "segments": index}) + "\n"
+    except Exception as e:
+        yield json.dumps({"status": "error", "detail": str(e)}) + "\n"
+    finally:
+        producer.cancel()
+        await asyncio.gather(producer, return_exceptions=True)
+        # TTS started ahead for sentences that were never rendered must
+        # stop writing into session_dir before it goes
+        ahead = []
+        while not pending.empty():
+            item = pending.get_nowait()
+            if isinstance(item, tuple):
+                item[1].cancel()
+                ahead.append(item[1])
+        await asyncio.gather(*ahead, return_exceptions=True)
+        shutil.rmtree(session_dir, ignore_errors=True)
+        trace.observe()
 
 # -------------------------------------------------
 # UI
 # -------------------------------------------------
-from fastapi.responses import HTMLResponse
 
 @app.get("/", response_class=HTMLResponse)
 def index():
@@ -85,71 +309,86 @@ def index():
 # -------------------------------------------------
 # Video endpoints
 # -------------------------------------------------
-@app.get("/video/welcome")
-def welcome_video():
-    return FileResponse(VIDEO_WELCOME, media_type="video/mp4")
+@app.api_route("/video/{name}", methods=["GET", "HEAD"])
+def static_video(request: Request, name: str):
+    if name not in assets:
+        raise HTTPException(status_code=404, detail="Video not found")
+    return media.serve_asset(request, assets[name])
 
-@app.get("/video/idle")
-def idle_video():
-    return FileResponse(VIDEO_IDLE, media_type="video/mp4")
+@app.api_route("/media/{name}", methods=["GET", "HEAD"])
+def media_video(request: Request, name: str):
+    return media.serve_media(request, name)
 
-@app.get("/video/generated")
-def generated_video():
-    return FileResponse(FINAL_VIDEO_OUTPUT, media_type="video/mp4")
+@app.get("/live/{token}")
+async def live_video(token: str):
+    return media.serve_live(token)
 
 # -------------------------------------------------
-# Generation endpoint
+# Jobs
 # -------------------------------------------------
-@app.post("/generate")
-def generate_video(query: str = Form(...)):
+async def run_chat_job(job, query: str, progressive: bool = False, profile: bool = False):
 
     # 1. LLM
-    llm = groq_client.chat.completions.create(
-        model="llama-3.1-8b-instant",
-        messages=[
-            {"role": "system", "content": "Respond in spoken English only."},
-            {"role": "user", "content": query}
-        ]
-    )
-    raw_reply = llm.choices[0].message.content.strip()
+    raw_reply = await groq_client.chat([
+        {"role": "system", "content": "Respond in spoken English only."},
+        {"role": "user", "content": query}
+    ])
 
     # 2. TTS-safe text
-    text_reply = make_tts_safe(raw_reply)
+    text_reply = await make_tts_safe(raw_reply)
 
     # 3. Sarvam TTS (female)
-    tts = sarvam_client.text_to_speech.convert(
-        text=text_reply,
-        target_language_code="en-IN"
-    )
-
-    audio_bytes = base64.b64decode(tts.audios[0])
-    with open(AUDIO_OUTPUT, "wb") as f:
-        f.write(audio_bytes)
-
-    # 4. Wav2Lip
-    subprocess.run([
-        sys.executable,
-        WAV2LIP_SCRIPT,
-        "--checkpoint_path", WAV2LIP_MODEL,
-        "--face", VIDEO_FACE,
-        "--audio", AUDIO_OUTPUT,
-        "--outfile", RAW_VIDEO_OUTPUT
-    ], check=True)
-
-    # 5. Browser-safe encoding
-    subprocess.run([
-        "ffmpeg", "-y",
-        "-i", RAW_VIDEO_OUTPUT,
-        "-c:v", "libx264",
-        "-pix_fmt", "yuv420p",
-        "-profile:v", "baseline",
-        "-level", "3.0",
-        "-c:a", "aac",
-        "-movflags", "+faststart",
-        FINAL_VIDEO_OUTPUT
-    ], check=True)
-
-    return {"status": "done"}
+    audio_path = await synthesize(text_reply, os.path.join(job.workspace, "tts.wav"))
+
+    # 4. Wav2Lip + browser-safe encoding
+    if progressive:
+        job.live = media.open_live(job.output)
+    profile_path = job.enable_profile() if profile else None
+    await lipsync.render_async(VIDEO_FACE, audio_path, job.output, job.workspace,
+                               progressive=progressive, profile=profile_path)
+
+
+@app.post("/jobs", status_code=202)
+async def create_job(query: str = Form(...), progressive: bool = Form(False), profile: bool = Form(False)):
+    try:
+        job = job_manager.submit(run_chat_job, query, progressive, profile)
+    except QueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return job.to_dict()
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@app.get("/jobs/{job_id}/video")
+async def job_video(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status != DONE:
+        return JSONResponse(status_code=409, content=job.to_dict())
+    return RedirectResponse(job.video_url, status_code=307)
+
+@app.get("/jobs/{job_id}/profile")
+async def job_profile(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None or not job.profile or not os.path.exists(job.profile):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(job.profile, media_type="application/json", filename=f"{job_id}.trace.json")
+
+# -------------------------------------------------
+# Streaming generation endpoint
+# -------------------------------------------------
+@app.post("/generate/stream")
+async def generate_stream(query: str = Form(...)):
+    return StreamingResponse(stream_segments(query), media_type="application/x-ndjson")
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return metrics.metrics_response()
 
 @app.get("/favicon.ico")
 def favicon():
@@ -0,0 +1,280 @@
+import os
+import glob
+import json
+import time
+import argparse
+import platform
+
+import numpy as np
+import onnxruntime
+
+from model_prep import MODELS as PREP_MODELS, PREPARED_SUFFIX, WAV2LIP_GLOB, prepared_path
+from utils import ort_profile
+
+# -------------------------------------------------
+# Host autotuner for the ONNX Runtime sessions
+#
+#   python autotune.py                        # every model that is present
+#   python autotune.py --model enhancers/GPEN/GPEN-BFR-256-sim.onnx --runs 20
+#   python autotune.py --quantize             # also try dynamic INT8 variants
+#
+# For each model at the input shape it gets while rendering, tries the
+# graph variants on disk (the original, model_prep.py's .u8, INT8), then
+# intra-op threads, execution mode with inter-op threads, and the memory
+# pattern / arena options, one knob at a time keeping the fastest. The
+# result goes into this host's profile (utils/ort_profile.py), which every
+# session the engine creates picks up at startup.
+#
+# Tune on an otherwise idle host, with as many worker processes in mind:
+# the thread counts are the fastest for one session running alone.
+# -------------------------------------------------
+INT8_SUFFIX = ".int8"
+
+# production sizes of the symbolic dims after the batch dim, in order;
+# "frame" is --frame_size
+SHAPES = {
+    "utils/scrfd_2.5g_bnkps.onnx": (320, 320),
+    "enhancers/RealEsrgan/clear_reality_x4.onnx": "frame",
+    # one 30 s chunk at 44.1 kHz: 841 STFT bins x 3151 hops
+    "resemble_denoiser/denoiser.onnx": (841, 3151)
+}
+
+EXTRA_MODELS = (
+    "utils/scrfd_2.5g_bnkps.onnx",
+    "seg_mask/vox-5segments.onnx",
+    "face_occluder/face_occluder.onnx",
+    "resemble_denoiser/denoiser.onnx"
+)
+
+DTYPES = {
+    "tensor(float)": np.float32,
+    "tensor(float16)": np.float16,
+    "tensor(double)": np.float64,
+    "tensor(uint8)": np.uint8,
+    "tensor(int64)": np.int64
+}
+
+
+def known_models() -> list:
+    """Paths (relative to the model root) of every model the engine may load that is present."""
+    paths = [p.replace(os.sep, "/") for p in PREP_MODELS] + list(EXTRA_MODELS)
+    paths += [p.replace(os.sep, "/") for p in sorted(glob.glob(WAV2LIP_GLOB))]
+    return [p for p in dict.fromkeys(paths) if os.path.exists(p) and ort_profile.model_key(p) == p]
+
+
+def variants(path: str) -> list:
+    root = os.path.splitext(path)[0]
+    candidates = [path, root + PREPARED_SUFFIX, root + INT8_SUFFIX + ".onnx",
+                  os.path.splitext(root + PREPARED_SUFFIX)[0] + INT8_SUFFIX + ".onnx"]
+    return [p for p in candidates if os.path.exists(p)]
+
+
+def quantize(path: str):
+    """Write dynamic INT8 variants next to `path` and its .u8 variant."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    for source in variants(path):
+        if INT8_SUFFIX in source:
+            continue
+        target = os.path.splitext(source)[0] + INT8_SUFFIX + ".onnx"
+        if not os.path.exists(target):
+            print(f"Quantizing {source}")
+            quantize_dynamic(source, target, weight_type=QuantType.QInt8)
+
+
+def production_sizes(path: str, frame_size: str) -> tuple:
+    """Sizes of the symbolic dims of model `path` while rendering `frame_size` (WIDTHxHEIGHT) frames."""
+    sizes = SHAPES.get(ort_profile.model_key(path), ())
+    if sizes == "frame":
+        width, height = (int(v) for v in frame_size.lower().split("x"))
+        sizes = (height, width)
+    return sizes
+
+
+def production_feeds(session, sizes=()) -> dict:
+    """Random inputs for `session`: symbolic dims are a batch of one, then `sizes` in order."""
+    rng = np.random.default_rng(0)
+    feeds = {}
+    for model_input in session.get_inputs():
+        spatial = iter(sizes)
+        shape = [d if isinstance(d, int) else (1 if i == 0 else next(spatial)) for i, d in enumerate(model_input.shape)]
+        dtype = DTYPES[model_input.type]
+        if dtype == np.uint8:
+            feeds[model_input.name] = rng.integers(0, 256, shape, dtype=np.uint8)
+        else:
+            feeds[model_input.name] = rng.random(shape).astype(dtype)
+    return feeds
+
+# -------------------------------------------------
+# Measuring
+# -------------------------------------------------
+def new_session(path: str, settings: dict):
+    session_options = onnxruntime.SessionOptions()
+    session_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    session_options.log_severity_level = 3
+    ort_profile.apply(session_options, settings)
+    return onnxruntime.InferenceSession(path, sess_options=session_options, providers=["CPUExecutionProvider"])
+
+
+def time_session(session, feeds: dict, warmup: int, runs: int) -> float:
+    """Median milliseconds per run."""
+    for _ in range(warmup):
+        session.run(None, feeds)
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        session.run(None, feeds)
+        times.append(time.perf_counter() - started)
+    return float(np.median(times)) * 1000
+
+
+def output_error(a: list, b: list) -> float:
+    """Mean absolute difference of two runs' outputs, relative to the range of `a`."""
+    errors = []
+    for x, y in zip(a, b):
+        x, y = x.astype(np.float64), y.astype(np.float64)
+        errors.append(np.abs(x - y).mean() / max(np.ptp(x), 1e-6))
+    return max(errors)
+
+
+def thread_counts(cpus: int) -> list:
+    return sorted({n for n in (1, 2, 4, 8, cpus // 2, cpus) if 1 <= n <= cpus})
+
+
+class Tuner:
+    def __init__(self, path: str, sizes, warmup: int, runs: int, tolerance: float):
+        self.path = path
+        self.sizes = sizes
+        self.warmup = warmup
+        self.runs = runs
+        self.tolerance = tolerance
+        self.tried = 0
+
+    def measure(self, variant: str, settings: dict) -> float:
+        session = new_session(variant, settings)
+        self.tried += 1
+        return time_session(session, production_feeds(session, self.sizes), self.warmup, self.runs)
+
+    def accurate(self, variant: str) -> bool:
+        """INT8 variants must stay close to the float graph with the same inputs."""
+        if INT8_SUFFIX not in variant:
+            return True
+        reference = new_session(variant.replace(INT8_SUFFIX, ""), {})
+        quantized = new_session(variant, {})
+        feeds = production_feeds(reference, self.sizes)
+        error = output_error(reference.run(None, feeds), quantized.run(None, feeds))
+        if error > self.tolerance:
+            print(f"  {variant}: error {error:.4f} over tolerance, skipped")
+            return False
+        return True
+
+    def best(self, variant: str, candidates: list, settings: dict):
+        """Fastest of `candidates` (dicts of settings added to `settings`)."""
+        results = []
+        for extra in candidates:
+            trial = dict(settings, **extra)
+            ms = self.measure(variant, trial)
+            print(f"  {extra}: {ms:.2f} ms")
+            results.append((ms, trial))
+        return min(results, key=lambda r: r[0])
+
+    def tune(self) -> dict:
+        cpus = os.cpu_count() or 1
+        # the baseline is what the engine loads without a profile
+        default = prepared_path(self.path)
+        default_ms = self.measure(default, {})
+        print(f"{default}: {default_ms:.2f} ms with defaults")
+
+        ms, variant = default_ms, default
+        for candidate in variants(self.path):
+            if candidate == default:
+                continue
+            if not self.accurate(candidate):
+                continue
+            candidate_ms = self.measure(candidate, {})
+            print(f"  {candidate}: {candidate_ms:.2f} ms")
+            if candidate_ms < ms:
+                ms, variant = candidate_ms, candidate
+
+        ms, settings = self.best(variant, [{"intra_op_num_threads": n} for n in thread_counts(cpus)], {})
+
+        modes = [{"execution_mode": "sequential"}]
+        modes += [{"execution_mode": "parallel", "inter_op_num_threads": n} for n in thread_counts(cpus) if n > 1][:3]
+        ms, settings = self.best(variant, modes, settings)
+
+        memory = [{"enable_mem_pattern": pattern, "enable_cpu_mem_arena": arena}
+                  for pattern in (True, False) for arena in (True, False)]
+        ms, settings = self.best(variant, memory, settings)
+
+        if ms >= default_ms:
+            # nothing beat the defaults beyond noise: leave the model alone
+            ms, variant, settings = default_ms, default, {}
+        print(f"  best: {variant} {settings}: {ms:.2f} ms ({default_ms / ms:.2f}x)")
+        entry = {
+            "options": settings,
+            "ms": round(ms, 3),
+            "default_ms": round(default_ms, 3),
+            "tried": self.tried
+        }
+        if variant != default:
+            entry["variant"] = variant
+        return entry
+
+# -------------------------------------------------
+# Profile
+# -------------------------------------------------
+def save_profile(path: str, models: dict):
+    profile = {"models": {}}
+    if os.path.exists(path):
+        with open(path) as f:
+            profile = json.load(f)
+    if profile.get("cpus") != os.cpu_count() or profile.get("onnxruntime") != onnxruntime.__version__:
+        profile["models"] = {}
+    profile.update({
+        "host": platform.node(),
+        "cpus": os.cpu_count(),
+        "onnxruntime": onnxruntime.__version__,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S")
+    })
+    profile["models"].update(models)
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(profile, f, indent=2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find the fastest ONNX Runtime settings per model on this host")
+    parser.add_argument("--root", default=os.path.dirname(os.path.abspath(__file__)), help="Directory the engine runs in (model paths are relative to it)")
+    parser.add_argument("--model", action="append", help="Tune this model only (relative to --root); repeatable")
+    parser.add_argument("--frame_size", type=str, default="1280x720", help="WIDTHxHEIGHT of the frames the frame enhancer gets")
+    parser.add_argument("--warmup", type=int, default=3, help="Untimed runs per configuration")
+    parser.add_argument("--runs", type=int, default=10, help="Timed runs per configuration (the median counts)")
+    parser.add_argument("--quantize", action="store_true", help="Write dynamic INT8 variants first and try them too")
+    parser.add_argument("--tolerance", type=float, default=0.02, help="Largest relative output error allowed for INT8 variants")
+    parser.add_argument("--output", type=str, default=None, help="Profile to write (default: this host's, see utils/ort_profile.py)")
+    args = parser.parse_args(argv)
+
+    output = os.path.abspath(args.output or ort_profile.profile_path())
+    os.chdir(args.root)
+
+    paths = [ort_profile.model_key(p) for p in args.model] if args.model else known_models()
+    if not paths:
+        raise SystemExit("No models found under " + args.root)
+
+    tuned = {}
+    for path in paths:
+        if args.quantize:
+            quantize(path)
+        sizes = production_sizes(path, args.frame_size)
+        tuned[path] = Tuner(path, sizes, args.warmup, args.runs, args.tolerance).tune()
+
+    save_profile(output, tuned)
+    print("")
+    for path, entry in tuned.items():
+        print(f"{path:<50}{entry['default_ms']:>10.2f} ms -> {entry['ms']:.2f} ms")
+    print(f"\nProfile written to {output}")
+
+
+if __name__ == "__main__":
+    main()
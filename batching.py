@@ -0,0 +1,164 @@
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+import metrics
+
+# -------------------------------------------------
+# Cross-job micro-batching for one ONNX session
+#
+# Jobs rendering in the same process (real-time sessions) each need one
+# Wav2Lip frame at a time. Instead of every job calling session.run with a
+# batch of one, they submit their (face, mel) feeds here; a server thread
+# concatenates whatever is pending into one batch and hands every job
+# back its own rows, in order.
+#
+# A batch runs as soon as it is full (max_batch), once every registered
+# client has a request pending (no point waiting for more), or max_wait_ms
+# after its oldest request arrived. The time requests spend waiting is
+# the latency batching adds; stats() and the avatar_batch_* metrics
+# report it next to the batch sizes so the window can be tuned.
+# -------------------------------------------------
+STATS_WINDOW = 2000
+
+
+class _Request:
+    __slots__ = ("feeds", "rows", "submitted", "done", "result", "error")
+
+    def __init__(self, feeds: dict):
+        self.feeds = feeds
+        self.rows = len(next(iter(feeds.values())))
+        self.submitted = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher:
+    """
+    Serves session.run() calls from many threads in shared batches. A
+    model exported with a fixed batch of 1 cannot batch; its requests
+    then run directly in the calling thread.
+    """
+
+    def __init__(self, session, max_batch: int = 8, max_wait_ms: float = 4., name: str = "wav2lip"):
+        self.session = session
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.name = name
+        self.batched = max_batch > 1 and all(not isinstance(i.shape[0], int) or i.shape[0] != 1 for i in session.get_inputs())
+
+        self._cond = threading.Condition()
+        self._pending = []
+        self._clients = 0
+
+        self.requests = 0
+        self.batches = 0
+        self.waits = deque(maxlen=STATS_WINDOW)
+        self.sizes = deque(maxlen=STATS_WINDOW)
+        self.busy_seconds = 0.
+        self.started = time.perf_counter()
+
+        if self.batched:
+            threading.Thread(target=self._serve, name=f"{name}-batcher", daemon=True).start()
+
+    @contextmanager
+    def client(self):
+        """Register a job that will keep submitting, so full rounds run without waiting."""
+        with self._cond:
+            self._clients += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._clients -= 1
+                self._cond.notify()
+
+    def run(self, feeds: dict) -> list:
+        """session.run(None, feeds) for one job, batched with the others."""
+        if not self.batched:
+            return self.session.run(None, feeds)
+
+        request = _Request(feeds)
+        with self._cond:
+            self._pending.append(request)
+            self._cond.notify()
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    # -------------------------------------------------
+    # Server thread
+    # -------------------------------------------------
+    def _next_batch(self) -> list:
+        with self._cond:
+            while True:
+                while not self._pending:
+                    self._cond.wait()
+                deadline = self._pending[0].submitted + self.max_wait
+                target = min(self.max_batch, self._clients or self.max_batch)
+                rows = sum(r.rows for r in self._pending)
+                remaining = deadline - time.perf_counter()
+                if rows >= target or remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            batch, rows = [], 0
+            while self._pending and (not batch or rows + self._pending[0].rows <= self.max_batch):
+                request = self._pending.pop(0)
+                batch.append(request)
+                rows += request.rows
+            return batch
+
+    def _serve(self):
+        while True:
+            batch = self._next_batch()
+            started = time.perf_counter()
+            try:
+                feeds = {name: np.concatenate([r.feeds[name] for r in batch]) for name in batch[0].feeds}
+                outputs = self.session.run(None, feeds)
+                row = 0
+                for request in batch:
+                    request.result = [output[row:row + request.rows] for output in outputs]
+                    row += request.rows
+            except Exception as e:
+                for request in batch:
+                    request.error = e
+            finished = time.perf_counter()
+
+            self._record(batch, started, finished)
+            for request in batch:
+                request.done.set()
+
+    def _record(self, batch: list, started: float, finished: float):
+        rows = sum(r.rows for r in batch)
+        self.requests += len(batch)
+        self.batches += 1
+        self.busy_seconds += finished - started
+        self.sizes.append(rows)
+        metrics.BATCH_SIZE.labels(self.name).observe(rows)
+        for request in batch:
+            wait = started - request.submitted
+            self.waits.append(wait)
+            metrics.BATCH_WAIT.labels(self.name).observe(wait)
+
+    def stats(self) -> dict:
+        waits = sorted(self.waits)
+
+        def percentile(q):
+            return round(waits[min(len(waits) - 1, int(q * len(waits)))] * 1000, 2) if waits else 0.
+
+        return {
+            "batched": self.batched,
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+            "requests": self.requests,
+            "batches": self.batches,
+            "mean_batch": round(sum(self.sizes) / len(self.sizes), 2) if self.sizes else 0.,
+            "wait_ms": {"p50": percentile(0.5), "p95": percentile(0.95), "max": percentile(1.)},
+            "busy": round(self.busy_seconds / max(time.perf_counter() - self.started, 1e-9), 3)
+        }
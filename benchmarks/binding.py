@@ -0,0 +1,110 @@
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+
+sys.path.insert(0, REPO_DIR)
+
+import standin_models
+from run import CACHE_DIR, model_root
+from model_prep import prepared_path
+from autotune import production_feeds, production_sizes
+
+# -------------------------------------------------
+# Allocation benchmark: session.run vs preallocated I/O binding
+#
+#   python benchmarks/binding.py
+#   python benchmarks/binding.py --models standin --calls 200
+#
+# Runs every model at its production input shape, first with plain
+# session.run, then through utils/ort_binding.run. While the previous
+# call's results are still held (as they are while a frame is being
+# composited), every output in a buffer not seen in that call counts as a
+# new allocation.
+# -------------------------------------------------
+parser = argparse.ArgumentParser(description='Measure per-call allocations of the model sessions with and without I/O binding')
+
+parser.add_argument('--models', default='auto', choices=['auto', 'standin', 'real'], help='auto uses the real checkpoints when they are present')
+parser.add_argument('--calls', type=int, default=100, help='Timed calls per model and mode')
+parser.add_argument('--frame_size', type=str, default='640x360', help='WIDTHxHEIGHT fed to models without a fixed input size (the frame enhancer)')
+parser.add_argument('--output', type=str, default=None, help='Also write the results to this JSON file')
+
+MODELS = {
+    "wav2lip": standin_models.WAV2LIP,
+    "detector": os.path.join("utils", "scrfd_2.5g_bnkps.onnx"),
+    "recognition": os.path.join("faceID", "recognition.onnx"),
+    "gpen": os.path.join("enhancers", "GPEN", "GPEN-BFR-256-sim.onnx"),
+    "frame_enhancer": os.path.join("enhancers", "RealEsrgan", "clear_reality_x4.onnx"),
+    "face_mask": os.path.join("blendmasker", "blendmasker.onnx"),
+    "face_occluder": os.path.join("xseg", "xseg.onnx")
+}
+
+def _address(array) -> int:
+    return array.__array_interface__["data"][0]
+
+
+def measure(call, calls: int) -> dict:
+    previous = call()
+    arrays = allocated = 0
+    seconds = 0.
+    for _ in range(calls):
+        started = time.perf_counter()
+        outputs = call()
+        seconds += time.perf_counter() - started
+
+        seen = {_address(o) for o in previous}
+        for output in outputs:
+            if _address(output) not in seen:
+                arrays += 1
+                allocated += output.nbytes
+        previous = outputs
+    return {
+        "ms_per_call": round(seconds / calls * 1000, 3),
+        "new_arrays_per_call": round(arrays / calls, 2),
+        "new_bytes_per_call": int(allocated / calls)
+    }
+
+
+def main():
+    import onnxruntime
+    from utils import ort_binding
+
+    opts = parser.parse_args()
+    kind, root = model_root(opts.models)
+
+    results = {"models": kind, "calls": opts.calls, "cases": {}}
+    for name, rel_path in MODELS.items():
+        path = prepared_path(os.path.join(root, rel_path))
+        if not os.path.exists(path):
+            continue
+        session = onnxruntime.InferenceSession(path, providers=["CPUExecutionProvider"])
+        feeds = production_feeds(session, production_sizes(rel_path, opts.frame_size))
+
+        results["cases"][name] = {
+            "input_shapes": {k: list(v.shape) for k, v in feeds.items()},
+            "run": measure(lambda: session.run(None, feeds), opts.calls),
+            "bound": measure(lambda: ort_binding.run(session, feeds), opts.calls)
+        }
+
+    print(f"{'model':<16}{'new KB/call run':>16}{'bound':>8}{'arrays run':>12}{'bound':>8}{'ms run':>9}{'bound':>8}")
+    for name, case in results["cases"].items():
+        plain, bound = case["run"], case["bound"]
+        print(f"{name:<16}{plain['new_bytes_per_call'] / 1024:>16.0f}{bound['new_bytes_per_call'] / 1024:>8.0f}"
+              f"{plain['new_arrays_per_call']:>12.2f}{bound['new_arrays_per_call']:>8.2f}"
+              f"{plain['ms_per_call']:>9.2f}{bound['ms_per_call']:>8.2f}")
+
+    if opts.output:
+        os.makedirs(os.path.dirname(os.path.abspath(opts.output)), exist_ok=True)
+        with open(opts.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {opts.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+
+sys.path.insert(0, REPO_DIR)
+
+import standin_models
+from run import model_root
+from model_prep import prepared_path
+from autotune import production_feeds
+
+# -------------------------------------------------
+# Micro-batching benchmark for concurrent Wav2Lip jobs
+#
+#   python benchmarks/microbatch.py
+#   python benchmarks/microbatch.py --clients 1 2 4 8 --waits 0 2 5 10
+#
+# Every client is a thread rendering --frames frames one after the other,
+# like a real-time session: it submits one (face, mel) request and waits
+# for its frame before the next. "direct" is every client calling
+# session.run with a batch of one; the other rows go through
+# batching.MicroBatcher with that max wait. Throughput is frames per
+# second over all clients; latency is per frame as a client sees it, and
+# wait is the part of it spent waiting for a batch to start.
+# -------------------------------------------------
+parser = argparse.ArgumentParser(description='Measure throughput and latency of concurrent Wav2Lip jobs with and without micro-batching')
+
+parser.add_argument('--models', default='auto', choices=['auto', 'standin', 'real'], help='auto uses the real checkpoints when they are present')
+parser.add_argument('--clients', type=int, nargs='+', default=[1, 2, 4, 8], help='Concurrent jobs')
+parser.add_argument('--waits', type=float, nargs='+', default=[0, 2, 5, 10], help='Max wait windows to try, in ms')
+parser.add_argument('--max_batch', type=int, default=8, help='Most frames per batch')
+parser.add_argument('--frames', type=int, default=100, help='Frames each client renders')
+parser.add_argument('--output', type=str, default=None, help='Also write the results to this JSON file')
+
+
+def drive(render, clients: int, frames: int, feeds: dict, client=None) -> dict:
+    """Run `clients` threads calling render(feeds) `frames` times each."""
+    latencies = [[] for _ in range(clients)]
+    start = threading.Barrier(clients + 1)
+
+    def job(i):
+        start.wait()
+        for _ in range(frames):
+            began = time.perf_counter()
+            render(feeds)
+            latencies[i].append(time.perf_counter() - began)
+
+    def registered(i):
+        with client():
+            job(i)
+
+    threads = [threading.Thread(target=registered if client else job, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    began = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - began
+
+    every = np.array([t for per_client in latencies for t in per_client]) * 1000
+    return {
+        "fps": round(clients * frames / elapsed, 1),
+        "latency_ms": {"p50": round(float(np.percentile(every, 50)), 2), "p95": round(float(np.percentile(every, 95)), 2)}
+    }
+
+
+def main():
+    import onnxruntime
+    import batching
+
+    opts = parser.parse_args()
+    kind, root = model_root(opts.models)
+    path = prepared_path(os.path.join(root, standin_models.WAV2LIP))
+    session = onnxruntime.InferenceSession(path, providers=["CPUExecutionProvider"])
+    feeds = production_feeds(session)
+
+    results = {"models": kind, "model": os.path.relpath(path, root), "frames": opts.frames,
+               "max_batch": opts.max_batch, "cases": []}
+    for _ in range(5):
+        session.run(None, feeds)
+
+    for clients in opts.clients:
+        case = drive(lambda f: session.run(None, f), clients, opts.frames, feeds)
+        results["cases"].append(dict(case, clients=clients, mode="direct"))
+
+        for wait in opts.waits:
+            batcher = batching.MicroBatcher(session, opts.max_batch, wait)
+            case = drive(batcher.run, clients, opts.frames, feeds, batcher.client)
+            stats = batcher.stats()
+            results["cases"].append(dict(case, clients=clients, mode=f"wait {wait:g} ms",
+                                         mean_batch=stats["mean_batch"], wait_ms=stats["wait_ms"]))
+
+    print(f"{'clients':<9}{'mode':<14}{'fps':>8}{'p50 ms':>9}{'p95 ms':>9}{'batch':>7}{'wait p50':>10}{'p95':>7}")
+    for case in results["cases"]:
+        batch = f"{case['mean_batch']:>7.2f}{case['wait_ms']['p50']:>10.2f}{case['wait_ms']['p95']:>7.2f}" if "mean_batch" in case else ""
+        print(f"{case['clients']:<9}{case['mode']:<14}{case['fps']:>8.1f}"
+              f"{case['latency_ms']['p50']:>9.2f}{case['latency_ms']['p95']:>9.2f}{batch}")
+
+    if opts.output:
+        os.makedirs(os.path.dirname(os.path.abspath(opts.output)), exist_ok=True)
+        with open(opts.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {opts.output}")
+
+
+if __name__ == '__main__':
+    main()
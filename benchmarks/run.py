@@ -0,0 +1,205 @@
+import os
+import sys
+import json
+import time
+import shlex
+import shutil
+import argparse
+import platform
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+CACHE_DIR = os.path.join(BENCH_DIR, "cache")
+
+sys.path.insert(0, REPO_DIR)
+
+import metrics
+import synthetic
+import standin_models
+
+# -------------------------------------------------
+# Offline benchmark: per-stage and end-to-end throughput
+#
+#   python benchmarks/run.py                       # stand-ins unless real checkpoints exist
+#   python benchmarks/run.py --models standin --resolutions 360 --seconds 2
+#   python benchmarks/run.py --update_baseline     # store this host's numbers
+#
+# Exits with status 1 when a case is slower than the baseline by more
+# than --threshold.
+# -------------------------------------------------
+parser = argparse.ArgumentParser(description='Benchmark the lip-sync engine on synthetic inputs')
+
+parser.add_argument('--models', default='auto', choices=['auto', 'standin', 'real'], help='auto uses the real checkpoints when they are present')
+parser.add_argument('--resolutions', type=int, nargs='+', default=[360, 720, 1080], help='Avatar video heights (16:9)')
+parser.add_argument('--seconds', type=float, nargs='+', default=[2, 8], help='Clip lengths')
+parser.add_argument('--image', type=str, default=os.path.join(REPO_DIR, 'inputs', 'bm1.png'), help='Portrait used to build the synthetic avatar video')
+parser.add_argument('--engine_args', type=str, default='', help='Extra inference_onnxModel.py options, e.g. "--face_mask --enhancer gpen"')
+parser.add_argument('--warmup', type=int, default=1, help='Untimed runs of the smallest case before measuring')
+parser.add_argument('--output', type=str, default=None, help='Results JSON (default: benchmarks/cache/results/<time>.json)')
+parser.add_argument('--baseline', type=str, default=os.path.join(BENCH_DIR, 'baseline.json'), help='Baseline results to compare against')
+parser.add_argument('--threshold', type=float, default=0.10, help='Allowed slowdown against the baseline, as a fraction')
+parser.add_argument('--update_baseline', action='store_true', help='Write the results as the new baseline')
+
+REAL_MODELS = [
+    standin_models.WAV2LIP,
+    os.path.join("utils", "scrfd_2.5g_bnkps.onnx"),
+    os.path.join("faceID", "recognition.onnx")
+]
+
+
+def model_root(kind: str):
+    real = all(os.path.exists(os.path.join(REPO_DIR, p)) for p in REAL_MODELS)
+    if kind == 'real' or (kind == 'auto' and real):
+        if not real:
+            raise SystemExit('Real checkpoints not found, run with --models standin')
+        return 'real', REPO_DIR
+    return 'standin', standin_models.build(os.path.join(CACHE_DIR, 'models'))
+
+
+def case_name(height: int, seconds: float) -> str:
+    return f"{height}p_{seconds:g}s"
+
+# -------------------------------------------------
+# Running
+# -------------------------------------------------
+def run_case(engine, root: str, opts, height: int, seconds: float) -> dict:
+    name = case_name(height, seconds)
+    video = synthetic.avatar_video(opts.image, os.path.join(CACHE_DIR, 'inputs', f'{height}p_{seconds:g}s.mp4'), height, seconds)
+    audio = synthetic.speech_wav(os.path.join(CACHE_DIR, 'inputs', f'{seconds:g}s.wav'), seconds)
+
+    workdir = tempfile.mkdtemp(prefix='bench_')
+    try:
+        argv = [
+            '--checkpoint_path', os.path.join(root, standin_models.WAV2LIP),
+            '--face', video,
+            '--audio', audio,
+            '--outfile', os.path.join(workdir, 'result.mp4'),
+            '--workdir', workdir
+        ] + shlex.split(opts.engine_args)
+
+        trace = metrics.start(name)
+        started = time.perf_counter()
+        engine.configure(argv)
+        engine.main()
+        wall = time.perf_counter() - started
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    frames = trace.frames
+    return {
+        "resolution": height,
+        "seconds": seconds,
+        "frames": frames,
+        "wall_seconds": round(wall, 4),
+        "fps": round(frames / wall, 3) if wall > 0 else 0.,
+        "render_fps": round(frames / trace.render_seconds, 3) if trace.render_seconds > 0 else 0.,
+        "stages": {
+            stage: {
+                "seconds": round(spent, 4),
+                "fps": round(frames / spent, 3) if spent > 0 else None
+            }
+            for stage, spent in sorted(trace.spans.items())
+        }
+    }
+
+
+def environment(engine, kind: str) -> dict:
+    import onnxruntime
+    return {
+        "host": platform.node(),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "onnxruntime": onnxruntime.__version__,
+        "device": engine.device,
+        "models": kind
+    }
+
+# -------------------------------------------------
+# Baseline comparison
+# -------------------------------------------------
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Return (case, metric, baseline fps, current fps) for every regression."""
+    if baseline["environment"]["models"] != results["environment"]["models"]:
+        print("Baseline was measured with other models, not comparing")
+        return []
+
+    regressions = []
+    for name, case in results["cases"].items():
+        base = baseline["cases"].get(name)
+        if base is None:
+            continue
+
+        pairs = [("end-to-end", base["fps"], case["fps"])]
+        for stage, numbers in case["stages"].items():
+            base_stage = base["stages"].get(stage)
+            if base_stage and base_stage["fps"] and numbers["fps"]:
+                pairs.append((stage, base_stage["fps"], numbers["fps"]))
+
+        for metric, before, now in pairs:
+            if now < before * (1 - threshold):
+                regressions.append((name, metric, before, now))
+    return regressions
+
+
+def print_summary(results: dict):
+    print("")
+    print(f"{'case':<12}{'frames':>8}{'fps':>10}{'render fps':>12}  slowest stages")
+    for name, case in results["cases"].items():
+        slowest = sorted(case["stages"].items(), key=lambda s: -s[1]["seconds"])[:3]
+        stages = ", ".join(f"{stage} {numbers['seconds']:.2f}s" for stage, numbers in slowest)
+        print(f"{name:<12}{case['frames']:>8}{case['fps']:>10.2f}{case['render_fps']:>12.2f}  {stages}")
+
+
+def main():
+    opts = parser.parse_args()
+
+    kind, root = model_root(opts.models)
+
+    # model paths inside the inference script are relative to the model root
+    os.chdir(root)
+    import inference_onnxModel as engine
+    engine.keep_models = True
+
+    cases = [(h, s) for h in sorted(opts.resolutions) for s in sorted(opts.seconds)]
+    for _ in range(opts.warmup):
+        run_case(engine, root, opts, *cases[0])
+
+    results = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": environment(engine, kind),
+        "engine_args": opts.engine_args,
+        "cases": {case_name(h, s): run_case(engine, root, opts, h, s) for h, s in cases}
+    }
+
+    output = opts.output or os.path.join(CACHE_DIR, 'results', time.strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    print_summary(results)
+    print(f"\nResults written to {output}")
+
+    if opts.update_baseline:
+        with open(opts.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline updated: {opts.baseline}")
+        return
+
+    if not os.path.exists(opts.baseline):
+        print("No baseline yet, store one with --update_baseline")
+        return
+
+    with open(opts.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, opts.threshold)
+    for name, metric, before, now in regressions:
+        print(f"REGRESSION {name} {metric}: {before:.2f} -> {now:.2f} fps")
+    if regressions:
+        sys.exit(1)
+    print(f"No regressions beyond {opts.threshold:.0%} against {opts.baseline}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+import os
+
+import numpy as np
+import onnx
+from onnx import TensorProto, helper, numpy_helper
+
+# -------------------------------------------------
+# Tiny stand-ins for every ONNX model the engine loads
+#
+# Same input/output names, shapes and value ranges as the real
+# checkpoints, so the whole pipeline runs without downloading them.
+# The detector and recognizer answer with one fixed face so alignment,
+# masks and compositing get exercised; the generators are a few
+# convolutions. Paths are relative to the model root, mirroring the
+# layout the engine expects next to the repo.
+# -------------------------------------------------
+OPSET = 13
+IR_VERSION = 8
+
+WAV2LIP = os.path.join("checkpoints", "wav2lip_gan.onnx")
+
+DET_SIZE = 320
+DET_STRIDES = (8, 16, 32)
+DET_ANCHORS = 2
+
+# one face centred horizontally in the upper half of a 16:9 letterboxed
+# detector input, on the stride-16 grid
+FACE_STRIDE = 16
+FACE_CENTER = (10, 5)  # (col, row)
+FACE_BOX = (2.5, 2.5, 2.5, 2.5)  # left, top, right, bottom in strides
+FACE_KPS = ((-1.0, -0.75), (1.0, -0.75), (0.0, 0.25), (-0.75, 1.4), (0.75, 1.4))
+
+EMBEDDING_SIZE = 512
+
+rng = np.random.default_rng(0)
+
+
+def weight(name, shape, scale=0.05):
+    return numpy_helper.from_array((rng.standard_normal(shape) * scale).astype(np.float32), name)
+
+
+def const(name, array):
+    return numpy_helper.from_array(np.asarray(array), name)
+
+
+def save(nodes, inputs, outputs, initializers, path):
+    graph = helper.make_graph(nodes, os.path.splitext(os.path.basename(path))[0], inputs, outputs, initializers)
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", OPSET)])
+    model.ir_version = IR_VERSION
+    onnx.checker.check_model(model)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    onnx.save(model, path)
+
+
+def zero_of(input_name, prefix):
+    """Nodes producing a (1,) zero that still depends on `input_name`."""
+    return [
+        helper.make_node("ReduceMean", [input_name], [prefix + "_mean"], axes=[1, 2, 3], keepdims=0),
+        helper.make_node("Mul", [prefix + "_mean", prefix + "_zero_w"], [prefix + "_zero"])
+    ], [const(prefix + "_zero_w", np.zeros(1, dtype=np.float32))]
+
+# -------------------------------------------------
+# Models
+# -------------------------------------------------
+def wav2lip(path):
+    nodes = [
+        helper.make_node("Conv", ["video_frames", "w1"], ["h1"], pads=[1, 1, 1, 1]),
+        helper.make_node("Relu", ["h1"], ["r1"]),
+        helper.make_node("Conv", ["r1", "w2"], ["h2"], pads=[1, 1, 1, 1]),
+        helper.make_node("ReduceMean", ["mel_spectrogram"], ["m"], axes=[1, 2, 3], keepdims=1),
+        helper.make_node("Add", ["h2", "m"], ["h3"]),
+        helper.make_node("Sigmoid", ["h3"], ["output"])
+    ]
+    save(
+        nodes,
+        [helper.make_tensor_value_info("mel_spectrogram", TensorProto.FLOAT, ["batch", 1, 80, 16]),
+         helper.make_tensor_value_info("video_frames", TensorProto.FLOAT, ["batch", 6, 96, 96])],
+        [helper.make_tensor_value_info("output", TensorProto.FLOAT, ["batch", 3, 96, 96])],
+        [weight("w1", (16, 6, 3, 3)), weight("w2", (3, 16, 3, 3))],
+        path
+    )
+
+
+def scrfd(path):
+    scores, boxes, kps = [], [], []
+    for stride in DET_STRIDES:
+        cells = (DET_SIZE // stride) ** 2 * DET_ANCHORS
+        s = np.zeros((cells, 1), dtype=np.float32)
+        b = np.ones((cells, 4), dtype=np.float32)
+        k = np.zeros((cells, 10), dtype=np.float32)
+        if stride == FACE_STRIDE:
+            col, row = FACE_CENTER
+            index = (row * (DET_SIZE // stride) + col) * DET_ANCHORS
+            s[index] = 0.9
+            b[index] = FACE_BOX
+            k[index] = np.ravel(FACE_KPS)
+        scores.append(s)
+        boxes.append(b)
+        kps.append(k)
+
+    nodes, initializers = zero_of("input.1", "det")
+    outputs = []
+    for kind, arrays, width in (("score", scores, 1), ("bbox", boxes, 4), ("kps", kps, 10)):
+        for stride, array in zip(DET_STRIDES, arrays):
+            name = f"{kind}_{stride}"
+            initializers.append(const(name + "_const", array))
+            nodes.append(helper.make_node("Add", [name + "_const", "det_zero"], [name]))
+            outputs.append(helper.make_tensor_value_info(name, TensorProto.FLOAT, [len(array), width]))
+
+    save(
+        nodes,
+        [helper.make_tensor_value_info("input.1", TensorProto.FLOAT, [1, 3, DET_SIZE, DET_SIZE])],
+        outputs,
+        initializers,
+        path
+    )
+
+
+def recognition(path):
+    embedding = (np.ones((1, EMBEDDING_SIZE)) / np.sqrt(EMBEDDING_SIZE)).astype(np.float32)
+    nodes, initializers = zero_of("data", "rec")
+    nodes.append(helper.make_node("Add", ["embedding", "rec_zero"], ["fc1"]))
+    initializers.append(const("embedding", embedding))
+    save(
+        nodes,
+        [helper.make_tensor_value_info("data", TensorProto.FLOAT, [1, 3, 112, 112])],
+        [helper.make_tensor_value_info("fc1", TensorProto.FLOAT, [1, EMBEDDING_SIZE])],
+        initializers,
+        path
+    )
+
+
+def restorer(path, size, input_name="input", with_w=False, fp16=False):
+    """GPEN/GFPGAN/CodeFormer/RestoreFormer: NCHW in [-1, 1] -> same shape."""
+    elem = TensorProto.FLOAT16 if fp16 else TensorProto.FLOAT
+    nodes = []
+    x = input_name
+    if fp16:
+        nodes.append(helper.make_node("Cast", [x], ["x32"], to=TensorProto.FLOAT))
+        x = "x32"
+    nodes += [
+        helper.make_node("Conv", [x, "w1"], ["h1"], pads=[1, 1, 1, 1]),
+        helper.make_node("Tanh", ["h1"], ["y32" if fp16 else "output"])
+    ]
+    inputs = [helper.make_tensor_value_info(input_name, elem, [1, 3, size, size])]
+    if with_w:
+        # CodeFormer's fidelity weight, unused by the stand-in
+        inputs.append(helper.make_tensor_value_info("w", TensorProto.DOUBLE, [1]))
+    if fp16:
+        nodes.append(helper.make_node("Cast", ["y32"], ["output"], to=TensorProto.FLOAT16))
+    save(
+        nodes,
+        inputs,
+        [helper.make_tensor_value_info("output", elem, [1, 3, size, size])],
+        [weight("w1", (3, 3, 3, 3))],
+        path
+    )
+
+
+def esrgan(path, scale=4):
+    nodes = [
+        helper.make_node("Conv", ["input", "w1"], ["h1"], pads=[1, 1, 1, 1]),
+        helper.make_node("DepthToSpace", ["h1"], ["h2"], blocksize=scale, mode="DCR"),
+        helper.make_node("Sigmoid", ["h2"], ["output"])
+    ]
+    save(
+        nodes,
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, [1, 3, "height", "width"])],
+        [helper.make_tensor_value_info("output", TensorProto.FLOAT, [1, 3, "out_height", "out_width"])],
+        [weight("w1", (3 * scale * scale, 3, 3, 3))],
+        path
+    )
+
+
+def blendmask(path):
+    nodes = [
+        helper.make_node("Conv", ["input", "w1"], ["h1"], pads=[1, 1, 1, 1]),
+        helper.make_node("Sigmoid", ["h1"], ["output"])
+    ]
+    save(
+        nodes,
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, [1, 3, 256, 256])],
+        [helper.make_tensor_value_info("output", TensorProto.FLOAT, [1, 1, 256, 256])],
+        [weight("w1", (1, 3, 3, 3))],
+        path
+    )
+
+
+def xseg(path):
+    # NHWC in and out, like the DeepFaceLab export
+    nodes = [
+        helper.make_node("Transpose", ["in_face"], ["nchw"], perm=[0, 3, 1, 2]),
+        helper.make_node("Conv", ["nchw", "w1"], ["h1"], pads=[1, 1, 1, 1]),
+        helper.make_node("Sigmoid", ["h1"], ["s1"]),
+        helper.make_node("Transpose", ["s1"], ["out_mask"], perm=[0, 2, 3, 1])
+    ]
+    save(
+        nodes,
+        [helper.make_tensor_value_info("in_face", TensorProto.FLOAT, [1, 256, 256, 3])],
+        [helper.make_tensor_value_info("out_mask", TensorProto.FLOAT, [1, 256, 256, 1])],
+        [weight("w1", (1, 3, 3, 3))],
+        path
+    )
+
+
+MODELS = {
+    WAV2LIP: wav2lip,
+    os.path.join("utils", "scrfd_2.5g_bnkps.onnx"): scrfd,
+    os.path.join("faceID", "recognition.onnx"): recognition,
+    os.path.join("enhancers", "GPEN", "GPEN-BFR-256-sim.onnx"): lambda p: restorer(p, 256),
+    os.path.join("enhancers", "GFPGAN", "GFPGANv1.4.onnx"): lambda p: restorer(p, 512),
+    os.path.join("enhancers", "Codeformer", "codeformerfixed.onnx"): lambda p: restorer(p, 512, "x", with_w=True),
+    os.path.join("enhancers", "restoreformer", "restoreformer16.onnx"): lambda p: restorer(p, 512, fp16=True),
+    os.path.join("enhancers", "RealEsrgan", "clear_reality_x4.onnx"): esrgan,
+    os.path.join("blendmasker", "blendmasker.onnx"): blendmask,
+    os.path.join("xseg", "xseg.onnx"): xseg
+}
+
+
+def build(root: str) -> str:
+    """Write any missing stand-in model under `root` and return it."""
+    for rel_path, make in MODELS.items():
+        path = os.path.join(root, rel_path)
+        if not os.path.exists(path):
+            make(path)
+    return root
@@ -0,0 +1,60 @@
+import os
+import math
+import wave
+
+import cv2
+import numpy as np
+
+# -------------------------------------------------
+# Synthetic benchmark inputs
+# -------------------------------------------------
+FPS = 25
+SAMPLE_RATE = 16000
+
+
+def avatar_video(image_path: str, path: str, height: int, seconds: float, fps: int = FPS) -> str:
+    """
+    A 16:9 talking-head stand-in: the portrait centred on a blurred copy
+    of itself, drifting a few pixels per frame so every frame differs.
+    """
+    if os.path.exists(path):
+        return path
+
+    width = int(round(height * 16 / 9 / 2)) * 2
+    image = cv2.imread(image_path)
+    scale = height / image.shape[0]
+    portrait = cv2.resize(image, (int(image.shape[1] * scale), height), interpolation=cv2.INTER_AREA)
+    background = cv2.GaussianBlur(cv2.resize(image, (width, height)), (0, 0), 15)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    for i in range(int(seconds * fps)):
+        dx = int(4 * math.sin(2 * math.pi * i / 50))
+        dy = int(3 * math.cos(2 * math.pi * i / 70))
+        frame = background.copy()
+        x = (width - portrait.shape[1]) // 2 + dx
+        x0, x1 = max(0, x), min(width, x + portrait.shape[1])
+        frame[:, x0:x1] = np.roll(portrait, dy, axis=0)[:, x0 - x:x1 - x]
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+def speech_wav(path: str, seconds: float, sample_rate: int = SAMPLE_RATE) -> str:
+    """Syllable-rate modulated tones with a little noise, so the mel has no NaNs."""
+    if os.path.exists(path):
+        return path
+
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 4 * t) ** 2
+    voice = np.sin(2 * np.pi * 180 * t) + 0.5 * np.sin(2 * np.pi * 360 * t) + 0.25 * np.sin(2 * np.pi * 900 * t)
+    samples = 0.3 * envelope * voice / 1.75 + 0.005 * rng.standard_normal(len(t))
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with wave.open(path, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        w.writeframes((np.clip(samples, -1, 1) * 32767).astype("<i2").tobytes())
+    return path
@@ -1,6 +1,9 @@
 ﻿import numpy as np
 import onnxruntime
 
+from utils.ort_binding import run_batch, into
+from utils.ort_profile import tuned
+
 class BLENDMASK:
     def __init__(self, model_path="blendswap_256.onnx", device='cpu'):
         session_options = onnxruntime.SessionOptions()
@@ -8,21 +11,18 @@ class BLENDMASK:
         providers = ["CPUExecutionProvider"]
         if device == 'cuda':
             providers = [("CUDAExecutionProvider", {"cudnn_conv_algo_search": "EXHAUSTIVE"}),"CPUExecutionProvider"]
+        model_path, session_options = tuned(model_path, session_options)
         self.session = onnxruntime.InferenceSession(model_path, sess_options=session_options, providers=providers)
+        self.input_name = self.session.get_inputs()[0].name
+        self.prepared = self.session.get_inputs()[0].type == 'tensor(uint8)'
 
-    def mask(self, target_face):
+    def mask_batch(self, faces, out=None):
+        """(N, 256, 256, 3) BGR faces -> (N, 256, 256) float32 masks in [0, 1]."""
+        if self.prepared:
+            return into(run_batch(self.session, {self.input_name: np.ascontiguousarray(faces, dtype=np.uint8)}), out)
+        batch = np.asarray(faces, dtype=np.float32)[..., ::-1].transpose((0, 3, 1, 2)) / 255.0
+        res = run_batch(self.session, {self.input_name: np.ascontiguousarray(batch)})
+        return into(res[:, 0], out)
 
-        target_face = target_face.astype(np.float32)
-        target_face = target_face[..., ::-1]
-        target_face = target_face.transpose((2, 0, 1))
-        target_face = target_face /255.0
-        target_face = np.expand_dims(target_face, axis=0).astype(np.float32)
-        
-        res = self.session.run(None, {(self.session.get_inputs()[0].name):target_face})[0]
-        
-        res = res.squeeze()
-        res = res * 255.0
-        res = res.astype(np.uint8)
-        res = np.stack([res] * 3, axis=-1)
-         
-        return res
\ No newline at end of file
+    def mask(self, target_face):
+        return self.mask_batch(target_face[np.newaxis])[0]
@@ -3,6 +3,9 @@ import cv2
 import onnxruntime
 import numpy as np
 
+from utils.ort_binding import run, into
+from utils.ort_profile import tuned
+
 class GFPGAN:
     def __init__(self, model_path="GFPGANv1.4.onnx", device='cpu'):
         session_options = onnxruntime.SessionOptions()
@@ -10,8 +13,11 @@ class GFPGAN:
         providers = ["CPUExecutionProvider"]
         if device == 'cuda':
             providers = [("CUDAExecutionProvider", {"cudnn_conv_algo_search": "DEFAULT"}),"CPUExecutionProvider"]
+        model_path, session_options = tuned(model_path, session_options)
         self.session = onnxruntime.InferenceSession(model_path, sess_options=session_options, providers=providers)
-        self.resolution = self.session.get_inputs()[0].shape[-2:]
+        self.prepared = self.session.get_inputs()[0].type == 'tensor(uint8)'
+        shape = self.session.get_inputs()[0].shape
+        self.resolution = shape[1:3] if self.prepared else shape[-2:]
 
     def preprocess(self, img):
         img = cv2.resize(img, self.resolution, interpolation=cv2.INTER_LINEAR)
@@ -27,8 +33,11 @@ class GFPGAN:
         img = img.clip(0, 255).astype('uint8')
         return img
 
-    def enhance(self, img):
+    def enhance(self, img, out=None):
+        if self.prepared:
+            img = cv2.resize(img, self.resolution, interpolation=cv2.INTER_LINEAR)
+            return into(run(self.session, {'input':img[np.newaxis]})[0][0], out)
         img = self.preprocess(img)
-        output = self.session.run(None, {'input':img})[0][0]
+        output = run(self.session, {'input':img})[0][0]
         output = self.postprocess(output)
-        return output
+        return into(output, out, owned=True)
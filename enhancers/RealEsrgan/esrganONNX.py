@@ -3,6 +3,9 @@
 import onnxruntime
 import numpy as np
 
+from utils.ort_binding import run, into
+from utils.ort_profile import tuned
+
 
 class RealESRGAN_ONNX:
     def __init__(self, model_path="RealESRGAN_x2.onnx", device='cuda'):
@@ -11,9 +14,13 @@ class RealESRGAN_ONNX:
         providers = ["CPUExecutionProvider"]
         if device == 'cuda':
             providers = [("CUDAExecutionProvider", {"cudnn_conv_algo_search": "DEFAULT"}),"CPUExecutionProvider"]
+        model_path, session_options = tuned(model_path, session_options)
         self.session = onnxruntime.InferenceSession(model_path, sess_options=session_options, providers=providers)
+        self.prepared = self.session.get_inputs()[0].type == 'tensor(uint8)'
         
-    def enhance(self, img):
+    def enhance(self, img, out=None):
+        if self.prepared:
+            return into(run(self.session, {(self.session.get_inputs()[0].name):img[np.newaxis]})[0][0], out)
         h, w = img.shape[:2] 
         #img = cv2.resize(img,(w//2, h//2), interpolation=cv2.INTER_AREA)
         img = img.astype(np.float32)
@@ -21,9 +28,9 @@ class RealESRGAN_ONNX:
         img = img /255
         img = np.expand_dims(img, axis=0).astype(np.float32)
         #
-        result = self.session.run(None, {(self.session.get_inputs()[0].name):img})[0][0]
+        result = run(self.session, {(self.session.get_inputs()[0].name):img})[0][0]
         #
         result = (result.squeeze().transpose((1,2,0)) * 255).clip(0, 255).astype(np.uint8)
-        return result
+        return into(result, out, owned=True)
     
         
@@ -4,6 +4,9 @@ import cv2
 import numpy
 from onnxruntime import InferenceSession
 
+from utils.ort_binding import run, into
+from utils.ort_profile import tuned
+
 
 def distance2box(points, distance, max_shape=None):
     x1 = points[:, 0] - distance[:, 0]
@@ -224,13 +227,18 @@ class FaceRecognition:
         if self.session is None:
             assert onnx_path is not None
             assert os.path.exists(onnx_path)
-            self.session = InferenceSession(onnx_path,
+            onnx_path, session_options = tuned(onnx_path)
+            self.session = InferenceSession(onnx_path, sess_options=session_options,
                                             providers=['CUDAExecutionProvider'])
+        self.prepared = self.session.get_inputs()[0].type == 'tensor(uint8)'
 
-    def __call__(self, x):
-        x = x.astype('float32')
-        x = (x / 255 - 0.5) / 0.5
-        x = x.transpose((2, 0, 1))
-        x = numpy.expand_dims(x, 0)
-        return self.session.run(None, {'data': x})
+    def __call__(self, x, out=None):
+        if self.prepared:
+            x = numpy.ascontiguousarray(x[numpy.newaxis], dtype=numpy.uint8)
+        else:
+            x = x.astype('float32')
+            x = (x / 255 - 0.5) / 0.5
+            x = x.transpose((2, 0, 1))
+            x = numpy.expand_dims(x, 0)
+        return [into(run(self.session, {'data': x})[0], out)]
         #return self.session.run(None, {'input.1': x})
@@ -0,0 +1,302 @@
+import math
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context, shared_memory
+
+import cv2
+import numpy as np
+from tqdm import tqdm
+
+import metrics
+from utils.face_alignment import head_matrices_256, warp_crop
+from utils.face_track import ARRAYS, NO_FACE
+
+# -------------------------------------------------
+# Face analysis of a video, in this process or sharded across a pool
+#
+# analyse() detects, matches against the target identity and aligns the
+# face of every frame in one range. The engine runs it over the runs of
+# frames a render shows (see frame_runs()) in its own process, or
+# hands them to a FacePool, which splits them into about one contiguous
+# frame range per worker process. Each worker
+# holds its own detector and recognizer with a few intra-op threads, reads
+# the frames from one shared memory block and writes its rows of the
+# FaceTrack into another, so neither is pickled. The engine decodes the
+# frames straight into that block (SharedFrames) and renders from it, so
+# the frames are held once.
+#
+# Frames without the face are filled in afterwards, in order, by
+# fill_missing(), so a range starting on one still gets the last face of
+# the range before it. A range starts a new keyframe (see the still
+# threshold) even when the face did not move across the boundary.
+# -------------------------------------------------
+CROP_SIZE = 256
+RECOGNITION_SIZE = 112
+MATCH_THRESHOLD = 0.4
+
+# frames per worker below which the round trip is not worth it
+MIN_SHARD_FRAMES = 32
+
+# placeholder matrix of a frame without a usable face
+EMPTY_MATRIX = np.float32([[1, 2, 3], [1, 2, 3]])
+
+
+def match_face(img, matrices, size, target_id, recognition):
+    """(aligned crop, matrix, index) of the face among `matrices` closest to `target_id`."""
+    best_score = -float("inf")
+    best_aimg = None
+    best_mat = None
+    best_index = None
+
+    for index, mat in enumerate(matrices):
+        with metrics.span("alignment"):
+            aimg = warp_crop(img, mat, size)
+
+        face = cv2.resize(aimg, (RECOGNITION_SIZE, RECOGNITION_SIZE))
+        with metrics.span("recognition"):
+            face_id = recognition(face)[0].flatten()
+
+        score = target_id @ face_id
+        if score > best_score:
+            best_score = score
+            best_aimg = aimg
+            best_mat = mat
+            best_index = index
+        if best_score < MATCH_THRESHOLD:
+            best_aimg = cv2.cvtColor(np.zeros((size, size), dtype=np.uint8), cv2.COLOR_GRAY2RGB) / 255
+            best_mat = EMPTY_MATRIX
+            best_index = None
+
+    return best_aimg, best_mat, best_index
+
+
+def analyse(images, track, start: int, end: int, target_id, detector, recognition, settings: dict, progress: bool = True):
+    """
+    Fill rows start..end of `track` from `images` (indexed like the track).
+    `settings` holds the engine's still_threshold, face_mode, pad_y and
+    img_size. Returns (frames without the face, alignments reused).
+    """
+    kpss = []
+    for i in tqdm(range(start, end), disable=not progress):
+        with metrics.span("detection"):
+            _, frame_kpss = detector.detect(images[i], input_size=(320, 320), det_thresh=0.3)
+        kpss.append(np.asarray(frame_kpss, dtype=np.float64).reshape(-1, 5, 2))
+
+    # the alignment of every face found in one solve
+    with metrics.span("alignment"):
+        matrices, _ = head_matrices_256(np.concatenate(kpss), scale=1.0, size=CROP_SIZE)
+    ends = np.cumsum([len(k) for k in kpss])
+
+    top, bottom = 65 - settings["pad_y"], 241 - settings["pad_y"]
+    left, right = (62, 194) if settings["face_mode"] == 0 else (42, 214)
+    img_size = settings["img_size"]
+
+    # while the face stays within still_threshold pixels of the keyframe's
+    # landmarks, reuse the keyframe's geometry instead of re-matching it
+    key, key_kps = None, None
+    reused = 0
+    missing = []
+
+    for j in tqdm(range(end - start), disable=not progress):
+        i = start + j
+        try:
+            assert len(kpss[j]) != 0, "No face detected"
+
+            still = False
+            if key is not None:
+                motion = np.abs(kpss[j] - key_kps).max(axis=(1, 2))
+                still = motion.min() < settings["still_threshold"]
+
+            if still:
+                M = track.matrix[key]
+                with metrics.span("alignment"):
+                    crop_face = warp_crop(images[i], M, CROP_SIZE)
+                track.key[i] = key
+                reused += 1
+            else:
+                crop_face, M, best = match_face(images[i], matrices[ends[j] - len(kpss[j]):ends[j]], CROP_SIZE, target_id, recognition)
+                if best is not None:
+                    key, key_kps = i, kpss[j][best]
+
+            sub_face = cv2.resize(crop_face[top:bottom, left:right], (img_size, img_size))
+            track.set(i, crop_face, sub_face, M)
+        except Exception:
+            track.status[i] = NO_FACE
+            missing.append(i)
+
+    return missing, reused
+
+
+def fill_missing(track, missing, runs=None):
+    """
+    Frames without the face: a placeholder on the first frame of each of
+    the analysed `runs` (the whole track if None), else the previous
+    frame's data.
+    """
+    firsts = {start for start, _ in runs} if runs else {0}
+    for i in sorted(missing):
+        if i in firsts:
+            track.matrix[i] = EMPTY_MATRIX
+            track.status[i] = NO_FACE
+        else:
+            track.copy_row(i - 1, i, NO_FACE)
+
+# -------------------------------------------------
+# Shared memory
+# -------------------------------------------------
+class _Shared:
+    """A NumPy array in a named shared memory block, created here or attached to by name."""
+
+    def __init__(self, shape, dtype, name: str = None):
+        size = max(1, math.prod(shape) * np.dtype(dtype).itemsize)
+        if name is None:
+            self.block = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            # spawned workers share the creating process's resource
+            # tracker, which forgets the block when the creator unlinks it
+            self.block = shared_memory.SharedMemory(name=name)
+        # frombuffer holds an export of the block, so close() refuses to
+        # unmap it under a live view instead of leaving that view dangling
+        self.array = np.frombuffer(self.block.buf, dtype, count=math.prod(shape)).reshape(shape)
+
+    def spec(self) -> tuple:
+        return self.array.shape, self.array.dtype.str, self.block.name
+
+    def close(self, unlink: bool = False) -> bool:
+        """Unmap the block (and unlink it); False while views of the array are still around."""
+        self.array = None
+        if unlink:
+            self.block.unlink()
+        try:
+            self.block.close()
+        except BufferError:
+            return False
+        return True
+
+
+class SharedFrames:
+    """
+    Video frames decoded straight into shared memory: put() stores frame i
+    and returns the view to keep as the frame, which a FacePool's workers
+    read where it is.
+    """
+
+    def __init__(self, count: int, shape, dtype=np.uint8):
+        self.shared = _Shared((count,) + tuple(shape), dtype)
+        self.linked = True
+
+    def put(self, i: int, frame):
+        self.shared.array[i] = frame
+        return self.shared.array[i]
+
+    def spec(self) -> tuple:
+        return self.shared.spec()
+
+    def close(self) -> bool:
+        """Free the block; False (and unlinked only) while views of its frames are still around."""
+        unlink, self.linked = self.linked, False
+        return self.shared.close(unlink)
+
+
+class _TrackView:
+    """FaceTrack rows backed by shared arrays, enough for analyse()."""
+
+    def __init__(self, arrays: dict):
+        for name, array in arrays.items():
+            setattr(self, name, array)
+
+    def set(self, i, aligned, sub, matrix, status=0):
+        self.aligned[i] = aligned
+        self.sub[i] = sub
+        self.matrix[i] = matrix
+        self.status[i] = status
+
+# -------------------------------------------------
+# Worker processes
+# -------------------------------------------------
+_detector = _recognition = None
+
+
+def _init(detector_path: str, recognition_path: str, threads: int):
+    global _detector, _recognition
+    from faceID.faceID import FaceRecognition
+    from utils import ort_profile
+    from utils.retinaface import RetinaFace
+
+    ort_profile.limit_threads(threads)
+    _detector = RetinaFace(detector_path, provider=["CPUExecutionProvider"])
+    _recognition = FaceRecognition(recognition_path)
+
+
+def _analyse_shard(frames: tuple, arrays: dict, start: int, end: int, target_id, settings: dict):
+    shared = [_Shared(*frames)] + [_Shared(*spec) for spec in arrays.values()]
+    track = None
+    try:
+        track = _TrackView({name: s.array for name, s in zip(arrays, shared[1:])})
+        trace = metrics.start(f"faces {start}-{end}")
+        missing, reused = analyse(shared[0].array, track, start, end, target_id, _detector, _recognition, settings, progress=False)
+        return missing, reused, trace.to_dict()
+    finally:
+        # the track's arrays are views of the blocks: drop them first
+        track = None
+        for s in shared:
+            s.close()
+
+
+class FacePool:
+    """Worker processes for analyse(), started once and reused by every job."""
+
+    def __init__(self, processes: int, threads: int, detector_path: str, recognition_path: str):
+        self.processes = processes
+        self.threads = threads
+        self.executor = ProcessPoolExecutor(processes, mp_context=get_context("spawn"), initializer=_init,
+                                            initargs=(detector_path, recognition_path, threads))
+
+    def shards(self, runs: list) -> list:
+        """Frame ranges of about one worker's share each, none spanning two of `runs`."""
+        count = sum(end - start for start, end in runs)
+        size = math.ceil(count / max(1, min(self.processes, count // MIN_SHARD_FRAMES)))
+        return [(first, min(end, first + size)) for start, end in runs for first in range(start, end, size)]
+
+    def analyse(self, images, track, target_id, settings: dict, runs: list = None, frames: SharedFrames = None):
+        """
+        analyse() of the frames of `images` in `runs` (all if None) into
+        `track`, one frame range per worker. Images that are `frames`
+        already are not copied.
+        """
+        runs = runs or [(0, len(images))]
+        copy = None
+        if frames is None:
+            frames = copy = SharedFrames(len(images), images[runs[0][0]].shape, images[runs[0][0]].dtype)
+        shared = {name: _Shared(getattr(track, name).shape, getattr(track, name).dtype) for name in ARRAYS if name != "inverse"}
+        try:
+            if copy is not None:
+                for start, end in runs:
+                    for i in range(start, end):
+                        copy.put(i, images[i])
+            for name, s in shared.items():
+                s.array[...] = getattr(track, name)
+
+            specs = {name: s.spec() for name, s in shared.items()}
+            futures = [self.executor.submit(_analyse_shard, frames.spec(), specs, start, end, target_id, settings)
+                       for start, end in self.shards(runs)]
+
+            missing, reused = [], 0
+            for future in tqdm(futures):
+                shard_missing, shard_reused, spans = future.result()
+                missing += shard_missing
+                reused += shard_reused
+                trace = metrics.current()
+                if trace is not None:
+                    trace.merge(spans)
+
+            for name, s in shared.items():
+                getattr(track, name)[...] = s.array
+            return missing, reused
+        finally:
+            if copy is not None:
+                copy.close()
+            for s in shared.values():
+                s.close(unlink=True)
+
+    def close(self):
+        self.executor.shutdown()
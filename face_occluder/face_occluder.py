@@ -1,8 +1,11 @@
 
-import cv2
 import numpy
 import onnxruntime
 
+from utils.face_alignment import resize_faces
+from utils.ort_binding import run_batch, into
+from utils.ort_profile import tuned
+
 class FACE_OCCLUDER:
    
     def __init__(self, model_path="face_occluder.onnx", device='cpu'):
@@ -11,17 +14,20 @@ class FACE_OCCLUDER:
         providers = ["CPUExecutionProvider"]
         if device == 'cuda':
             providers = [("CUDAExecutionProvider", {"cudnn_conv_algo_search": "DEFAULT"}),"CPUExecutionProvider"]
+        model_path, session_options = tuned(model_path, session_options)
         self.session = onnxruntime.InferenceSession(model_path, sess_options=session_options, providers=providers)
+        self.input_name = self.session.get_inputs()[0].name
         self.resolution = self.session.get_inputs()[0].shape[-2:]
 
     
-    def create_occlusion_mask(self,crop_frame):
+    def mask_batch(self, faces, out=None):
+        """(N, H, W, 3) faces -> (N, 256, 256) float32 masks in [0, 1]."""
+        batch = resize_faces(faces).astype(numpy.float32) / 255
+        occlusion_mask = run_batch(self.session, {self.input_name: batch})
+        return into(occlusion_mask[..., 0].clip(0, 1), out, owned=True)
+
+    def mask(self, crop_frame):
+        return self.mask_batch(crop_frame[numpy.newaxis])[0]
 
-        prepare_frame = cv2.resize(crop_frame,(256,256))
-        prepare_frame = numpy.expand_dims(prepare_frame, axis = 0).astype(numpy.float32) / 255
-        prepare_frame = prepare_frame.transpose(0, 1, 2, 3)
-        
-        occlusion_mask = self.session.run(None,{self.session.get_inputs()[0].name: prepare_frame})[0][0]
-        
-        occlusion_mask = occlusion_mask.transpose(0, 1, 2).clip(0, 1).astype(numpy.float32)
-        return occlusion_mask
\ No newline at end of file
+    def create_occlusion_mask(self, crop_frame):
+        return self.mask(crop_frame)[..., numpy.newaxis]
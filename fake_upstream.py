@@ -0,0 +1,133 @@
+import io
+import os
+import json
+import math
+import time
+import uuid
+import wave
+import base64
+import random
+import asyncio
+import struct
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# -------------------------------------------------
+# Local stand-in for the Groq and Sarvam APIs
+#
+#   uvicorn fake_upstream:app --port 9000
+#   GROQ_BASE_URL=http://127.0.0.1:9000 SARVAM_BASE_URL=http://127.0.0.1:9000 uvicorn app:app
+#
+# Knobs (env):
+#   FAKE_UPSTREAM_LATENCY       seconds before every response starts
+#   FAKE_UPSTREAM_TOKEN_DELAY   seconds between streamed tokens
+#   FAKE_UPSTREAM_FAILURE_RATE  fraction of requests answered with 503
+#   FAKE_UPSTREAM_HANG_RATE     fraction of requests that never answer
+# -------------------------------------------------
+LATENCY = float(os.getenv("FAKE_UPSTREAM_LATENCY", "0.2"))
+TOKEN_DELAY = float(os.getenv("FAKE_UPSTREAM_TOKEN_DELAY", "0.03"))
+FAILURE_RATE = float(os.getenv("FAKE_UPSTREAM_FAILURE_RATE", "0"))
+HANG_RATE = float(os.getenv("FAKE_UPSTREAM_HANG_RATE", "0"))
+
+REPLY = (
+    "Hello there, thanks for asking. This reply comes from the local fake upstream server. "
+    "It is split into several sentences so the streaming pipeline has something to cut. "
+    "Each sentence should turn into its own lip-synced segment."
+)
+
+SAMPLE_RATE = 22050
+SECONDS_PER_WORD = 0.35
+
+app = FastAPI()
+
+
+async def misbehave():
+    """Apply the configured latency, hangs and failures; return a response to send instead, if any."""
+    await asyncio.sleep(LATENCY)
+    if random.random() < HANG_RATE:
+        await asyncio.sleep(3600)
+    if random.random() < FAILURE_RATE:
+        return JSONResponse(status_code=503, content={"error": {"message": "fake upstream failure"}})
+    return None
+
+
+def tone_wav(seconds: float) -> bytes:
+    """A quiet 220 Hz tone with a little noise, so the mel never contains NaNs."""
+    frames = int(seconds * SAMPLE_RATE)
+    samples = (
+        int(3000 * math.sin(2 * math.pi * 220 * i / SAMPLE_RATE) + random.randint(-50, 50))
+        for i in range(frames)
+    )
+
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(SAMPLE_RATE)
+        w.writeframes(b"".join(struct.pack("<h", s) for s in samples))
+    return buf.getvalue()
+
+
+# -------------------------------------------------
+# Groq (OpenAI-compatible chat completions)
+# -------------------------------------------------
+@app.post("/openai/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+
+    failure = await misbehave()
+    if failure is not None:
+        return failure
+
+    completion_id = "chatcmpl-" + uuid.uuid4().hex
+    created = int(time.time())
+    model = body.get("model", "fake")
+
+    if not body.get("stream"):
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": REPLY},
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        }
+
+    async def events():
+        for token in REPLY.split(" "):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": token + " "}, "finish_reason": None}]
+            }
+            yield f"data: {json.dumps(chunk)}\n\n"
+            await asyncio.sleep(TOKEN_DELAY)
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+# -------------------------------------------------
+# Sarvam text-to-speech
+# -------------------------------------------------
+@app.post("/text-to-speech")
+async def text_to_speech(request: Request):
+    body = await request.json()
+
+    failure = await misbehave()
+    if failure is not None:
+        return failure
+
+    words = max(1, len(str(body.get("text", "")).split()))
+    audio = tone_wav(words * SECONDS_PER_WORD)
+    return {
+        "request_id": uuid.uuid4().hex,
+        "audios": [base64.b64encode(audio).decode("ascii")]
+    }
@@ -1,4 +1,5 @@
 import os, sys
+import json
 import subprocess
 import platform
 import numpy as np
@@ -12,6 +13,14 @@ from tqdm import tqdm
 from PIL import Image
 from scipy.io.wavfile import write
 import gc
+import time
+import itertools
+
+import face_analysis
+import memory
+import metrics
+from model_prep import prepared_path, is_prepared
+import profiling
 
 import onnxruntime
 onnxruntime.set_default_logger_severity(3)
@@ -19,11 +28,20 @@ onnxruntime.set_default_logger_severity(3)
 # face detection and alignment
 from utils.retinaface import RetinaFace
 from utils.face_alignment import get_cropped_head_256
-detector = RetinaFace("utils/scrfd_2.5g_bnkps.onnx", provider=[("CUDAExecutionProvider", {"cudnn_conv_algo_search": "DEFAULT"}), "CPUExecutionProvider"], session_options=None)
-
-# specific face selector
+from utils.face_track import FaceTrack
+from utils.frame_index import FrameIndex, frame_runs
+from utils import ort_binding, ort_profile
 from faceID.faceID import FaceRecognition
-recognition = FaceRecognition('faceID/recognition.onnx')
+
+DETECTOR_PATH = "utils/scrfd_2.5g_bnkps.onnx"
+RECOGNITION_PATH = "faceID/recognition.onnx"
+
+# face pool workers (face_analysis.py) re-import this script as __mp_main__ and load their own
+if __name__ != '__mp_main__':
+	detector = RetinaFace(DETECTOR_PATH, provider=[("CUDAExecutionProvider", {"cudnn_conv_algo_search": "DEFAULT"}), "CPUExecutionProvider"], session_options=None)
+
+	# specific face selector
+	recognition = FaceRecognition(prepared_path(RECOGNITION_PATH))
 
 
 # arguments
@@ -35,15 +53,25 @@ parser.add_argument('--audio', type=str, help='Filepath of video/audio file to u
 parser.add_argument('--denoise', default=False, action="store_true", help="Denoise input audio to avoid unwanted lipmovement")
 parser.add_argument('--outfile', type=str, help='Video path to save result. See default for an e.g.', default='results/result_voice.mp4')
 parser.add_argument('--hq_output', default=False, action='store_true',help='HQ output')
+parser.add_argument('--progressive', default=False, action='store_true', help='Pipe frames to ffmpeg and write a fragmented browser-playable mp4 to outfile while rendering')
+parser.add_argument('--workdir', type=str, default='temp', help='Directory for intermediate audio/video files, use one per job when running concurrently')
 
 parser.add_argument('--static', default=False, action='store_true', help='If True, then use only first video frame for inference')
 parser.add_argument('--pingpong', default=False, action='store_true',help='pingpong loop if audio is longer than video')
 
 parser.add_argument('--cut_in', type=int, default=0, help="Frame to start inference")
 parser.add_argument('--cut_out', type=int, default=0, help="Frame to end inference")
+parser.add_argument('--frame_offset', type=int, default=0, help="Output frame index to start from, continues the avatar across consecutive segments")
+parser.add_argument('--segments', type=int, default=0, help='Render the timeline as this many segments in parallel processes, joined without re-encoding, 0 or 1 for one pass')
+parser.add_argument('--segment', type=str, default=None, help='START:END, render only these output frames to a video without audio (set by --segments)')
+parser.add_argument('--track', type=str, default=None, help='Face analysis saved by the run that started this segment, used instead of detecting again (set by --segments)')
+parser.add_argument('--ort_threads', type=int, default=0, help='Cap on the intra-op threads of the sessions this run loads, 0 for none')
 parser.add_argument('--fade', action="store_true", help="Fade in/out")
+parser.add_argument('--render_silent', default=False, action='store_true', help='Run Wav2Lip on silent chunks too instead of showing the source frame')
+parser.add_argument('--silence_threshold', type=float, default=-3.5, help='Chunks whose loudest normalized mel column (-4 to 4) stays below this are silent')
 
 parser.add_argument('--fps', type=float, help='Can be specified only if input is a static image (default: 25)', default=25., required=False)
+parser.add_argument('--letterbox', type=str, default=None, help='Scale and pad a static image to WIDTHxHEIGHT, e.g. 1280x720')
 parser.add_argument('--resize_factor', default=1, type=int, help='Reduce the resolution by this factor. Sometimes, best results are obtained at 480p or 720p')
 
 parser.add_argument('--enhancer', default='none', choices=['none', 'gpen', 'gfpgan', 'codeformer', 'restoreformer'])
@@ -53,11 +81,22 @@ parser.add_argument('--frame_enhancer', action="store_true", help="Use frame enh
 
 parser.add_argument('--face_mask', action="store_true", help="Use face mask")
 parser.add_argument('--face_occluder', action="store_true", help="Use x-seg occluder face mask")
+parser.add_argument('--face_mask_model', default='blendmask', choices=['blendmask', 'segmentation'], help='Model behind --face_mask')
+parser.add_argument('--face_occluder_model', default='xseg', choices=['xseg', 'occluder'], help='Model behind --face_occluder')
 
 parser.add_argument('--pads', type=int, default=4, help='Padding top, bottom to adjust best mouth position, move crop up/down, between -15 to 15') # pos value mov synced mouth up
+parser.add_argument('--still_threshold', type=float, default=2.0, help='Landmark motion in pixels below which a frame reuses the last keyframe alignment and masks, 0 to disable')
 parser.add_argument('--face_mode', type=int, default=0, help='Face crop mode, 0 or 1, rect or square, affects mouth opening' )
+parser.add_argument('--face_workers', type=int, default=0, help='Processes analysing the faces of a video in parallel, one frame range each, 0 or 1 for none')
+parser.add_argument('--face_threads', type=int, default=1, help='Intra-op threads of the detector and recognizer in each face worker')
 
 parser.add_argument('--preview', default=False, action='store_true', help='Preview during inference')
+parser.add_argument('--profile', default=False, action='store_true', help='Profile ONNX Runtime and Python and write a Chrome trace JSON')
+parser.add_argument('--profile_path', type=str, default=None, help='Where to write the profile (default: next to outfile, .trace.json)')
+
+parser.add_argument('--memory_budget', type=float, default=0, help='Process RSS limit in MB for this job, 0 for none')
+parser.add_argument('--memory_policy', type=str, default='abort', choices=['abort', 'degrade'], help='Over budget: fail the job, or first drop frame enhancer, denoise and avatar frames')
+parser.add_argument('--memory_trace', default=False, action='store_true', help='Also record per-stage peak allocations with tracemalloc (slower)')
 
 # removed arguments
 #parser.add_argument('--face_det_batch_size', type=int, help='Batch size for face detection', default=16)
@@ -67,72 +106,176 @@ parser.add_argument('--preview', default=False, action='store_true', help='Previ
 #parser.add_argument('--rotate', default=False, action='store_true',help='Sometimes videos taken from a phone can be flipped 90deg. If true, will flip video right by 90deg.''Use if you get a flipped result, despite feeding a normal looking video')
 #parser.add_argument('--nosmooth', default=False, action='store_true',help='Prevent smoothing face detections over a short temporal window')
 
-args = parser.parse_args()
-
-if args.checkpoint_path == 'checkpoints\wav2lip_384.onnx' or args.checkpoint_path == 'checkpoints\wav2lip_384_fp16.onnx':
-	args.img_size = 384
-else:
-	args.img_size = 96
-	
-
 mel_step_size = 16
-padY = max(-15, min(args.pads, 15))
 
 device = 'cpu'
 if onnxruntime.get_device() == 'GPU':
 		device = 'cuda'
 print("Running on " + device)
 
+# set by configure() for every run
+args = None
+run_argv = []
+padY = 0
+temp_wav = temp_video = hq_temp = None
+enhancer = frame_enhancer = masker = occluder = denoiser = None
+monitor = None
 
-if args.enhancer == 'gpen':
-		from enhancers.GPEN.GPEN import GPEN
-		enhancer = GPEN(model_path="enhancers/GPEN/GPEN-BFR-256-sim.onnx", device=device) #GPEN-BFR-256-sim
+# sessions stay loaded between runs when used from a long-running worker
+models = {}
+keep_models = False
+
+# face analysis workers, see face_workers()
+face_pool = None
+
+# avatar frames decoded into shared memory for them, see release_frames()
+frame_blocks = []
+
+# face analysis of image avatars, reused by every run on the same image
+face_cache = {}
+FACE_CACHE_SIZE = 16
 
-if args.enhancer == 'codeformer':
+IMAGE_EXTENSIONS = ['.jpg', '.png', '.jpeg', '.bmp']
+
+# frame kinds, see classify_frames()
+RENDER, SILENT, NO_FACE = 'render', 'silence', 'no_face'
+SILENCE_HYSTERESIS = 0.3
+SILENCE_MIN_FRAMES = 5
+
+# faces per mask model call
+MASK_BATCH = 16
+
+
+def get_model(name):
+	if name in models:
+		return models[name]
+
+	if name == 'gpen':
+		from enhancers.GPEN.GPEN import GPEN
+		model = GPEN(model_path=prepared_path("enhancers/GPEN/GPEN-BFR-256-sim.onnx"), device=device) #GPEN-BFR-256-sim
+	elif name == 'codeformer':
 		from enhancers.Codeformer.Codeformer import CodeFormer
-		enhancer = CodeFormer(model_path="enhancers/Codeformer/codeformerfixed.onnx", device=device)
-    
-if args.enhancer == 'restoreformer':
+		model = CodeFormer(model_path=prepared_path("enhancers/Codeformer/codeformerfixed.onnx"), device=device)
+	elif name == 'restoreformer':
 		from enhancers.restoreformer.restoreformer16 import RestoreFormer
-		enhancer = RestoreFormer(model_path="enhancers/restoreformer/restoreformer16.onnx", device=device)
-		
-if args.enhancer == 'gfpgan':
+		model = RestoreFormer(model_path=prepared_path("enhancers/restoreformer/restoreformer16.onnx"), device=device)
+	elif name == 'gfpgan':
 		from enhancers.GFPGAN.GFPGAN import GFPGAN
-		enhancer = GFPGAN(model_path="enhancers/GFPGAN/GFPGANv1.4.onnx", device=device)
-
-if args.frame_enhancer:
+		model = GFPGAN(model_path=prepared_path("enhancers/GFPGAN/GFPGANv1.4.onnx"), device=device)
+	elif name == 'frame_enhancer':
 		from enhancers.RealEsrgan.esrganONNX import RealESRGAN_ONNX
-		frame_enhancer = RealESRGAN_ONNX(model_path="enhancers/RealEsrgan/clear_reality_x4.onnx", device=device)
-    
-if args.face_mask:
+		model = RealESRGAN_ONNX(model_path=prepared_path("enhancers/RealEsrgan/clear_reality_x4.onnx"), device=device)
+	elif name == 'face_mask':
 		from blendmasker.blendmask import BLENDMASK
-		masker = BLENDMASK(model_path="blendmasker/blendmasker.onnx", device=device)
-		
-if args.face_occluder:
+		model = BLENDMASK(model_path=prepared_path("blendmasker/blendmasker.onnx"), device=device)
+	elif name == 'face_occluder':
 		from xseg.xseg import MASK
-		occluder = MASK(model_path="xseg/xseg.onnx", device=device)
+		model = MASK(model_path=prepared_path("xseg/xseg.onnx"), device=device)
+	elif name == 'segmentation':
+		from seg_mask.seg_mask import SEGMENTATION_MODULE
+		model = SEGMENTATION_MODULE(model_path="seg_mask/vox-5segments.onnx", device=device)
+	elif name == 'occluder':
+		from face_occluder.face_occluder import FACE_OCCLUDER
+		model = FACE_OCCLUDER(model_path="face_occluder/face_occluder.onnx", device=device)
+	elif name == 'denoise':
+		from resemble_denoiser.resemble_denoiser import ResembleDenoiser
+		model = ResembleDenoiser(model_path='resemble_denoiser/denoiser.onnx', device=device)
+	else:
+		raise ValueError('Unknown model: ' + name)
+
+	models[name] = model
+	return model
 
-if args.denoise:
-	from resemble_denoiser.resemble_denoiser import ResembleDenoiser
-	denoiser = ResembleDenoiser(model_path='resemble_denoiser/denoiser.onnx', device=device)
-				        		    
-if os.path.isfile(args.face) and args.face.split('.')[1] in ['jpg', 'png', 'jpeg']:
-		args.static: args.static = True
 
+def configure(argv=None):
+	global args, run_argv, padY, temp_wav, temp_video, hq_temp
+	global enhancer, frame_enhancer, masker, occluder, denoiser
 
+	args = parser.parse_args(argv)
+	run_argv = list(sys.argv[1:] if argv is None else argv)
+
+	if args.checkpoint_path == 'checkpoints\wav2lip_384.onnx' or args.checkpoint_path == 'checkpoints\wav2lip_384_fp16.onnx':
+		args.img_size = 384
+	else:
+		args.img_size = 96
+
+	temp_wav = os.path.join(args.workdir, 'temp.wav')
+	temp_video = os.path.join(args.workdir, 'temp.mp4')
+	hq_temp = os.path.join(args.workdir, 'hq_temp')
+	padY = max(-15, min(args.pads, 15))
+
+	if args.segments > 1 and (args.progressive or args.preview or args.hq_output):
+		print('--segments does not apply to progressive, preview or HQ output, rendering in one pass')
+		args.segments = 0
+
+	ort_profile.limit_threads(args.ort_threads)
+	enhancer = get_model(args.enhancer) if args.enhancer != 'none' else None
+	frame_enhancer = get_model('frame_enhancer') if args.frame_enhancer else None
+	masker = get_model('face_mask' if args.face_mask_model == 'blendmask' else 'segmentation') if args.face_mask else None
+	occluder = get_model('face_occluder' if args.face_occluder_model == 'xseg' else 'occluder') if args.face_occluder else None
+	denoiser = get_model('denoise') if args.denoise else None
+					        		    
+	if os.path.isfile(args.face) and is_image(args.face):
+			args.static: args.static = True
+
+	return args
+
+
+def load_model(device, model_path=None):
+	model_path = model_path or args.checkpoint_path
+	if model_path in models:
+		return models[model_path]
 
-def load_model(device):
-	model_path = args.checkpoint_path
 	session_options = onnxruntime.SessionOptions()
 	session_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
 	providers = ["CPUExecutionProvider"]
 	if device == 'cuda':
 		providers = [("CUDAExecutionProvider", {"cudnn_conv_algo_search": "DEFAULT"}),"CPUExecutionProvider"]
 		
-	session = onnxruntime.InferenceSession(model_path, sess_options=session_options, providers=providers)	
+	path, session_options = ort_profile.tuned(prepared_path(model_path), session_options)
+	session = onnxruntime.InferenceSession(path, sess_options=session_options, providers=providers)	
 	
+	models[model_path] = session
 	return session
 
+def is_image(path):
+	return os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS
+
+def letterbox(image, size):
+	# fit into WIDTHxHEIGHT keeping the aspect ratio, pad the rest black
+	width, height = (int(v) for v in size.lower().split('x'))
+	scale = min(width / image.shape[1], height / image.shape[0])
+	w, h = int(image.shape[1] * scale), int(image.shape[0] * scale)
+	resized = cv2.resize(image, (w, h), interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR)
+	boxed = np.zeros((height, width, 3), dtype=image.dtype)
+	x, y = (width - w) // 2, (height - h) // 2
+	boxed[y:y + h, x:x + w] = resized
+	return boxed
+
+def read_image():
+	with metrics.span('decode'):
+		frame = cv2.imread(args.face)
+	frame = cv2.resize(frame, (frame.shape[1]//args.resize_factor, frame.shape[0]//args.resize_factor))
+	if args.letterbox:
+		frame = letterbox(frame, args.letterbox)
+	return frame
+
+def image_faces(frame):
+	# the single frame of an image avatar only needs analysing once per process
+	key = (os.path.abspath(args.face), os.path.getmtime(args.face), args.letterbox, args.resize_factor,
+		args.face_mode, padY, args.img_size)
+	if key not in face_cache:
+		target_id = select_specific_face(detector, frame, 256, crop_scale=1)
+		if len(face_cache) >= FACE_CACHE_SIZE:
+			face_cache.pop(next(iter(face_cache)))
+		face_cache[key] = face_detect([frame], target_id)
+	return face_cache[key]
+
+def precompute_face(argv):
+	"""Analyse the image avatar of `argv` ahead of its first job."""
+	configure(argv)
+	image_faces(read_image())
+
 def select_specific_face(model, spec_img, size, crop_scale=1.0):
     """
     Automatically selects the primary face from the full frame
@@ -144,11 +287,12 @@ def select_specific_face(model, spec_img, size, crop_scale=1.0):
     """
 
     # Detect faces on full frame
-    bboxes, kpss = model.detect(
-        spec_img,
-        input_size=(320, 320),
-        det_thresh=0.3
-    )
+    with metrics.span('detection'):
+        bboxes, kpss = model.detect(
+            spec_img,
+            input_size=(320, 320),
+            det_thresh=0.3
+        )
 
     if len(kpss) == 0:
         raise RuntimeError("No face detected in the input frame")
@@ -167,139 +311,211 @@ def select_specific_face(model, spec_img, size, crop_scale=1.0):
             best_idx = i
 
     # Crop and align the selected face
-    target_face, _ = get_cropped_head_256(
-        spec_img,
-        kpss[best_idx],
-        size=size,
-        scale=crop_scale
-    )
+    with metrics.span('alignment'):
+        target_face, _ = get_cropped_head_256(
+            spec_img,
+            kpss[best_idx],
+            size=size,
+            scale=crop_scale
+        )
 
     # Prepare for face recognition
     target_face = cv2.resize(target_face, (112, 112))
-    target_id = recognition(target_face)[0].flatten()
+    with metrics.span('recognition'):
+        target_id = recognition(target_face)[0].flatten()
 
     return target_id
 
 
 
-def process_video_specific(model, img, size, target_id, crop_scale=1.0):
-		ori_img = img
-		bboxes, kpss = model.detect(ori_img, input_size=(320, 320), det_thresh=0.3)
-    
-		assert len(kpss) != 0, "No face detected"
-
-		best_score = -float('inf')
-		best_aimg = None
-		best_mat = None
-
-		for kps in kpss:
-				aimg, mat = get_cropped_head_256(ori_img, kps, size=size, scale=crop_scale)
-        
-				face = aimg.copy()
-				face = cv2.resize(face, (112, 112))
-				face_id = recognition(face)[0].flatten()
-        
-        # Calculate similarity score with the target ID
-				score = target_id @ face_id  # Dot product or cosine similarity
-                
-				if score > best_score:
-						best_score = score
-						best_aimg = aimg
-						best_mat = mat
-				if best_score < 0.4:
-						best_aimg = np.zeros((256,256), dtype=np.uint8)
-						best_aimg = cv2.cvtColor(best_aimg, cv2.COLOR_GRAY2RGB)/255
-						best_mat = np.float32([[1,2,3],[1,2,3]])                          
-
-		return best_aimg, best_mat
-        
-def face_detect(images, target_id):
+def face_settings():
+	return {'still_threshold': args.still_threshold, 'face_mode': args.face_mode, 'pad_y': padY, 'img_size': args.img_size}
 
-	os.system('cls')
-	print ("Detecting face and generating data...")
-					
-	crop_size = 256
+def face_workers():
+	# the pool outlives the job like the other models; None analyses in this process
+	global face_pool
+	if args.face_workers < 2:
+		return None
+	if face_pool is not None and (face_pool.processes, face_pool.threads) != (args.face_workers, args.face_threads):
+		close_face_pool()
+	if face_pool is None:
+		face_pool = face_analysis.FacePool(args.face_workers, args.face_threads, DETECTOR_PATH, prepared_path(RECOGNITION_PATH))
+	return face_pool
 
-	sub_faces = []
-	crop_faces = []
-	matrix = []
-	face_error = []
-				
-	for i in tqdm(range(0, len(images))):
+def release_frames():
+	# free the shared frame blocks of finished runs; one whose frames are
+	# still referenced (by an exception's traceback) is tried again next run
+	global frame_blocks
+	frame_blocks = [block for block in frame_blocks if not block.close()]
 
-		try:
+def close_face_pool():
+	global face_pool
+	if face_pool is not None:
+		face_pool.close()
+		face_pool = None
 
-			crop_face, M = process_video_specific(detector, images[i], 256, target_id, crop_scale=1.0)
+def face_detect(images, target_id, runs=None, frames=None):
+	# face data of the frames in runs (see frame_runs), all of them if None;
+	# rows of the other frames stay empty. Images decoded into the
+	# SharedFrames `frames` reach the pool without a copy
 
-      # crop modes
-			if args.face_mode == 0:
-				sub_face = crop_face[65-(padY):241-(padY),62:194]
-				#cv2.imwrite("sub_0.jpg",sub_face)
-			else:
-				sub_face = crop_face[65-(padY):241-(padY),42:214]
-				#cv2.imwrite("sub_1.jpg",sub_face)
-			
-			sub_face = cv2.resize(sub_face, (args.img_size,args.img_size))
-  
-			sub_faces.append(sub_face)		
-			crop_faces.append(crop_face)
-			matrix.append(M)
-  
-			no_face = 0
-  		
-		except:
-			if i == 0:
-				crop_face = np.zeros((256,256), dtype=np.uint8)
-				crop_face = cv2.cvtColor(crop_face, cv2.COLOR_GRAY2RGB)/255
-				sub_face = crop_face[65-(padY):241-(padY),62:194]
-				sub_face = cv2.resize(sub_face, (args.img_size,args.img_size))
-				M = np.float32([[1,2,3],[1,2,3]])
-  							
-			sub_faces.append(sub_face)		
-			crop_faces.append(crop_face)
-			matrix.append(M)
-  		
-			no_face = -1
-			
-		face_error.append(no_face)
-		
-	return crop_faces, sub_faces, matrix, face_error 
+	os.system('cls')
+	print ("Detecting face and generating data...")
+
+	track = FaceTrack(len(images), args.img_size, face_analysis.CROP_SIZE)
+	runs = runs or [(0, len(images))]
 
-def datagen(frames, mels):
+  # one frame range per pool worker, or all of them here
+	pool = face_workers()
+	if pool is not None and sum(end - start for start, end in runs) >= 2 * face_analysis.MIN_SHARD_FRAMES:
+		missing, reused = pool.analyse(images, track, target_id, face_settings(), runs, frames)
+	else:
+		missing, reused = [], 0
+		for start, end in runs:
+			run_missing, run_reused = face_analysis.analyse(images, track, start, end, target_id, detector, recognition, face_settings())
+			missing += run_missing
+			reused += run_reused
+	face_analysis.fill_missing(track, missing, runs)
+
+	track.update_inverse()
+	found = int((track.status == 0).sum())
+	metrics.add_reuse('alignment', reused, found)
+	print(f'Alignments reused: {reused} / {found}')
+	return track
+
+def occluder_mask_memo(track, frame_kinds, frame_index, first=0, last=None):
+	# the occluder only sees the source face, so every keyframe output
+	# frames first..last will use is masked once, in batches; kept as uint8
+	# to stay small
+	last = len(frame_kinds) if last is None else last
+	keys = list(dict.fromkeys(
+		int(track.key[frame_index(i)]) for i in range(first, last) if frame_kinds[i] != NO_FACE))
+	memo = {}
+	with metrics.span('mask'):
+		for start in range(0, len(keys), MASK_BATCH):
+			chunk = keys[start:start + MASK_BATCH]
+			masks = occluder.mask_batch(track.aligned[chunk])
+			for key, mask in zip(chunk, masks):
+				memo[key] = (mask * 255).astype(np.uint8)
+	return memo
+
+def read_frames(video_stream, count, runs):
+	# the source frames in runs, seeking to each run; the other count
+	# frames stay None
+	frames = [None] * count
+	for start, end in runs:
+		video_stream.set(cv2.CAP_PROP_POS_FRAMES, args.cut_in + start)
+		for j in range(start, end):
+			with metrics.span('decode'):
+				still_reading, frame = video_stream.read()
+			if not still_reading:
+				raise RuntimeError(f'Could not read frame {args.cut_in + j} of {args.face}')
+			if args.resize_factor > 1:
+				frame = cv2.resize(frame, (frame.shape[1]//args.resize_factor, frame.shape[0]//args.resize_factor))
+			frames[j] = frame
+	video_stream.release()
+	return frames
+
+def frame_mode():
+	if args.static:
+		return 'static'
+	return 'pingpong' if args.pingpong else 'loop'
+
+def classify_frames(mel_chunks, no_face, frame_index):
+	# which output frames need the face pipeline: silent chunks (with
+	# hysteresis, ignoring short pauses) and frames without the face skip it
+	kinds = []
+	silent = False
+	for m in mel_chunks:
+		energy = m.mean(axis=0).max()
+		if silent and energy > args.silence_threshold + SILENCE_HYSTERESIS:
+			silent = False
+		elif not silent and energy < args.silence_threshold:
+			silent = True
+		kinds.append(SILENT if silent and not args.render_silent else RENDER)
+
+	i = 0
+	for kind, run in itertools.groupby(list(kinds)):
+		n = len(list(run))
+		if kind == SILENT and n < SILENCE_MIN_FRAMES:
+			kinds[i:i + n] = [RENDER] * n
+		i += n
+
+	for i in range(len(kinds)):
+		if no_face[frame_index(i)] != 0:
+			kinds[i] = NO_FACE
+	return kinds
+
+def datagen(frames, mels, frame_index, prepared=False, start=0, frame_kinds=None):
+	# frames the render loop passes through without Wav2Lip (see
+	# frame_kinds there) come out as None, with no input built for them
 	
 	img_batch, mel_batch, frame_batch = [], [], []
+	closed_mouth = False
+
+	for i, m in enumerate(mels[start:], start):
 
-	for i, m in enumerate(mels):
+		kind = frame_kinds[i] if frame_kinds is not None else RENDER
+		if kind == NO_FACE or (kind == SILENT and (closed_mouth or not args.static)):
+			yield None, None, None
+			continue
+		closed_mouth = closed_mouth or kind == SILENT
 
-		idx = 0 if args.static else i%len(frames)
+		idx = frame_index(i)
 
-		frame_to_save = frames[idx].copy()
-		frame_batch.append(frame_to_save)
+		frame_batch.append(frames[idx])
 			
 		img_batch.append(frames[idx])
 		mel_batch.append(m)
 
 		img_batch, mel_batch = np.asarray(img_batch), np.asarray(mel_batch)
 
-		img_masked = img_batch.copy()
-		img_masked[:, args.img_size//2:] = 0
-		#img_masked[:, :, args.img_size // 2:, :] = 0
+		# a prepared model masks and scales the uint8 faces itself
+		if not prepared:
+			img_masked = img_batch.copy()
+			img_masked[:, args.img_size//2:] = 0
+			#img_masked[:, :, args.img_size // 2:, :] = 0
 		
-		img_batch = np.concatenate((img_masked, img_batch), axis=3) / 255.
+			img_batch = np.concatenate((img_masked, img_batch), axis=3) / 255.
 		mel_batch = np.reshape(mel_batch, [len(mel_batch), mel_batch.shape[1], mel_batch.shape[2], 1])
 
 		yield img_batch, mel_batch, frame_batch
 		img_batch, mel_batch, frame_batch = [], [], []
-def main():
-	if args.hq_output:
-		if not os.path.exists('hq_temp'):
-			os.mkdir('hq_temp')
 
-  # ffmpeg preset for HQ processing	
-	preset='medium'
-	 
-	blend = args.blending/10
- 
+class ProgressiveWriter:
+	# drop-in for cv2.VideoWriter: frames go straight into an H.264/AAC fragmented
+	# mp4 (one fragment per second) that a player can start on before it is complete
+	def __init__(self, outfile, audio_path, fps, size):
+		w, h = size
+		self.proc = subprocess.Popen([
+			'ffmpeg', '-y', '-loglevel', 'error',
+			'-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{w}x{h}', '-r', str(fps), '-i', '-',
+			'-i', audio_path,
+			'-map', '0:v', '-map', '1:a',
+			'-vf', 'scale=trunc(iw/2)*2:trunc(ih/2)*2',
+			'-c:v', 'libx264', '-preset', 'veryfast', '-tune', 'zerolatency',
+			'-pix_fmt', 'yuv420p', '-profile:v', 'baseline', '-level', '3.0',
+			'-g', str(max(1, int(round(fps)))),
+			'-c:a', 'aac', '-ac', '2', '-ar', '44100',
+			'-shortest',
+			'-movflags', 'frag_keyframe+empty_moov+default_base_moof',
+			'-flush_packets', '1',
+			'-f', 'mp4', outfile
+		], stdin=subprocess.PIPE)
+
+	def write(self, frame):
+		self.proc.stdin.write(np.ascontiguousarray(frame).tobytes())
+
+	def release(self):
+		if self.proc.stdin.closed:
+			return
+		self.proc.stdin.close()
+		if self.proc.wait() != 0:
+			raise RuntimeError('ffmpeg progressive encode failed')
+
+def face_masks():
+	# blend masks in aligned 256x256 face space: mouth region for pasting the
+	# full-frame composite, and the sub-face rectangle for the Wav2Lip output
 	static_face_mask = np.zeros((224,224), dtype=np.uint8)
 	static_face_mask = cv2.ellipse(static_face_mask, (112,162), (62,54),0,0,360,(255,255,255), -1)
 	static_face_mask = cv2.ellipse(static_face_mask, (112,122), (46,23),0,0,360,(0,0,0), -1)
@@ -320,15 +536,169 @@ def main():
 	sub_face_mask = cv2.GaussianBlur(sub_face_mask.astype(np.uint8),(29,29),cv2.BORDER_DEFAULT)
 	sub_face_mask = cv2.cvtColor(sub_face_mask, cv2.COLOR_GRAY2RGB)		
 	sub_face_mask = sub_face_mask/255
-		
-	im = cv2.imread(args.face)
 
+	return static_face_mask, sub_face_mask
+
+def profiled_sessions():
+	# (name, holder, key) of every session the current run uses, for profiling
+	sessions = [
+		('detector', detector, 'session'),
+		('recognition', recognition, 'session'),
+		('wav2lip', models, args.checkpoint_path)
+	]
+	for name, model in (('enhancer', enhancer), ('frame_enhancer', frame_enhancer), ('face_mask', masker),
+			('face_occluder', occluder), ('denoise', denoiser)):
+		if model is not None and hasattr(model, 'session'):
+			sessions.append((name, model, 'session'))
+	return sessions
+
+def segment_range(count):
+	# (first, last) output frame of this run: a --segment, or the whole timeline
+	if args.segment is None:
+		return 0, count
+	first, last = (int(v) for v in args.segment.split(':'))
+	return max(0, first), min(count, last)
+
+def segment_bounds(count, segments):
+	# contiguous (first, last) output frame ranges, as even as frames allow
+	bounds = [(count * k // segments, count * (k + 1) // segments) for k in range(segments)]
+	return [(first, last) for first, last in bounds if last > first]
+
+# options of the parent run a segment does not inherit: flags, then options with a value
+SEGMENT_DROP_FLAGS = {'--denoise', '--progressive', '--preview', '--profile', '--hq_output'}
+SEGMENT_DROP_OPTIONS = {'--audio', '--outfile', '--workdir', '--profile_path', '--segments', '--segment', '--track', '--ort_threads', '--memory_budget'}
+
+def segment_count(count, frame_bytes):
+	# --segments, fewer if they would not fit in the memory budget (or what
+	# the host has free): each segment process loads the engine the way this
+	# run did and holds its share of the frames and the track, while this
+	# one drops its frames and waits
+	if args.segments < 2:
+		return 1
+	room = monitor.budget - monitor.baseline if monitor.budget else memory.available_bytes()
+	if not room:
+		return args.segments
+	engine = monitor.baseline
+	if args.checkpoint_path not in models:
+		engine += os.path.getsize(prepared_path(args.checkpoint_path))
+	row_bytes = frame_bytes + face_analysis.CROP_SIZE ** 2 * 3 + args.img_size ** 2 * 3
+	segments = args.segments
+	while segments > 1 and segments * (engine + row_bytes * -(-count // segments)) > room:
+		segments -= 1
+	if segments < args.segments:
+		print(f'Memory for {segments} of {args.segments} segments')
+	return segments
+
+def segment_argv(first, last, workdir, track_dir, threads, budget_mb):
+	# the parent's command line for one segment: the parent's (denoised) wav
+	# as audio, its face analysis, and a bare video in the segment's workdir
+	argv = []
+	skip = False
+	for token in run_argv:
+		if skip:
+			skip = False
+			continue
+		name = token.split('=', 1)[0]
+		if name in SEGMENT_DROP_FLAGS:
+			continue
+		if name in SEGMENT_DROP_OPTIONS:
+			skip = '=' not in token
+			continue
+		argv.append(token)
+	return argv + [
+		'--audio', temp_wav,
+		'--outfile', os.path.join(workdir, 'segment.mp4'),
+		'--workdir', workdir,
+		'--segment', f'{first}:{last}',
+		'--track', track_dir,
+		'--ort_threads', str(threads)
+	] + (['--memory_budget', str(budget_mb)] if budget_mb else [])
+
+def render_segments(count, segments, track_dir):
+	# render contiguous frame ranges of the timeline in parallel processes,
+	# each to a bare video written with the same encoder settings, then join
+	# them without re-encoding into temp_video for the usual audio mux
+	bounds = segment_bounds(count, segments)
+	threads = args.ort_threads or max(1, (os.cpu_count() or 1) // len(bounds))
+	print(f'Rendering {count} frames in {len(bounds)} segments, {threads} threads each')
+
+  # the budget left beside this process is split between the segments
+	budget_mb = 0
+	if monitor.budget:
+		budget_mb = max(1, int((monitor.budget - memory.rss_bytes()) / memory.MB / len(bounds)))
+
+	workdirs = [os.path.join(args.workdir, f'segment_{k}') for k in range(len(bounds))]
+	started = time.perf_counter()
+	procs = []
+	try:
+		for (first, last), workdir in zip(bounds, workdirs):
+			os.makedirs(workdir, exist_ok=True)
+			procs.append(subprocess.Popen([sys.executable, os.path.abspath(__file__)] + segment_argv(first, last, workdir, track_dir, threads, budget_mb)))
+		failed = [k for k, proc in enumerate(procs) if proc.wait() != 0]
+	finally:
+		for proc in procs:
+			if proc.poll() is None:
+				proc.kill()
+	if failed:
+		raise RuntimeError('Segments failed: ' + ', '.join(f'{bounds[k][0]}-{bounds[k][1]}' for k in failed))
+
+	# the segments' spans add up; their frames rendered side by side
+	trace = metrics.current()
+	if trace is not None:
+		render_seconds = trace.render_seconds
+		for workdir in workdirs:
+			with open(os.path.join(workdir, 'trace.json')) as f:
+				trace.merge(json.load(f))
+		trace.render_seconds = render_seconds + time.perf_counter() - started
+
+	concat_list = os.path.join(args.workdir, 'segments.txt')
+	with open(concat_list, 'w') as f:
+		for workdir in workdirs:
+			path = os.path.abspath(os.path.join(workdir, 'temp.mp4'))
+			f.write("file '" + path.replace("'", "'\\''") + "'\n")
+	with metrics.span('encode'):
+		subprocess.run(['ffmpeg', '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0', '-i', concat_list, '-c', 'copy', temp_video], check=True)
+
+	os.remove(concat_list)
+	shutil.rmtree(track_dir)
+	for workdir in workdirs:
+		shutil.rmtree(workdir)
+
+def main():
+	global monitor
+	profiler = None
+	if args.profile:
+		load_model(device)
+		profile_path = args.profile_path or os.path.splitext(args.outfile)[0] + '.trace.json'
+		profiler = profiling.JobProfiler(profile_path, args.workdir, profiled_sessions())
+
+	monitor = memory.MemoryMonitor(args.memory_budget, args.memory_policy, args.memory_trace)
+	try:
+		render_video()
+	finally:
+		monitor.stop()
+		release_frames()
+		if profiler is not None:
+			print('Profile written to ' + profiler.finish())
+
+def render_video():
+	if args.hq_output:
+		if not os.path.exists(hq_temp):
+			os.makedirs(hq_temp)
+
+  # ffmpeg preset for HQ processing	
+	preset='medium'
+	 
+	blend = args.blending/10
+ 
+	static_face_mask, sub_face_mask = face_masks()
+	frame_block = None
+		
 	if not os.path.isfile(args.face):
 		raise ValueError('--face argument must be a valid path to video/image file')
 	
-	elif args.face.split('.')[1] in ['jpg', 'png', 'jpeg', 'bmp']:
-		orig_frame = cv2.imread(args.face)
-		orig_frame = cv2.resize(orig_frame, (orig_frame.shape[1]//args.resize_factor, orig_frame.shape[0]//args.resize_factor))	
+	elif is_image(args.face):
+		orig_frame = read_image()
 		orig_frames = [orig_frame]
 		fps = args.fps
 
@@ -342,10 +712,6 @@ def main():
 		# orig_h, orig_w = cropped_roi.shape[:-1]
 		full_frames = [orig_frame]
 		orig_h, orig_w = orig_frame.shape[:-1]
-
-		
-    #	select specific face:
-		target_id = select_specific_face(detector, cropped_roi, 256, crop_scale=1)
 								
 	else:
 		video_stream = cv2.VideoCapture(args.face)
@@ -363,6 +729,9 @@ def main():
 		
 		if args.static:
 			new_duration = 1
+		# a segment reads only the frames it shows, once it knows them (see read_frames)
+		if args.track:
+			new_duration = 0
 	
 		video_stream.set(1,args.cut_in)
 		
@@ -371,11 +740,17 @@ def main():
 		orig_frames = []
 		
 		for l in range(new_duration):
-			still_reading, frame = video_stream.read()
+			with metrics.span('decode'):
+				still_reading, frame = video_stream.read()
 			
 			if not still_reading:
 				video_stream.release()
 				break
+
+			# loop the frames read so far rather than run out of memory
+			if full_frames and monitor.degrade('avatar frames after ' + str(len(full_frames))):
+				video_stream.release()
+				break
 				
 			if args.resize_factor > 1:
 				frame = cv2.resize(frame, (frame.shape[1]//args.resize_factor, frame.shape[0]//args.resize_factor))			
@@ -393,11 +768,20 @@ def main():
         # # select_specific_face:
 		# 		target_id = select_specific_face(detector, cropped_roi, 256, crop_scale=1)
 		# 		orig_h, orig_w = cropped_roi.shape[:-1]
-				target_id = select_specific_face(detector, frame, 256, crop_scale=1)
+				# a segment gets the face analysis of the whole video from its parent
+				if not args.track:
+					target_id = select_specific_face(detector, frame, 256, crop_scale=1)
 				orig_h, orig_w = frame.shape[:-1]
 
+				# decode into the face pool's shared memory rather than copy there (see face_detect)
+				if args.face_workers >= 2 and not args.track and new_duration >= 2 * face_analysis.MIN_SHARD_FRAMES:
+					frame_block = face_analysis.SharedFrames(new_duration, frame.shape)
+					frame_blocks.append(frame_block)
+
 				print("Reading frames....")
 			print(f'\r{l}', end=' ', flush=True)
+			if frame_block is not None:
+				frame = frame_block.put(l, frame)
 			
       # crop all frames:
 			# cropped_roi = frame[int(roi[1]):int(roi[1]+roi[3]), int(roi[0]):int(roi[0]+roi[2])]
@@ -411,31 +795,40 @@ def main():
 	memory_usage_bytes = sum(frame.nbytes for frame in full_frames)
 	memory_usage_mb = memory_usage_bytes / (1024**2)
 	
-	print ("Number of frames used for inference: " + str(len(full_frames)) + " / ~ " + str(int(memory_usage_mb)) + " mb memory usage")
+	if full_frames:
+		print ("Number of frames used for inference: " + str(len(full_frames)) + " / ~ " + str(int(memory_usage_mb)) + " mb memory usage")
 	
   
   # convert input audio to wav anyway:
 	print('Extracting raw audio...')
-	subprocess.run(['ffmpeg', '-y', '-i', args.audio, '-ac', '1', '-strict', '-2', 'temp/temp.wav'])
+	with metrics.span('audio'):
+		subprocess.run(['ffmpeg', '-y', '-i', args.audio, '-ac', '1', '-strict', '-2', temp_wav])
 
 	os.system('cls')
 	print('Raw audio extracted')
 
   # denoise extracted audio:
+	if args.denoise and monitor.degrade('denoise'):
+		args.denoise = False
 	if args.denoise:
 		print('Denoising audio...')
-		wav, sr = librosa.load('temp/temp.wav', sr=44100, mono=True)
-		wav_denoised, new_sr = denoiser.denoise(wav, sr, batch_process_chunks=False)
-		write('temp/temp.wav', new_sr, (wav_denoised * 32767).astype(np.int16))
-		try:
-			if hasattr(denoiser, 'session'):
-				del denoiser.session
-				gc.collect()
-		except:
-			pass
-
-	wav = audio.load_wav('temp/temp.wav', 16000)
-	mel = audio.melspectrogram(wav)
+		with metrics.span('denoise'):
+			wav, sr = librosa.load(temp_wav, sr=44100, mono=True)
+			wav_denoised, new_sr = denoiser.denoise(wav, sr, batch_process_chunks=False)
+			write(temp_wav, new_sr, (wav_denoised * 32767).astype(np.int16))
+		if not keep_models:
+			models.pop('denoise', None)
+			try:
+				if hasattr(denoiser, 'session'):
+					del denoiser.session
+					gc.collect()
+			except:
+				pass
+
+	with metrics.span('audio'):
+		wav = audio.load_wav(temp_wav, 16000)
+	with metrics.span('mel'):
+		mel = audio.melspectrogram(wav)
 
 	if np.isnan(mel.reshape(-1)).sum() > 0:
 		raise ValueError('Mel contains nan! Using a TTS voice? Add a small epsilon noise to the wav file and try again')
@@ -453,29 +846,51 @@ def main():
 
 	print("Length of mel chunks: {}".format(len(mel_chunks)))
 
-	full_frames = full_frames[:len(mel_chunks)]
-
-  # face detection:	
-	aligned_faces, sub_faces, matrix, no_face = face_detect(full_frames, target_id)
-
-	if args.pingpong:
-		orig_frames = orig_frames + orig_frames[::-1]
-		full_frames = full_frames + full_frames[::-1]
-		aligned_faces = aligned_faces + aligned_faces[::-1]
-		sub_faces = sub_faces + sub_faces[::-1]
-		matrix = matrix + matrix[::-1]
-		no_face = no_face + no_face[::-1]
-
-  # datagen:					
-	gen = datagen(sub_faces.copy(), mel_chunks)
-	
-	fc = 0
+  # output frames first..last of the timeline, all of them unless this is a segment
+	first, last = segment_range(len(mel_chunks))
 
+	if args.track:
+		# the parent's track has a row for every frame its FrameIndex counts
+		track = FaceTrack.load(args.track)
+		frame_index = FrameIndex(len(track), frame_mode(), args.frame_offset)
+		if not is_image(args.face):
+			full_frames = orig_frames = read_frames(video_stream, len(track), frame_runs(frame_index, first, last))
+			orig_h, orig_w = next(frame for frame in full_frames if frame is not None).shape[:-1]
+	else:
+		full_frames = full_frames[:args.frame_offset + len(mel_chunks)]
+		frame_index = FrameIndex(len(full_frames), frame_mode(), args.frame_offset)
+
+	  # face detection, of the frames this run shows only (a sentence
+	  # segment's --frame_offset picks up the avatar where the last one ended):
+		if is_image(args.face):
+			track = image_faces(full_frames[0])
+		else:
+			track = face_detect(full_frames, target_id, frame_runs(frame_index, 0, len(mel_chunks)), frame_block)
+			if not keep_models:
+				close_face_pool()
+
+	segments = segment_count(len(mel_chunks), full_frames[frame_index(0)].nbytes) if args.segment is None else 1
+	if segments > 1:
+		# the segments read their own frames and the saved track
+		track_dir = os.path.join(args.workdir, 'track')
+		track.save(track_dir)
+		track = full_frames = orig_frames = frame = frame_block = None
+		gc.collect()
+		release_frames()
+		render_segments(len(mel_chunks), segments, track_dir)
+		mux_output(fps)
+		return
+
+  # Wav2Lip model:
 	model = load_model(device)
+	prepared = is_prepared(model)
 
-	frame_h, frame_w = full_frames[0].shape[:-1]
+	frame_h, frame_w = orig_h, orig_w
 
-	out = cv2.VideoWriter('temp/temp.mp4', cv2.VideoWriter_fourcc(*'mp4v'), fps, (orig_w, orig_h))
+	if args.progressive:
+		out = ProgressiveWriter(args.outfile, args.audio, fps, (orig_w, orig_h))
+	else:
+		out = cv2.VideoWriter(temp_video, cv2.VideoWriter_fourcc(*'mp4v'), fps, (orig_w, orig_h))
 				
 	os.system('cls')
 	print('Running on ' + onnxruntime.get_device())
@@ -487,92 +902,121 @@ def main():
 	if args.face_occluder: print ('Use occlusion mask')
 	print ('')
 
-  # fade in/out
-	fade_in = 11
+  # fade in/out, by output frame so segments fade like a single pass
 	total_length = int(np.ceil(float(len(mel_chunks))))
 	fade_out = total_length - 11
-	bright_in = 0
-	bright_out = 0
+	frame_kinds = classify_frames(mel_chunks, track.status, frame_index)
+	gen = datagen(track.sub, mel_chunks[:last], frame_index, prepared, first, frame_kinds)
+	skipped = {}
+	closed_mouth = None
+
+	occluder_masks = occluder_mask_memo(track, frame_kinds, frame_index, first, last) if args.face_occluder else None
+
+  # warped masks are reused while frames share a keyframe (see face_detect)
+	static_mask_key = occluder_key = None
+	static_mask = occluder_mask = None
+	mask_reused = mask_checks = 0
+
+  # model outputs land in buffers kept for the whole render (see utils/ort_binding.py)
+	enhanced = seg_masks = upscaled = None
+	render_started = time.perf_counter()
 	
-	for i, (img_batch, mel_batch, frames) in enumerate(tqdm(gen, total=int(np.ceil(float(len(mel_chunks)))))):
+	for i, (img_batch, mel_batch, frames) in enumerate(tqdm(gen, total=last - first), first):
 					
-		if fc == (len(full_frames)):
-			fc = 0
+		fc = frame_index(i)
 		
-		face_err = no_face[fc]
+		if args.frame_enhancer and monitor.degrade('frame_enhancer'):
+			args.frame_enhancer = False
+		monitor.check()
 		
-		img_batch = img_batch.transpose((0, 3, 1, 2)).astype(np.float32)
-		mel_batch = mel_batch.transpose((0, 3, 1, 2)).astype(np.float32)
+		kind = frame_kinds[i]
+		if kind == NO_FACE or (kind == SILENT and not args.static):
+			# nothing to lip-sync: the source frame goes out as it is
+			skipped[kind] = skipped.get(kind, 0) + 1
+			res = full_frames[fc]
+		elif kind == SILENT and closed_mouth is not None:
+			skipped[kind] = skipped.get(kind, 0) + 1
+			res = closed_mouth
+		else:
+			mel_batch = mel_batch.transpose((0, 3, 1, 2)).astype(np.float32)
 		
-    # wav2lip onnx inference:
-		pred = model.run(None,{'mel_spectrogram':mel_batch, 'video_frames':img_batch})[0][0]
+	    # wav2lip onnx inference:
+			if prepared:
+				# uint8 faces in, uint8 BGR faces out (model_prep.py)
+				with metrics.span('wav2lip'):
+					pred = ort_binding.run(model, {'mel_spectrogram':mel_batch, 'face':img_batch})[0]
+			else:
+				img_batch = img_batch.transpose((0, 3, 1, 2)).astype(np.float32)
+				with metrics.span('wav2lip'):
+					pred = ort_binding.run(model, {'mel_spectrogram':mel_batch, 'video_frames':img_batch})[0][0]
 				
-		pred = pred.transpose(1, 2, 0)*255
-		pred = pred.astype(np.uint8)
-		pred = pred.reshape((1, args.img_size, args.img_size, 3))		
+				pred = pred.transpose(1, 2, 0)*255
+				pred = pred.astype(np.uint8)
+				pred = pred.reshape((1, args.img_size, args.img_size, 3))		
 		
-		mat = matrix[fc]
-		mat_rev = cv2.invertAffineTransform(mat)
+			mat_rev = track.inverse[fc]
 
-		aligned_face = aligned_faces[fc]
-		aligned_face_orig = aligned_face.copy()
-		p_aligned = aligned_face.copy()
+			aligned_face = track.aligned[fc]
+			aligned_face_orig = aligned_face.copy()
+			p_aligned = aligned_face.copy()
 		
-		full_frame = full_frames[fc]
+			full_frame = full_frames[fc]
 
-		final = orig_frames[fc]
+			final = orig_frames[fc]
 	
-		for p, f in zip(pred, frames):			
-				
-			if not args.static: fc = fc + 1
+			for p, f in zip(pred, frames):			
 
-      # crop mode:
-			if args.face_mode == 0:
-				p = cv2.resize(p,(132,176))
-			else:
-				p = cv2.resize(p,(172,176))
+	      # crop mode:
+				if args.face_mode == 0:
+					p = cv2.resize(p,(132,176))
+				else:
+					p = cv2.resize(p,(172,176))
 
 				
-			if args.face_mode == 0:
-				p_aligned[65-(padY):241-(padY),62:194] = p
-			else:
-				p_aligned[65-(padY):241-(padY),42:214] = p
-			
-			aligned_face = (sub_face_mask * p_aligned + (1 - sub_face_mask) * aligned_face_orig).astype(np.uint8)
+				if args.face_mode == 0:
+					p_aligned[65-(padY):241-(padY),62:194] = p
+				else:
+					p_aligned[65-(padY):241-(padY),42:214] = p
 			
-			if face_err != 0:
-				res = full_frame
-				face_err = 0
-				
-			else:
+				with metrics.span('composite'):
+					aligned_face = (sub_face_mask * p_aligned + (1 - sub_face_mask) * aligned_face_orig).astype(np.uint8)
 			
-        # face enhancers:
+	        # face enhancers:
 				if args.enhancer != 'none':      
-					aligned_face_enhanced = enhancer.enhance(aligned_face)
-					aligned_face_enhanced = cv2.resize(aligned_face_enhanced,(256,256))
+					with metrics.span('enhancer'):
+						enhanced = enhancer.enhance(aligned_face, out=enhanced)
+					aligned_face_enhanced = cv2.resize(enhanced,(256,256))
 					aligned_face = cv2.addWeighted(aligned_face_enhanced.astype(np.float32),blend, aligned_face.astype(np.float32), 1.-blend, 0.0)        
         					
-        # mask options:
+	        # mask options:
+				mask_timer = metrics.Timer('mask')
 				if args.face_mask:
-					seg_mask = masker.mask(aligned_face)
+					seg_masks = masker.mask_batch(aligned_face[np.newaxis], out=seg_masks)
+					seg_mask = seg_masks[0]
 					#seg_mask[seg_mask > 32] = 255
 					seg_mask = cv2.blur(seg_mask,(5,5))					
-					seg_mask = seg_mask /255
-					mask = cv2.warpAffine(seg_mask, mat_rev,(frame_w, frame_h))
-					
-				if args.face_occluder:
-          # handle specific face not detected:
-					try:
-						seg_mask = occluder.mask(aligned_face_orig)
-						seg_mask = cv2.cvtColor(seg_mask, cv2.COLOR_GRAY2RGB)					
-						mask = cv2.warpAffine(seg_mask, mat_rev,(frame_w, frame_h))
-					except:
-						seg_mask = occluder.mask(aligned_face) #xseg
-						seg_mask = cv2.cvtColor(seg_mask, cv2.COLOR_GRAY2RGB)					
-						mask = cv2.warpAffine(seg_mask, mat_rev,(frame_w, frame_h))
+					mask = cv2.warpAffine(seg_mask, mat_rev,(frame_w, frame_h))[..., np.newaxis]
+				
+				  # only the occluder and static masks follow the keyframe; the face mask never repeats
+				if args.face_occluder or not args.face_mask:
+					mask_checks += 1
+				if args.face_occluder and occluder_key == track.key[fc]:
+					mask = occluder_mask
+					mask_reused += 1
+				elif args.face_occluder:
+					seg_mask = occluder_masks[track.key[fc]].astype(np.float32) / 255
+					mask = cv2.warpAffine(seg_mask, mat_rev,(frame_w, frame_h))[..., np.newaxis]
+					occluder_key, occluder_mask = track.key[fc], mask
 				  
 				if not args.face_mask and not args.face_occluder:
-					mask = cv2.warpAffine(static_face_mask, mat_rev,(frame_w, frame_h))		
+	          # the same geometry warps the static mask the same way
+					if static_mask_key != track.key[fc]:
+						static_mask_key = track.key[fc]
+						static_mask = cv2.warpAffine(static_face_mask, mat_rev,(frame_w, frame_h))
+					else:
+						mask_reused += 1
+					mask = static_mask
+				mask_timer.stop()
 	
 				if args.sharpen:
 					#smoothed = cv2.GaussianBlur(aligned_face, (9, 9), 10)
@@ -582,31 +1026,37 @@ def main():
 				
 				#cv2.imshow("D",aligned_face)
 				
+				composite_timer = metrics.Timer('composite')
 				dealigned_face =  cv2.warpAffine(aligned_face, mat_rev, (frame_w, frame_h))
 				#cv2.imshow("mask",mask)
 				#cv2.waitKey(1)
 				#mask = cv2.warpAffine(static_face_mask, mat_rev,(frame_w, frame_h))
 				
 				res = (mask * dealigned_face + (1 - mask) * full_frame).astype(np.uint8)
+				composite_timer.stop()
+
+			# a static avatar's closed mouth is rendered once and reused
+			if kind == SILENT:
+				closed_mouth = res
 
 		final = res
 
 		if args.frame_enhancer:
-			final = frame_enhancer.enhance(final)
-			final = cv2.resize(final,(orig_w, orig_h), interpolation=cv2.INTER_AREA)
+			with metrics.span('enhancer'):
+				upscaled = frame_enhancer.enhance(final, out=upscaled)
+			final = cv2.resize(upscaled,(orig_w, orig_h), interpolation=cv2.INTER_AREA)
             
     # fade in/out:
 		if i < 11 and args.fade:
-			final = cv2.convertScaleAbs(final, alpha=0 + (0.1 * bright_in), beta=0)
-			bright_in = bright_in + 1		
+			final = cv2.convertScaleAbs(final, alpha=0.1 * i, beta=0)
 		if i > fade_out and args.fade:
-			final = cv2.convertScaleAbs(final, alpha=1 - (0.1 * bright_out), beta=0)
-			bright_out = bright_out + 1
+			final = cv2.convertScaleAbs(final, alpha=1 - 0.1 * (i - fade_out - 1), beta=0)
 					
-		if args.hq_output:
-			cv2.imwrite(os.path.join('./hq_temp', '{:0>7d}.png'.format(i)), final)
-		else:	
-			out.write(final)
+		with metrics.span('encode'):
+			if args.hq_output and not args.progressive:
+				cv2.imwrite(os.path.join(hq_temp, '{:0>7d}.png'.format(i)), final)
+			else:	
+				out.write(final)
 
 		if args.preview:
 			cv2.imshow("Result - press ESC to stop and save",final)
@@ -624,21 +1074,43 @@ def main():
 				print ('')    
 				print ("Sharpen = " + str(args.sharpen))
 						
-	out.release()
+	with metrics.span('encode'):
+		out.release()
+	metrics.add_frames(last - first, time.perf_counter() - render_started, skipped)
+	metrics.add_reuse('mask', mask_reused, mask_checks)
+	if mask_checks:
+		print(f'Masks reused: {mask_reused} / {mask_checks}')
+	if skipped:
+		print('Frames without lip-sync: ' + ', '.join(f'{n} {kind}' for kind, n in skipped.items()))
+
+	mux_output(fps)
+
+def mux_output(fps):
+	# a segment leaves its video for the run that started it to join
+	if args.segment is not None:
+		if os.path.exists(temp_wav):
+			os.remove(temp_wav)
+		return
 
 	if args.hq_output:
-		 command = 'ffmpeg.exe -y -i ' + '"' + args.audio + '"' + ' -r ' + str(fps) + ' -f image2 -i ' + '"' + './hq_temp/' + '%07d.png' + '"' + ' -shortest -vcodec libx264 -pix_fmt yuv420p -crf 5 -preset slow -acodec libmp3lame -ac 2 -ar 44100 -ab 128000 -strict -2 ' + '"' + args.outfile + '"'
+		 command = 'ffmpeg.exe -y -i ' + '"' + args.audio + '"' + ' -r ' + str(fps) + ' -f image2 -i ' + '"' + os.path.join(hq_temp, '%07d.png') + '"' + ' -shortest -vcodec libx264 -pix_fmt yuv420p -crf 5 -preset slow -acodec libmp3lame -ac 2 -ar 44100 -ab 128000 -strict -2 ' + '"' + args.outfile + '"'
 	else:						
-		command = 'ffmpeg.exe -y -i ' + '"' + args.audio + '"' + ' -i ' + 'temp/temp.mp4' + ' -shortest -vcodec copy -acodec libmp3lame -ac 2 -ar 44100 -ab 128000 -strict -2 ' + '"' + args.outfile + '"'
+		command = 'ffmpeg.exe -y -i ' + '"' + args.audio + '"' + ' -i ' + '"' + temp_video + '"' + ' -shortest -vcodec copy -acodec libmp3lame -ac 2 -ar 44100 -ab 128000 -strict -2 ' + '"' + args.outfile + '"'
 
-	subprocess.call(command, shell=platform.system() != 'Windows')
+	if not args.progressive:
+		with metrics.span('mux'):
+			subprocess.call(command, shell=platform.system() != 'Windows')
 		
-	if os.path.exists('temp/temp.mp4'):
-		os.remove('temp/temp.mp4')
-	if os.path.exists('temp/temp.wav'):
-		os.remove('temp/temp.wav')		
-	if  os.path.exists('hq_temp'):
-		shutil.rmtree('hq_temp')	
+	if os.path.exists(temp_video):
+		os.remove(temp_video)
+	if os.path.exists(temp_wav):
+		os.remove(temp_wav)		
+	if  os.path.exists(hq_temp):
+		shutil.rmtree(hq_temp)	
 
 if __name__ == '__main__':
-	main()
\ No newline at end of file
+	configure()
+	trace = metrics.start(os.path.basename(os.path.abspath(args.workdir)))
+	main()
+	with open(os.path.join(args.workdir, 'trace.json'), 'w') as f:
+		json.dump(trace.to_dict(), f)
\ No newline at end of file
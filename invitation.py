@@ -1,15 +1,16 @@
 import os
-import sys
-import uuid
-import subprocess
 import base64
-import shutil
 
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, RedirectResponse
 from fastapi.staticfiles import StaticFiles
 from dotenv import load_dotenv
-from sarvamai import SarvamAI
+
+import media
+import lipsync
+import metrics
+from jobs import JobManager, QueueFull, DONE
+from upstream import SarvamClient, UpstreamUnavailable
 
 # -------------------------------------------------
 # Load env
@@ -25,18 +26,12 @@ if not SARVAM_API_KEY:
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 INPUTS_DIR = os.path.join(BASE_DIR, "inputs")
-UPLOAD_DIR = os.path.join(BASE_DIR, "uploads")
 TEMP_DIR = os.path.join(BASE_DIR, "temp")
 OUTPUT_DIR = os.path.join(BASE_DIR, "outputs")
 
-AUDIO_OUTPUT = os.path.join(TEMP_DIR, "tts.wav")
-RAW_VIDEO_OUTPUT = os.path.join(OUTPUT_DIR, "invite_raw.mp4")
-FINAL_VIDEO_OUTPUT = os.path.join(OUTPUT_DIR, "invite_final.mp4")
-
-WAV2LIP_SCRIPT = os.path.join(BASE_DIR, "inference_onnxModel.py")
-WAV2LIP_MODEL = os.path.join(BASE_DIR, "checkpoints", "wav2lip_gan.onnx")
+JOB_WORKSPACE_DIR = os.path.join(TEMP_DIR, "jobs")
+JOB_OUTPUT_DIR = os.path.join(OUTPUT_DIR, "jobs")
 
-os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(TEMP_DIR, exist_ok=True)
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
@@ -54,24 +49,28 @@ GENDER_SPEAKER_MAP = {
 app = FastAPI()
 app.mount("/inputs", StaticFiles(directory=INPUTS_DIR), name="inputs")
 
-sarvam_client = SarvamAI(api_subscription_key=SARVAM_API_KEY)
+sarvam_client = SarvamClient(SARVAM_API_KEY)
 
-# -------------------------------------------------
-# Helpers
-# -------------------------------------------------
-def image_to_video(image_path: str, out_path: str, duration: int = 5):
-    subprocess.run([
-        "ffmpeg", "-y",
-        "-loop", "1",
-        "-i", image_path,
-        "-vf",
-        "scale=1280:720:force_original_aspect_ratio=decrease,"
-        "pad=1280:720:(ow-iw)/2:(oh-ih)/2",
-        "-r", "25",
-        "-t", str(duration),
-        "-pix_fmt", "yuv420p",
-        out_path
-    ], check=True)
+job_manager = JobManager(
+    JOB_WORKSPACE_DIR,
+    JOB_OUTPUT_DIR,
+    max_workers=int(os.getenv("JOB_WORKERS", "2")),
+    max_pending=int(os.getenv("JOB_MAX_PENDING", "16"))
+)
+
+@app.on_event("startup")
+def register_gauges():
+    metrics.JOBS_IN_PROGRESS.set_function(job_manager.pending)
+    if lipsync.RENDER_MODE == "queue":
+        metrics.QUEUE_DEPTH.set_function(lambda: lipsync.get_queue().depth())
+
+@app.on_event("shutdown")
+async def close_clients():
+    await sarvam_client.close()
+
+@app.exception_handler(UpstreamUnavailable)
+async def upstream_unavailable(request, exc):
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
 
 # -------------------------------------------------
 # UI
@@ -82,37 +81,38 @@ def index():
         return f.read()
 
 # -------------------------------------------------
-# Video endpoints
+# Jobs
 # -------------------------------------------------
-@app.get("/video")
-def get_video():
-    return FileResponse(
-        FINAL_VIDEO_OUTPUT,
-        media_type="video/mp4",
-        headers={"Cache-Control": "no-store"}
-    )
-
-@app.get("/download")
-def download():
-    return FileResponse(
-        FINAL_VIDEO_OUTPUT,
-        media_type="video/mp4",
-        filename="lip_synced_avatar.mp4",
-        headers={"Content-Disposition": "attachment"}
-    )
+async def run_invitation_job(job, text: str, speaker: str, input_path: str,
+                             progressive: bool = False, profile: bool = False):
+    try:
+        # TTS
+        audio_b64 = await sarvam_client.tts(text, speaker=speaker)
 
-# -------------------------------------------------
-# Generate
-# -------------------------------------------------
-@app.post("/generate")
-def generate(
+        audio_path = os.path.join(job.workspace, "tts.wav")
+        with open(audio_path, "wb") as f:
+            f.write(base64.b64decode(audio_b64))
+
+        # Wav2Lip + encode; image avatars go in as a single letterboxed
+        # frame and the video runs as long as the audio
+        if progressive:
+            job.live = media.open_live(job.output)
+        profile_path = job.enable_profile() if profile else None
+        await lipsync.render_async(input_path, audio_path, job.output, job.workspace,
+                                   progressive=progressive, profile=profile_path)
+    finally:
+        media.release_upload(input_path)
+
+
+@app.post("/jobs", status_code=202)
+async def create_job(
     text: str = Form(...),
     gender: str = Form(...),
     avatar: str = Form(None),
-    video: UploadFile = File(None)
+    video: UploadFile = File(None),
+    progressive: bool = Form(False),
+    profile: bool = Form(False)
 ):
-    uid = str(uuid.uuid4())
-
     gender = gender.lower().strip()
     if gender not in GENDER_SPEAKER_MAP:
         raise HTTPException(status_code=400, detail="gender must be male or female")
@@ -121,59 +121,60 @@ def generate(
 
     # Input selection
     if video and video.filename:
-        ext = os.path.splitext(video.filename)[1].lower()
-        input_path = os.path.join(UPLOAD_DIR, f"{uid}{ext}")
-        with open(input_path, "wb") as f:
-            shutil.copyfileobj(video.file, f)
+        input_path = await media.ingest_upload(video)
     elif avatar:
         input_path = os.path.join(INPUTS_DIR, avatar)
-        ext = os.path.splitext(avatar)[1].lower()
         if not os.path.exists(input_path):
             raise HTTPException(status_code=400, detail="Avatar not found")
     else:
         raise HTTPException(status_code=400, detail="Avatar or video required")
 
-    # Image → video
-    if ext in [".png", ".jpg", ".jpeg"]:
-        video_input = os.path.join(UPLOAD_DIR, f"{uid}_img.mp4")
-        image_to_video(input_path, video_input)
-    else:
-        video_input = input_path
-
-    # TTS
-    tts = sarvam_client.text_to_speech.convert(
-        text=text,
-        speaker=speaker,
-        target_language_code="en-IN"
-    )
-
-    with open(AUDIO_OUTPUT, "wb") as f:
-        f.write(base64.b64decode(tts.audios[0]))
-
-    # Wav2Lip
-    subprocess.run([
-        sys.executable,
-        WAV2LIP_SCRIPT,
-        "--checkpoint_path", WAV2LIP_MODEL,
-        "--face", video_input,
-        "--audio", AUDIO_OUTPUT,
-        "--outfile", RAW_VIDEO_OUTPUT
-    ], check=True)
-
-    # Encode
-    subprocess.run([
-        "ffmpeg", "-y",
-        "-i", RAW_VIDEO_OUTPUT,
-        "-c:v", "libx264",
-        "-pix_fmt", "yuv420p",
-        "-profile:v", "baseline",
-        "-level", "3.0",
-        "-c:a", "aac",
-        "-movflags", "+faststart",
-        FINAL_VIDEO_OUTPUT
-    ], check=True)
-
-    return {"status": "done"}
+    try:
+        job = job_manager.submit(run_invitation_job, text, speaker, input_path, progressive, profile)
+    except QueueFull as e:
+        media.release_upload(input_path)
+        raise HTTPException(status_code=503, detail=str(e))
+    return job.to_dict()
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@app.get("/jobs/{job_id}/video")
+async def job_video(job_id: str, download: bool = False):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status != DONE:
+        return JSONResponse(status_code=409, content=job.to_dict())
+
+    url = job.video_url + ("?download=1" if download else "")
+    return RedirectResponse(url, status_code=307)
+
+@app.get("/jobs/{job_id}/profile")
+async def job_profile(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None or not job.profile or not os.path.exists(job.profile):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(job.profile, media_type="application/json", filename=f"{job_id}.trace.json")
+
+# -------------------------------------------------
+# Media
+# -------------------------------------------------
+@app.api_route("/media/{name}", methods=["GET", "HEAD"])
+def media_video(request: Request, name: str, download: bool = False):
+    return media.serve_media(request, name, filename="lip_synced_avatar.mp4" if download else None)
+
+@app.get("/live/{token}")
+async def live_video(token: str):
+    return media.serve_live(token)
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return metrics.metrics_response()
 
 @app.get("/favicon.ico")
 def favicon():
@@ -0,0 +1,143 @@
+import os
+import time
+import uuid
+import shutil
+import asyncio
+import tempfile
+
+import media
+import metrics
+
+# -------------------------------------------------
+# Job states
+# -------------------------------------------------
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, job_id: str, output: str):
+        self.id = job_id
+        self.status = QUEUED
+        self.error = None
+        self.output = output
+        self.workspace = None
+        self.video_url = None
+        self.live = None
+        self.profile = None
+        self.memory = None
+        self.frames_skipped = None
+        self.reuse = None
+        self.created = time.time()
+        self.finished = None
+
+    def enable_profile(self) -> str:
+        """Profile this job's render; the Chrome trace is kept next to its output."""
+        self.profile = os.path.splitext(self.output)[0] + ".trace.json"
+        return self.profile
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "error": self.error,
+            "video_url": self.video_url,
+            "live_url": self.live.live_url if self.live is not None else None,
+            "profile_url": f"/jobs/{self.id}/profile" if self.profile and os.path.exists(self.profile) else None,
+            "memory": self.memory,
+            "frames_skipped": self.frames_skipped,
+            "reuse": self.reuse,
+            "created": self.created,
+            "finished": self.finished
+        }
+
+
+# -------------------------------------------------
+# Job manager
+# -------------------------------------------------
+class JobManager:
+    """
+    Runs job coroutines on the event loop, at most `max_workers` at a time.
+
+    Each job gets its own workspace directory under `workspace_root`
+    which is removed as soon as the job finishes; the final video is
+    published to the content-addressed media store. Job records are kept
+    for `ttl` seconds, the published videos for media.MEDIA_TTL.
+    """
+
+    def __init__(self, workspace_root: str, output_dir: str, max_workers: int = 2,
+                 max_pending: int = 16, ttl: float = 3600):
+        self.workspace_root = workspace_root
+        self.output_dir = output_dir
+        self.max_pending = max_pending
+        self.ttl = ttl
+
+        os.makedirs(workspace_root, exist_ok=True)
+        os.makedirs(output_dir, exist_ok=True)
+
+        self._slots = asyncio.Semaphore(max_workers)
+        self._jobs = {}
+        self._tasks = set()
+
+    def submit(self, fn, *args, **kwargs) -> Job:
+        """Schedule `await fn(job, *args, **kwargs)` and return immediately."""
+        self.prune()
+
+        if self.pending() >= self.max_pending:
+            raise QueueFull("Too many jobs in progress, try again later")
+
+        job_id = uuid.uuid4().hex
+        job = Job(job_id, os.path.join(self.output_dir, f"{job_id}.mp4"))
+        self._jobs[job_id] = job
+
+        task = asyncio.get_running_loop().create_task(self._run(job, fn, args, kwargs))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    def get(self, job_id: str):
+        return self._jobs.get(job_id)
+
+    def pending(self) -> int:
+        return sum(1 for j in self._jobs.values() if j.status in (QUEUED, RUNNING))
+
+    def prune(self):
+        """Forget finished jobs older than the ttl and delete their videos."""
+        now = time.time()
+        expired = [j for j in self._jobs.values()
+                   if j.finished is not None and now - j.finished > self.ttl]
+        for job in expired:
+            del self._jobs[job.id]
+            if job.profile and os.path.exists(job.profile):
+                os.remove(job.profile)
+
+        media.prune(self.ttl)
+
+    async def _run(self, job: Job, fn, args, kwargs):
+        trace = metrics.start(job.id)
+        async with self._slots:
+            job.status = RUNNING
+            job.workspace = tempfile.mkdtemp(prefix=f"{job.id}_", dir=self.workspace_root)
+            try:
+                await fn(job, *args, **kwargs)
+                job.video_url = await asyncio.to_thread(media.publish, job.output, job.live)
+                job.status = DONE
+            except Exception as e:
+                job.error = str(e) or type(e).__name__
+                job.status = FAILED
+            finally:
+                if job.live is not None:
+                    media.close_live(job.live, job.video_url)
+                shutil.rmtree(job.workspace, ignore_errors=True)
+                job.finished = time.time()
+                job.memory = trace.memory()
+                job.frames_skipped = trace.frames_skipped
+                job.reuse = trace.reuse_ratios()
+                metrics.JOB_SECONDS.labels(job.status).observe(job.finished - job.created)
+                trace.observe()
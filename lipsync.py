@@ -0,0 +1,213 @@
+import os
+import sys
+import json
+import asyncio
+import subprocess
+
+import metrics
+from render_queue import open_queue, DONE, FAILED
+
+# -------------------------------------------------
+# Paths
+# -------------------------------------------------
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+WAV2LIP_SCRIPT = os.path.join(BASE_DIR, "inference_onnxModel.py")
+WAV2LIP_MODEL = os.path.join(BASE_DIR, "checkpoints", "wav2lip_gan.onnx")
+
+# image avatars are letterboxed to this frame size by the inference script
+INPUTS_DIR = os.path.join(BASE_DIR, "inputs")
+IMAGE_FRAME_SIZE = "1280x720"
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+# -------------------------------------------------
+# Render backend
+# -------------------------------------------------
+# "queue": enqueue and let worker.py processes render (default)
+# "local": run the inference script as a subprocess of the web app
+RENDER_MODE = os.getenv("RENDER_MODE", "queue")
+RENDER_QUEUE = os.getenv(
+    "RENDER_QUEUE",
+    "sqlite:///" + os.path.join(BASE_DIR, "temp", "render_queue.db")
+)
+
+# seconds a queued render may wait for a worker to claim it before it
+# fails, e.g. because no worker.py is running (0: wait forever)
+RENDER_QUEUE_TIMEOUT = float(os.getenv("RENDER_QUEUE_TIMEOUT", "300"))
+
+# per-job limit on the renderer's RSS in MB (0: none), and what to do
+# when a job goes over it: "abort" or "degrade" (see memory.py)
+RENDER_MEMORY_BUDGET_MB = float(os.getenv("RENDER_MEMORY_BUDGET_MB", "0"))
+RENDER_MEMORY_POLICY = os.getenv("RENDER_MEMORY_POLICY", "abort")
+
+# processes that analyse the faces of a video avatar in parallel, one
+# frame range each, and intra-op threads per process (see face_analysis.py)
+RENDER_FACE_WORKERS = int(os.getenv("RENDER_FACE_WORKERS", "0"))
+RENDER_FACE_THREADS = int(os.getenv("RENDER_FACE_THREADS", "1"))
+
+# segments a render is split into, each rendered by its own process and
+# joined without re-encoding (0: one pass); not for progressive renders
+RENDER_SEGMENTS = int(os.getenv("RENDER_SEGMENTS", "0"))
+
+_queue = None
+
+
+def is_image(path: str) -> bool:
+    return os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS
+
+
+def bundled_avatars() -> list:
+    """The image avatars shipped in inputs/."""
+    return sorted(
+        os.path.join(INPUTS_DIR, name) for name in os.listdir(INPUTS_DIR) if is_image(name)
+    ) if os.path.isdir(INPUTS_DIR) else []
+
+
+def get_queue():
+    global _queue
+    if _queue is None:
+        _queue = open_queue(RENDER_QUEUE)
+    return _queue
+
+# -------------------------------------------------
+# Rendering
+# -------------------------------------------------
+def encode_for_browser(raw_path: str, final_path: str):
+    subprocess.run([
+        "ffmpeg", "-y",
+        "-i", raw_path,
+        "-c:v", "libx264",
+        "-pix_fmt", "yuv420p",
+        "-profile:v", "baseline",
+        "-level", "3.0",
+        "-c:a", "aac",
+        "-movflags", "+faststart",
+        final_path
+    ], check=True)
+
+
+def raw_output_path(spec: dict) -> str:
+    # progressive renders are encoded for the browser while the frames come in
+    if spec.get("progressive"):
+        return spec["output"]
+    return os.path.join(spec["workdir"], "result_raw.mp4")
+
+
+def render_argv(spec: dict) -> list:
+    """Command line for inference_onnxModel.py that renders `spec`."""
+    argv = [
+        "--checkpoint_path", WAV2LIP_MODEL,
+        "--face", spec["face"],
+        "--audio", spec["audio"],
+        "--outfile", raw_output_path(spec),
+        "--workdir", spec["workdir"],
+        "--frame_offset", str(spec.get("frame_offset", 0))
+    ]
+    if is_image(spec["face"]):
+        argv += ["--letterbox", IMAGE_FRAME_SIZE]
+    elif RENDER_FACE_WORKERS > 1:
+        argv += ["--face_workers", str(RENDER_FACE_WORKERS), "--face_threads", str(RENDER_FACE_THREADS)]
+    if spec.get("progressive"):
+        argv.append("--progressive")
+    elif RENDER_SEGMENTS > 1:
+        argv += ["--segments", str(RENDER_SEGMENTS)]
+    if spec.get("profile"):
+        argv += ["--profile", "--profile_path", spec["profile"]]
+    if spec.get("memory_budget"):
+        argv += ["--memory_budget", str(spec["memory_budget"]), "--memory_policy", spec["memory_policy"]]
+    return argv
+
+
+def trace_path(spec: dict) -> str:
+    # written by the inference script when it runs as a subprocess
+    return os.path.join(spec["workdir"], "trace.json")
+
+
+def finish_output(spec: dict):
+    """Turn the inference script's output into the final browser-playable file."""
+    if not spec.get("progressive"):
+        with metrics.span("encode"):
+            encode_for_browser(raw_output_path(spec), spec["output"])
+
+
+def merge_trace(result: dict):
+    trace = metrics.current()
+    if trace is not None and result:
+        trace.merge(result)
+
+
+def render_local(spec: dict):
+    subprocess.run(
+        [sys.executable, WAV2LIP_SCRIPT] + render_argv(spec),
+        check=True,
+        cwd=BASE_DIR
+    )
+    if os.path.exists(trace_path(spec)):
+        with open(trace_path(spec)) as f:
+            merge_trace(json.load(f))
+    finish_output(spec)
+
+
+def render_spec(face: str, audio_path: str, final_path: str, workdir: str, frame_offset: int = 0,
+                progressive: bool = False, profile: str = None) -> dict:
+    trace = metrics.current()
+    return {
+        "face": os.path.abspath(face),
+        "audio": os.path.abspath(audio_path),
+        "output": os.path.abspath(final_path),
+        "workdir": os.path.abspath(workdir),
+        "frame_offset": frame_offset,
+        "progressive": progressive,
+        "profile": os.path.abspath(profile) if profile else None,
+        "memory_budget": RENDER_MEMORY_BUDGET_MB,
+        "memory_policy": RENDER_MEMORY_POLICY,
+        "trace_id": trace.job_id if trace is not None else None
+    }
+
+
+def render(face: str, audio_path: str, final_path: str, workdir: str, frame_offset: int = 0,
+           progressive: bool = False, profile: str = None):
+    """
+    Lip-sync `face` to `audio_path` and write a browser-playable mp4.
+
+    Every intermediate file (extracted audio, raw frames, mux output)
+    lives in `workdir`, so concurrent renders never share a path.
+
+    With `progressive`, `final_path` is a fragmented mp4 that grows while
+    frames are rendered and can be streamed before the render finishes.
+    With `profile`, a Chrome trace of the render is written to that path.
+    """
+    spec = render_spec(face, audio_path, final_path, workdir, frame_offset, progressive, profile)
+
+    if RENDER_MODE == "local":
+        render_local(spec)
+        return
+
+    queue = get_queue()
+    job = queue.wait(queue.put(spec), queue_timeout=RENDER_QUEUE_TIMEOUT)
+    merge_trace(job["result"])
+    if job["status"] == FAILED:
+        raise RuntimeError(job["error"] or "render failed")
+
+
+async def render_async(face: str, audio_path: str, final_path: str, workdir: str, frame_offset: int = 0,
+                       progressive: bool = False, profile: str = None, poll: float = 0.25):
+    """render() for the web apps: waits on the queue without holding a thread."""
+    spec = render_spec(face, audio_path, final_path, workdir, frame_offset, progressive, profile)
+
+    if RENDER_MODE == "local":
+        await asyncio.to_thread(render_local, spec)
+        return
+
+    # the queue is a SQLite file: a locked or slow database must not stall the event loop
+    queue = await asyncio.to_thread(get_queue)
+    job_id = await asyncio.to_thread(queue.put, spec)
+    while True:
+        job = await asyncio.to_thread(queue.check, job_id, RENDER_QUEUE_TIMEOUT)
+        if job["status"] in (DONE, FAILED):
+            merge_trace(job["result"])
+        if job["status"] == FAILED:
+            raise RuntimeError(job["error"] or "render failed")
+        if job["status"] == DONE:
+            return
+        await asyncio.sleep(poll)
@@ -0,0 +1,381 @@
+import os
+import re
+import time
+import uuid
+import asyncio
+import shutil
+import hashlib
+
+from fastapi import HTTPException, Request
+from fastapi.responses import RedirectResponse, Response, StreamingResponse
+
+# -------------------------------------------------
+# Paths
+# -------------------------------------------------
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MEDIA_DIR = os.path.join(BASE_DIR, "outputs", "media")
+UPLOAD_DIR = os.path.join(BASE_DIR, "uploads")
+
+os.makedirs(MEDIA_DIR, exist_ok=True)
+os.makedirs(UPLOAD_DIR, exist_ok=True)
+
+CHUNK_SIZE = 256 * 1024
+
+# published videos outlive the job records that point at them, so links
+# and caches keep working; nothing may cache them longer than they are kept
+MEDIA_TTL = float(os.getenv("MEDIA_TTL", str(7 * 86400)))
+
+IMMUTABLE = f"public, max-age={int(MEDIA_TTL)}, immutable"
+LONG_LIVED = "public, max-age=86400"
+
+MEDIA_NAME = re.compile(r"[0-9a-f]{32}\.mp4")
+RANGE = re.compile(r"bytes=(\d*)-(\d*)$")
+
+# -------------------------------------------------
+# Content-addressed store
+# -------------------------------------------------
+def file_hash(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            h.update(chunk)
+    return h.hexdigest()[:32]
+
+
+def publish(path: str, live=None) -> str:
+    """
+    Move a finished video into the media store under its content hash
+    and return its URL. The URL never changes meaning, so it is served
+    as immutable.
+
+    With the LiveVideo still streaming `path`, its URL is pointed at the
+    stored copy before `path` goes away, so a request for the live URL
+    finds the video in one place or the other at every moment.
+    """
+    name = file_hash(path) + ".mp4"
+    target = os.path.join(MEDIA_DIR, name)
+    url = "/media/" + name
+    if live is None:
+        os.replace(path, target)
+        return url
+
+    if os.path.exists(target):
+        # the same video again: it is kept for MEDIA_TTL from now
+        os.utime(target)
+    else:
+        try:
+            os.link(path, target)
+        except OSError:
+            partial = os.path.join(MEDIA_DIR, f".{uuid.uuid4().hex}.part")
+            shutil.copyfile(path, partial)
+            os.replace(partial, target)
+    live.url = url
+    os.remove(path)
+    return url
+
+
+def media_path(name: str) -> str:
+    if not MEDIA_NAME.fullmatch(name):
+        raise HTTPException(status_code=404, detail="Not found")
+    path = os.path.join(MEDIA_DIR, name)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Not found")
+    return path
+
+
+def prune(ttl: float):
+    """Forget live videos and uploads older than `ttl`, published media older than MEDIA_TTL."""
+    media_cutoff = time.time() - max(ttl, MEDIA_TTL)
+    for name in os.listdir(MEDIA_DIR):
+        path = os.path.join(MEDIA_DIR, name)
+        if os.path.getmtime(path) < media_cutoff:
+            os.remove(path)
+
+    cutoff = time.time() - ttl
+
+    for token, live in list(_live.items()):
+        if live.finished is not None and live.finished < cutoff:
+            del _live[token]
+
+    prune_uploads(ttl)
+
+
+class MemoryAsset:
+    """A small static video kept in memory, e.g. the welcome/idle loops."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self.data = f.read()
+        self.etag = hashlib.sha256(self.data).hexdigest()[:32]
+
+# -------------------------------------------------
+# Uploads
+#
+# Uploaded videos are stored once per content hash, so re-submitting a
+# clip reuses the stored file (and anything cached for its path, like
+# the engine's face analysis). Jobs hold a reference while they run;
+# unreferenced uploads expire with the job ttl.
+# -------------------------------------------------
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+UPLOAD_MAX_BYTES = int(float(os.getenv("UPLOAD_MAX_MB", "200")) * 1024 * 1024)
+UPLOAD_MAX_SECONDS = float(os.getenv("UPLOAD_MAX_SECONDS", "120"))
+
+# probe the partial file once this much has arrived, so an overlong clip
+# with its index up front is rejected before the rest is uploaded
+UPLOAD_PROBE_AFTER = 4 * 1024 * 1024
+
+# still images have no duration to check
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+_upload_refs = {}
+_upload_used = {}
+
+
+async def probe_duration(path: str):
+    """Duration in seconds from ffprobe, None if it cannot tell (yet)."""
+    proc = await asyncio.create_subprocess_exec(
+        "ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "default=nw=1:nk=1", path,
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+    )
+    out, _ = await proc.communicate()
+    try:
+        return float(out.decode().strip())
+    except ValueError:
+        return None
+
+
+def _check_duration(duration):
+    if duration is not None and duration > UPLOAD_MAX_SECONDS:
+        raise HTTPException(status_code=413, detail=f"Video longer than {UPLOAD_MAX_SECONDS:g} seconds")
+
+
+async def ingest_upload(upload) -> str:
+    """
+    Stream an UploadFile into the upload store, hashing as it is written,
+    and return the stored path with a reference held for the caller
+    (give it back with release_upload()).
+    """
+    ext = os.path.splitext(upload.filename or "")[1].lower()
+    partial = os.path.join(UPLOAD_DIR, f".{uuid.uuid4().hex}{ext}.part")
+    h = hashlib.sha256()
+    size = 0
+    probed = ext in IMAGE_EXTENSIONS
+    try:
+        with open(partial, "wb") as f:
+            while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > UPLOAD_MAX_BYTES:
+                    raise HTTPException(status_code=413, detail=f"Upload larger than {UPLOAD_MAX_BYTES // (1024 * 1024)} MB")
+                h.update(chunk)
+                f.write(chunk)
+                if not probed and size >= UPLOAD_PROBE_AFTER:
+                    probed = True
+                    f.flush()
+                    _check_duration(await probe_duration(partial))
+
+        if ext not in IMAGE_EXTENSIONS:
+            duration = await probe_duration(partial)
+            if duration is None:
+                raise HTTPException(status_code=400, detail="Upload is not a readable video")
+            _check_duration(duration)
+
+        name = h.hexdigest()[:32] + ext
+        path = os.path.join(UPLOAD_DIR, name)
+        if os.path.exists(path):
+            os.remove(partial)
+        else:
+            os.replace(partial, path)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+
+    _upload_refs[name] = _upload_refs.get(name, 0) + 1
+    _upload_used[name] = time.time()
+    return path
+
+
+def release_upload(path: str):
+    """Drop a reference taken by ingest_upload(); other paths are ignored."""
+    name = os.path.basename(path)
+    if os.path.dirname(os.path.abspath(path)) != UPLOAD_DIR or name not in _upload_refs:
+        return
+    _upload_refs[name] -= 1
+    _upload_used[name] = time.time()
+    if _upload_refs[name] <= 0:
+        del _upload_refs[name]
+
+
+def prune_uploads(ttl: float):
+    cutoff = time.time() - ttl
+    for name in os.listdir(UPLOAD_DIR):
+        if name in _upload_refs:
+            continue
+        path = os.path.join(UPLOAD_DIR, name)
+        # files from before a restart expire by their modification time
+        if _upload_used.get(name, os.path.getmtime(path)) < cutoff:
+            os.remove(path)
+            _upload_used.pop(name, None)
+
+# -------------------------------------------------
+# Live videos
+# -------------------------------------------------
+LIVE_POLL = 0.1
+
+
+class LiveVideo:
+    """
+    A progressive (fragmented) mp4 that a renderer is still writing.
+
+    Readers follow the file as it grows until close_live() is called;
+    afterwards the live URL redirects to the published media URL.
+    """
+
+    def __init__(self, path: str):
+        self.token = uuid.uuid4().hex
+        self.path = path
+        self.url = None
+        self.finished = None
+
+    @property
+    def live_url(self) -> str:
+        return "/live/" + self.token
+
+
+_live = {}
+
+
+def open_live(path: str) -> LiveVideo:
+    live = LiveVideo(path)
+    _live[live.token] = live
+    return live
+
+
+def close_live(live: LiveVideo, url: str = None):
+    """Mark the render finished; `url` is where the video was published, if it succeeded."""
+    live.url = url
+    live.finished = time.time()
+
+
+async def _live_chunks(live: LiveVideo):
+    while not os.path.exists(live.path):
+        if live.finished is not None:
+            return
+        await asyncio.sleep(LIVE_POLL)
+
+    # the handle stays valid when publish() moves the file into the store
+    with open(live.path, "rb") as f:
+        while True:
+            done = live.finished is not None
+            chunk = f.read(CHUNK_SIZE)
+            if chunk:
+                yield chunk
+            elif done:
+                return
+            else:
+                await asyncio.sleep(LIVE_POLL)
+
+
+def serve_live(token: str):
+    live = _live.get(token)
+    if live is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    if live.url is not None:
+        return RedirectResponse(live.url, status_code=307)
+    if live.finished is not None:
+        raise HTTPException(status_code=404, detail="Render failed")
+
+    # no Content-Length: sent with chunked transfer encoding while it grows
+    return StreamingResponse(_live_chunks(live), media_type="video/mp4", headers={"Cache-Control": "no-store"})
+
+# -------------------------------------------------
+# Responses
+# -------------------------------------------------
+def parse_range(header: str, size: int):
+    """Return (start, end) inclusive for a single byte range, None to ignore it."""
+    match = RANGE.match(header.strip())
+    if match is None:
+        return None
+
+    first, last = match.groups()
+    if first == "" and last == "":
+        return None
+    if first == "":
+        length = int(last)
+        if length == 0:
+            raise HTTPException(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+        return max(0, size - length), size - 1
+
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise HTTPException(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+
+def not_modified(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if header is None:
+        return False
+    return header.strip() == "*" or etag in [t.strip() for t in header.split(",")]
+
+
+def _file_chunks(path: str, start: int, length: int):
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def video_response(request: Request, etag: str, cache_control: str, path: str = None, data: bytes = None,
+                   filename: str = None):
+    """
+    Serve a video from `path` or from in-memory `data` with a strong
+    ETag, conditional GET (304) and single byte-range (206) support.
+    """
+    etag = f'"{etag}"'
+    size = len(data) if data is not None else os.path.getsize(path)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": cache_control,
+        "Accept-Ranges": "bytes"
+    }
+    if filename:
+        headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+
+    if not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    start, end = 0, size - 1
+    status = 200
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and size > 0 and (if_range is None or if_range.strip() == etag):
+        byte_range = parse_range(range_header, size)
+        if byte_range is not None:
+            start, end = byte_range
+            status = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+    length = end - start + 1 if size > 0 else 0
+    headers["Content-Length"] = str(length)
+
+    if request.method == "HEAD":
+        return Response(status_code=status, headers=headers, media_type="video/mp4")
+    if data is not None:
+        return Response(data[start:end + 1], status_code=status, headers=headers, media_type="video/mp4")
+    return StreamingResponse(_file_chunks(path, start, length), status_code=status, headers=headers,
+                             media_type="video/mp4")
+
+
+def serve_media(request: Request, name: str, filename: str = None):
+    path = media_path(name)
+    return video_response(request, name[:-4], IMMUTABLE, path=path, filename=filename)
+
+
+def serve_asset(request: Request, asset: MemoryAsset):
+    return video_response(request, asset.etag, LONG_LIVED, data=asset.data)
@@ -0,0 +1,126 @@
+import os
+import threading
+import tracemalloc
+
+import metrics
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# -------------------------------------------------
+# Per-job memory accounting and budget
+#
+# A sampler thread records the renderer's RSS against the pipeline stage
+# (from the metrics spans) that is running, so every job reports its
+# high-water mark per stage. With allocation tracking on, tracemalloc
+# (which also sees NumPy buffers) adds each stage's peak allocation.
+#
+# The budget is checked at safe points in the engine: "abort" fails the
+# job with MemoryBudgetExceeded, "degrade" first sheds optional work.
+# Freed memory rarely shows up in RSS right away, so after shedding the
+# hard limit becomes the RSS at that point: the job may go on as long as
+# it stops growing.
+# -------------------------------------------------
+SAMPLE_INTERVAL = 0.02
+MB = 1024 * 1024
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+class MemoryBudgetExceeded(RuntimeError):
+    pass
+
+
+def rss_bytes() -> int:
+    """Resident set size of this process."""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except OSError:
+        return 0
+
+
+def available_bytes() -> int:
+    """Memory the host can still hand out without swapping, 0 if unknown."""
+    if psutil is not None:
+        return psutil.virtual_memory().available
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+class MemoryMonitor:
+    """
+    Samples RSS into the current trace until stop(). `budget_mb` of 0
+    means no budget; the budget is on the whole process, so it includes
+    the models a worker keeps loaded.
+    """
+
+    def __init__(self, budget_mb: float = 0, policy: str = "abort", track_allocations: bool = False,
+                 job_id: str = None):
+        self.budget = int(budget_mb * MB) if budget_mb else None
+        # what the process holds before the job reads anything: the loaded models
+        self.baseline = rss_bytes()
+        self.limit = self.budget
+        self.policy = policy
+
+        self.trace = metrics.current() or metrics.start(job_id or "render")
+        self.track_allocations = track_allocations and not tracemalloc.is_tracing()
+        if self.track_allocations:
+            tracemalloc.start()
+            self.trace.track_allocations = True
+
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._sampler.start()
+
+    def _sample(self):
+        while not self._stop.wait(SAMPLE_INTERVAL):
+            self.trace.record_rss(rss_bytes())
+
+    def over_budget(self) -> bool:
+        return self.budget is not None and rss_bytes() > self.budget
+
+    def check(self):
+        """Raise MemoryBudgetExceeded if the process is over budget."""
+        if self.limit is None:
+            return
+        rss = rss_bytes()
+        if rss > self.limit:
+            raise MemoryBudgetExceeded(
+                f"Job exceeded its memory budget: {rss / MB:.0f} MB > {self.budget / MB:.0f} MB"
+                + (f" (stage {self.trace.stage})" if self.trace.stage else "")
+            )
+
+    def degrade(self, what: str) -> bool:
+        """
+        True if the caller should drop `what` to get back under budget.
+        Under the "abort" policy an exceeded budget raises instead.
+        """
+        if not self.over_budget():
+            return False
+        if self.policy != "degrade":
+            self.check()
+            return False
+        rss = rss_bytes()
+        print(f"Memory budget exceeded ({rss / MB:.0f} MB), dropping {what}")
+        self.trace.degraded.append(what)
+        self.limit = max(self.limit, rss)
+        return True
+
+    def stop(self):
+        self._stop.set()
+        self._sampler.join()
+        self.trace.record_rss(rss_bytes())
+        if self.track_allocations:
+            self.trace.track_allocations = False
+            tracemalloc.stop()
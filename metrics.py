@@ -0,0 +1,263 @@
+import json
+import time
+import tracemalloc
+import contextvars
+from contextlib import contextmanager
+
+from fastapi.responses import Response
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+# -------------------------------------------------
+# Prometheus metrics
+# -------------------------------------------------
+STAGES = (
+    "llm", "tts", "audio", "denoise", "mel", "decode", "detection", "recognition",
+    "alignment", "wav2lip", "enhancer", "mask", "composite", "encode", "mux"
+)
+
+STAGE_SECONDS = Histogram(
+    "avatar_stage_seconds",
+    "Time one job spent in a pipeline stage",
+    ["stage"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+)
+JOB_SECONDS = Histogram(
+    "avatar_job_seconds",
+    "End-to-end job latency",
+    ["status"],
+    buckets=(0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+)
+RENDER_FPS = Histogram(
+    "avatar_render_fps",
+    "Frames per second of each render",
+    buckets=(1, 2, 5, 10, 15, 20, 25, 30, 40, 60, 100)
+)
+STAGE_PEAK_RSS = Histogram(
+    "avatar_stage_peak_rss_bytes",
+    "Highest renderer RSS seen while a job was in a pipeline stage",
+    ["stage"],
+    buckets=[mb * 1024 * 1024 for mb in (256, 512, 1024, 2048, 3072, 4096, 6144, 8192, 12288, 16384, 32768)]
+)
+FRAMES = Counter("avatar_frames_rendered_total", "Video frames rendered")
+FRAMES_SKIPPED = Counter(
+    "avatar_frames_skipped_total",
+    "Video frames that skipped the face pipeline, by reason",
+    ["reason"]
+)
+REUSE = Counter(
+    "avatar_reuse_total",
+    "Per-frame results reused from an earlier frame or computed, by kind",
+    ["kind", "result"]
+)
+BATCH_SIZE = Histogram(
+    "avatar_batch_size",
+    "Rows per micro-batch run for concurrent jobs, by model",
+    ["model"],
+    buckets=(1, 2, 3, 4, 6, 8, 12, 16, 32)
+)
+BATCH_WAIT = Histogram(
+    "avatar_batch_wait_seconds",
+    "Time a request waited for its micro-batch to start, by model",
+    ["model"],
+    buckets=(0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1)
+)
+QUEUE_DEPTH = Gauge("avatar_render_queue_depth", "Renders waiting for a worker")
+JOBS_IN_PROGRESS = Gauge("avatar_jobs_in_progress", "Jobs queued or running in this web process")
+
+# export every stage from the first scrape on, not only once it was seen
+for stage in STAGES:
+    STAGE_SECONDS.labels(stage)
+
+# -------------------------------------------------
+# Per-job traces
+# -------------------------------------------------
+class Trace:
+    """
+    Timing spans of one job. A stage entered many times (e.g. once per
+    frame) adds up to a single span, so every stage is one number per job.
+    """
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.spans = {}
+        self.frames = 0
+        self.frames_skipped = {}
+        self.reuse = {}
+        self.render_seconds = 0.
+
+        # (stage, start_ns, end_ns) of every span, only kept while profiling
+        self.events = None
+
+        # memory accounting, filled in by memory.MemoryMonitor
+        self.stage = None
+        self.rss_peaks = {}
+        self.alloc_peaks = {}
+        self.track_allocations = False
+        self.degraded = []
+
+    def enter(self, stage: str):
+        previous = self.stage
+        self.stage = stage
+        if self.track_allocations:
+            tracemalloc.reset_peak()
+        return previous
+
+    def leave(self, stage: str, previous):
+        if self.track_allocations:
+            peak = tracemalloc.get_traced_memory()[1]
+            self.alloc_peaks[stage] = max(self.alloc_peaks.get(stage, 0), peak)
+        self.stage = previous
+
+    def record_rss(self, rss: int):
+        stage = self.stage or "other"
+        self.rss_peaks[stage] = max(self.rss_peaks.get(stage, 0), rss)
+
+    def memory(self) -> dict:
+        if not self.rss_peaks and not self.alloc_peaks:
+            return None
+        mb = 1024 * 1024
+        return {
+            "peak_rss_mb": round(max(self.rss_peaks.values(), default=0) / mb, 1),
+            "stages": {
+                stage: {
+                    "rss_peak_mb": round(self.rss_peaks[stage] / mb, 1) if stage in self.rss_peaks else None,
+                    "alloc_peak_mb": round(self.alloc_peaks[stage] / mb, 1) if stage in self.alloc_peaks else None
+                }
+                for stage in sorted(set(self.rss_peaks) | set(self.alloc_peaks))
+            },
+            "degraded": self.degraded
+        }
+
+    def add(self, stage: str, seconds: float, started_ns: int = None):
+        self.spans[stage] = self.spans.get(stage, 0.) + seconds
+        if self.events is not None and started_ns is not None:
+            self.events.append((stage, started_ns, started_ns + int(seconds * 1e9)))
+
+    def merge(self, data: dict):
+        """Add the spans of a render that ran in another process."""
+        for stage, seconds in data.get("spans", {}).items():
+            self.add(stage, seconds)
+        self.frames += data.get("frames", 0)
+        for reason, count in data.get("frames_skipped", {}).items():
+            self.frames_skipped[reason] = self.frames_skipped.get(reason, 0) + count
+        for kind, counts in data.get("reuse", {}).items():
+            self.add_reuse(kind, counts["reused"], counts["total"])
+        self.render_seconds += data.get("render_seconds", 0.)
+
+        memory = data.get("memory") or {}
+        for stage, peaks in memory.get("stages", {}).items():
+            if peaks["rss_peak_mb"] is not None:
+                rss = int(peaks["rss_peak_mb"] * 1024 * 1024)
+                self.rss_peaks[stage] = max(self.rss_peaks.get(stage, 0), rss)
+            if peaks["alloc_peak_mb"] is not None:
+                alloc = int(peaks["alloc_peak_mb"] * 1024 * 1024)
+                self.alloc_peaks[stage] = max(self.alloc_peaks.get(stage, 0), alloc)
+        self.degraded += memory.get("degraded", [])
+
+    def add_reuse(self, kind: str, reused: int, total: int):
+        counts = self.reuse.setdefault(kind, {"reused": 0, "total": 0})
+        counts["reused"] += reused
+        counts["total"] += total
+
+    def reuse_ratios(self) -> dict:
+        return {
+            kind: dict(counts, ratio=round(counts["reused"] / counts["total"], 3) if counts["total"] else None)
+            for kind, counts in self.reuse.items()
+        }
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "spans": self.spans,
+            "frames": self.frames,
+            "frames_skipped": self.frames_skipped,
+            "reuse": self.reuse_ratios(),
+            "render_seconds": self.render_seconds,
+            "memory": self.memory()
+        }
+
+    def observe(self):
+        """Record the trace in the histograms and log it as one JSON line."""
+        for stage, seconds in self.spans.items():
+            STAGE_SECONDS.labels(stage).observe(seconds)
+        for stage, rss in self.rss_peaks.items():
+            STAGE_PEAK_RSS.labels(stage).observe(rss)
+        if self.frames:
+            FRAMES.inc(self.frames)
+        for reason, count in self.frames_skipped.items():
+            FRAMES_SKIPPED.labels(reason).inc(count)
+        for kind, counts in self.reuse.items():
+            REUSE.labels(kind, "reused").inc(counts["reused"])
+            REUSE.labels(kind, "computed").inc(counts["total"] - counts["reused"])
+        if self.frames and self.render_seconds > 0:
+            RENDER_FPS.observe(self.frames / self.render_seconds)
+        print(json.dumps({"event": "trace", **self.to_dict()}), flush=True)
+
+
+_current = contextvars.ContextVar("trace", default=None)
+
+
+def start(job_id: str) -> Trace:
+    """Start a trace for `job_id` in the current task/thread context."""
+    trace = Trace(job_id)
+    _current.set(trace)
+    return trace
+
+
+def current():
+    return _current.get()
+
+
+def add(stage: str, seconds: float, started_ns: int = None):
+    """Add to a span of the current trace, if there is one."""
+    trace = _current.get()
+    if trace is not None:
+        trace.add(stage, seconds, started_ns)
+
+
+@contextmanager
+def span(stage: str):
+    timer = Timer(stage)
+    try:
+        yield
+    finally:
+        timer.stop()
+
+
+class Timer:
+    """span() for code that cannot be wrapped in a with block."""
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.trace = _current.get()
+        self.previous = self.trace.enter(stage) if self.trace is not None else None
+        self.started = time.perf_counter()
+        self.started_ns = time.time_ns()
+
+    def stop(self):
+        seconds = time.perf_counter() - self.started
+        if self.trace is not None:
+            self.trace.add(self.stage, seconds, self.started_ns)
+            self.trace.leave(self.stage, self.previous)
+
+
+def add_frames(count: int, seconds: float, skipped: dict = None):
+    """Count rendered frames; `skipped` is {reason: count} of those that bypassed the face pipeline."""
+    trace = _current.get()
+    if trace is not None:
+        trace.frames += count
+        trace.render_seconds += seconds
+        for reason, n in (skipped or {}).items():
+            trace.frames_skipped[reason] = trace.frames_skipped.get(reason, 0) + n
+
+def add_reuse(kind: str, reused: int, total: int):
+    """Count how many of `total` per-frame `kind` results were reused rather than computed."""
+    trace = _current.get()
+    if trace is not None:
+        trace.add_reuse(kind, reused, total)
+
+# -------------------------------------------------
+# Endpoint
+# -------------------------------------------------
+def metrics_response():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,306 @@
+import os
+import glob
+import argparse
+
+# -------------------------------------------------
+# Model prep: fold pre/post-processing into the ONNX graphs
+#
+# Every wrapper used to convert its uint8 BGR image in NumPy before
+# session.run (BGR->RGB, float, /255, [-1, 1], HWC->CHW, batch axis) and
+# back again after it (clip, *255, CHW->HWC, uint8). This tool rewrites a
+# model so its image input is uint8 NHWC BGR and its image output uint8
+# NHWC BGR, with those ops at the ends of the graph where ORT fuses and
+# parallelizes them. Masks keep a float (N, H, W) output in [0, 1] and the
+# recognizer keeps its embedding; Wav2Lip also builds its 6-channel
+# masked/unmasked input from the uint8 face crop.
+#
+# The rewritten model is saved next to the original as <name>.u8.onnx.
+# The engine loads it instead of the original when it exists, and the
+# wrappers see it from the uint8 input type and skip their NumPy work.
+#
+#   python model_prep.py                   # every known model that is present
+#   python model_prep.py --root /tmp/standins
+#   python model_prep.py --model my_gpen.onnx restorer
+#
+# Needs `pip install onnx`; the engine itself does not.
+# -------------------------------------------------
+PREPARED_SUFFIX = ".u8.onnx"
+
+# swap: the model wants RGB; signed: it works in [-1, 1] instead of [0, 1];
+# nhwc: its own layout is already channels-last; output: what the first
+# output becomes ("image", "mask", or None to leave it alone)
+KINDS = {
+    "restorer": {"swap": True, "signed": True, "nhwc": False, "output": "image"},
+    "esrgan": {"swap": False, "signed": False, "nhwc": False, "output": "image"},
+    "blendmask": {"swap": True, "signed": False, "nhwc": False, "output": "mask"},
+    "xseg": {"swap": True, "signed": False, "nhwc": True, "output": "mask"},
+    "recognition": {"swap": False, "signed": True, "nhwc": False, "output": None},
+    "wav2lip": {"swap": False, "signed": False, "nhwc": False, "output": "image"},
+}
+
+MODELS = {
+    os.path.join("enhancers", "GPEN", "GPEN-BFR-256-sim.onnx"): "restorer",
+    os.path.join("enhancers", "GFPGAN", "GFPGANv1.4.onnx"): "restorer",
+    os.path.join("enhancers", "Codeformer", "codeformerfixed.onnx"): "restorer",
+    os.path.join("enhancers", "restoreformer", "restoreformer16.onnx"): "restorer",
+    os.path.join("enhancers", "RealEsrgan", "clear_reality_x4.onnx"): "esrgan",
+    os.path.join("blendmasker", "blendmasker.onnx"): "blendmask",
+    os.path.join("xseg", "xseg.onnx"): "xseg",
+    os.path.join("faceID", "recognition.onnx"): "recognition",
+}
+WAV2LIP_GLOB = os.path.join("checkpoints", "*.onnx")
+WAV2LIP_FACE = "face"
+
+
+def prepared_path(path: str) -> str:
+    """
+    The prepared variant of the model at `path` if there is one, else
+    `path`. A prepared model takes uint8 NHWC BGR images and returns
+    uint8 NHWC BGR images; mask models return float (N, H, W) masks in
+    [0, 1] and the recognizer its embedding. Wrappers tell one apart by
+    its uint8 input (is_prepared()).
+    """
+    prepared = os.path.splitext(path)[0] + PREPARED_SUFFIX
+    return prepared if os.path.exists(prepared) else path
+
+
+def is_prepared(session) -> bool:
+    """True for a session whose graph takes uint8 images (see prepare())."""
+    return any(model_input.type == "tensor(uint8)" for model_input in session.get_inputs())
+
+
+# -------------------------------------------------
+# Graph rewriting
+# -------------------------------------------------
+class _Builder:
+    """Appends uniquely named nodes and constants for one end of a graph."""
+
+    def __init__(self, prefix: str):
+        from onnx import helper, numpy_helper
+        self.helper, self.numpy_helper = helper, numpy_helper
+        self.prefix = prefix
+        self.nodes = []
+        self.initializers = []
+        self.count = 0
+
+    def _name(self):
+        self.count += 1
+        return f"{self.prefix}_{self.count}"
+
+    def const(self, array):
+        name = self._name()
+        self.initializers.append(self.numpy_helper.from_array(array, name))
+        return name
+
+    def op(self, op_type, inputs, output=None, **attrs):
+        output = output or self._name()
+        self.nodes.append(self.helper.make_node(op_type, inputs, [output], name=output, **attrs))
+        return output
+
+
+def _find(values, name=None):
+    for value in values:
+        if name is None or value.name == name:
+            return value
+    raise ValueError(f"Model has no value {name!r}")
+
+
+def _rename(graph, old, new):
+    for node in graph.node:
+        for i, name in enumerate(node.input):
+            if name == old:
+                node.input[i] = new
+        for i, name in enumerate(node.output):
+            if name == old:
+                node.output[i] = new
+    for value in graph.value_info:
+        if value.name == old:
+            value.name = new
+
+
+def _dims(value):
+    return [d.dim_param or d.dim_value for d in value.type.tensor_type.shape.dim]
+
+
+def _opset(model):
+    return next((o.version for o in model.opset_import if o.domain in ("", "ai.onnx")), 1)
+
+
+def _replace_value(values, old, new):
+    items = []
+    for value in values:
+        copy = type(value)()
+        copy.CopyFrom(new if value.name == old.name else value)
+        items.append(copy)
+    del values[:]
+    values.extend(items)
+
+
+def _image_input(b, source, elem, kind):
+    import numpy as np
+    from onnx import TensorProto
+
+    x = b.op("Cast", [source], to=TensorProto.FLOAT)
+    if kind["swap"]:
+        x = b.op("Gather", [x, b.const(np.array([2, 1, 0], dtype=np.int64))], axis=3)
+    # x / 255, or (x / 255 - 0.5) / 0.5 for [-1, 1]
+    x = b.op("Mul", [x, b.const(np.array(2 / 255 if kind["signed"] else 1 / 255, dtype=np.float32))])
+    if kind["signed"]:
+        x = b.op("Sub", [x, b.const(np.array(1, dtype=np.float32))])
+    if not kind["nhwc"]:
+        x = b.op("Transpose", [x], perm=[0, 3, 1, 2])
+    if elem != TensorProto.FLOAT:
+        x = b.op("Cast", [x], to=elem)
+    return x
+
+
+def _wav2lip_input(b, source, elem, size):
+    import numpy as np
+    from onnx import TensorProto
+
+    # [lower half masked, full] face stacked on channels, like datagen()
+    x = b.op("Cast", [source], to=TensorProto.FLOAT)
+    x = b.op("Mul", [x, b.const(np.array(1 / 255, dtype=np.float32))])
+    x = b.op("Transpose", [x], perm=[0, 3, 1, 2])
+    upper = np.ones((1, 1, size, 1), dtype=np.float32)
+    upper[:, :, size // 2:] = 0
+    masked = b.op("Mul", [x, b.const(upper)])
+    x = b.op("Concat", [masked, x], axis=1)
+    if elem != TensorProto.FLOAT:
+        x = b.op("Cast", [x], to=elem)
+    return x
+
+
+def _image_output(b, source, elem, kind):
+    import numpy as np
+    from onnx import TensorProto
+
+    x = source
+    if elem != TensorProto.FLOAT:
+        x = b.op("Cast", [x], to=TensorProto.FLOAT)
+    if not kind["nhwc"]:
+        x = b.op("Transpose", [x], perm=[0, 2, 3, 1])
+    if kind["swap"]:
+        x = b.op("Gather", [x, b.const(np.array([2, 1, 0], dtype=np.int64))], axis=3)
+    if kind["signed"]:
+        x = b.op("Add", [x, b.const(np.array(1, dtype=np.float32))])
+    x = b.op("Mul", [x, b.const(np.array(127.5 if kind["signed"] else 255, dtype=np.float32))])
+    x = b.op("Max", [x, b.const(np.array(0, dtype=np.float32))])
+    x = b.op("Min", [x, b.const(np.array(255, dtype=np.float32))])
+    return b.op("Cast", [x], to=TensorProto.UINT8)
+
+
+def _mask_output(b, source, elem, kind, opset):
+    import numpy as np
+    from onnx import TensorProto
+
+    x = source
+    if elem != TensorProto.FLOAT:
+        x = b.op("Cast", [x], to=TensorProto.FLOAT)
+    axis = 3 if kind["nhwc"] else 1
+    if opset >= 13:
+        return b.op("Squeeze", [x, b.const(np.array([axis], dtype=np.int64))])
+    return b.op("Squeeze", [x], axes=[axis])
+
+
+def prepare(model, kind_name: str):
+    """Rewrite `model` in place for uint8 NHWC BGR images (see KINDS)."""
+    from onnx import TensorProto, helper
+
+    kind = KINDS[kind_name]
+    graph = model.graph
+
+    # the original ends become internal values between the new ops and the graph
+    source = _find(graph.input, "video_frames" if kind_name == "wav2lip" else None)
+    _rename(graph, source.name, source.name + "__float")
+    target = None
+    if kind["output"] is not None:
+        target = _find(graph.output)
+        _rename(graph, target.name, target.name + "__float")
+
+    b = _Builder("prep_in")
+    elem = source.type.tensor_type.elem_type
+    dims = _dims(source)
+    if kind_name == "wav2lip":
+        size = dims[2]
+        if not isinstance(size, int) or not size:
+            raise ValueError("Wav2Lip model needs a fixed face size")
+        name = WAV2LIP_FACE
+        shape = [dims[0], size, size, 3]
+        x = _wav2lip_input(b, name, elem, size)
+    else:
+        name = source.name
+        shape = dims if kind["nhwc"] else [dims[0], dims[2], dims[3], dims[1]]
+        x = _image_input(b, name, elem, kind)
+    b.op("Identity", [x], output=source.name + "__float")
+    _replace_value(graph.input, source, helper.make_tensor_value_info(name, TensorProto.UINT8, shape))
+    head, initializers = b.nodes, b.initializers
+
+    tail = []
+    if target is not None:
+        b = _Builder("prep_out")
+        elem = target.type.tensor_type.elem_type
+        dims = _dims(target)
+        if kind["output"] == "image":
+            x = _image_output(b, target.name + "__float", elem, kind)
+            shape = dims if kind["nhwc"] else [dims[0], dims[2], dims[3], dims[1]]
+            value = helper.make_tensor_value_info(target.name, TensorProto.UINT8, shape)
+        else:
+            x = _mask_output(b, target.name + "__float", elem, kind, _opset(model))
+            shape = dims[:3] if kind["nhwc"] else [dims[0], dims[2], dims[3]]
+            value = helper.make_tensor_value_info(target.name, TensorProto.FLOAT, shape)
+        b.op("Identity", [x], output=target.name)
+        _replace_value(graph.output, target, value)
+        tail, initializers = b.nodes, initializers + b.initializers
+
+    body = []
+    for node in graph.node:
+        copy = type(node)()
+        copy.CopyFrom(node)
+        body.append(copy)
+    del graph.node[:]
+    graph.node.extend(head + body + tail)
+    graph.initializer.extend(initializers)
+    helper.set_model_props(model, {**{p.key: p.value for p in model.metadata_props}, "prepared": kind_name})
+    return model
+
+
+def prepare_file(path: str, kind_name: str, force: bool = False) -> str:
+    import onnx
+
+    out = os.path.splitext(path)[0] + PREPARED_SUFFIX
+    if not force and os.path.exists(out) and os.path.getmtime(out) >= os.path.getmtime(path):
+        return out
+    model = prepare(onnx.load(path), kind_name)
+    onnx.checker.check_model(model)
+    onnx.save(model, out)
+    return out
+
+
+def known_models(root: str) -> dict:
+    """{path: kind} of every model under `root` this tool knows how to prepare."""
+    found = {os.path.join(root, rel): kind for rel, kind in MODELS.items() if os.path.exists(os.path.join(root, rel))}
+    for path in sorted(glob.glob(os.path.join(root, WAV2LIP_GLOB))):
+        if not path.endswith(PREPARED_SUFFIX):
+            found[path] = "wav2lip"
+    return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fold image pre/post-processing into the ONNX models")
+    parser.add_argument("--root", default=os.path.dirname(os.path.abspath(__file__)), help="Directory the model paths are relative to")
+    parser.add_argument("--model", nargs=2, action="append", metavar=("PATH", "KIND"), help="Prepare this model only; KIND is one of " + ", ".join(KINDS))
+    parser.add_argument("--force", action="store_true", help="Rewrite models that are already prepared")
+    args = parser.parse_args(argv)
+
+    models = dict(args.model) if args.model else known_models(args.root)
+    if not models:
+        raise SystemExit("No models found under " + args.root)
+    for path, kind in models.items():
+        if kind not in KINDS:
+            raise SystemExit(f"Unknown kind {kind!r} for {path}")
+        print(f"{path} ({kind}) -> {prepare_file(path, kind, args.force)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+import os
+import sys
+import json
+import time
+import bisect
+import threading
+
+import metrics
+
+# -------------------------------------------------
+# Per-job profiling: ONNX Runtime + sampled Python, one Chrome trace
+#
+# Open the written JSON in chrome://tracing or https://ui.perfetto.dev.
+# Every ORT op and Python sample carries the pipeline stage (from the
+# metrics spans) it ran in, and the metadata sums them per stage.
+# -------------------------------------------------
+SAMPLE_INTERVAL = 0.005
+MAX_STACK = 32
+SUMMARY_TOP = 10
+
+PID_STAGES = 1
+PID_PYTHON = 2
+PID_ORT = 10
+
+# ORT reports its start on its own clock; trust it only if it is near ours
+MAX_CLOCK_SKEW_NS = 24 * 3600 * 10 ** 9
+
+
+def profiled_session(session, prefix: str):
+    """A copy of `session` with ORT profiling enabled."""
+    import onnxruntime
+
+    options = session.get_session_options()
+    options.enable_profiling = True
+    options.profile_file_prefix = prefix
+    providers = session.get_providers()
+    provider_options = session.get_provider_options()
+    return onnxruntime.InferenceSession(
+        session._model_path,
+        sess_options=options,
+        providers=providers,
+        provider_options=[provider_options.get(p, {}) for p in providers]
+    )
+
+
+def _get(holder, key):
+    return holder[key] if isinstance(holder, dict) else getattr(holder, key)
+
+
+def _set(holder, key, value):
+    if isinstance(holder, dict):
+        holder[key] = value
+    else:
+        setattr(holder, key, value)
+
+
+class JobProfiler:
+    """
+    Swaps the given sessions for profiling copies and samples the calling
+    thread's Python stack until finish(), which restores the sessions and
+    writes the merged trace to `path`.
+
+    `sessions` is a list of `(name, holder, key)` where `holder[key]` or
+    `holder.key` is an InferenceSession.
+    """
+
+    def __init__(self, path: str, workdir: str, sessions: list, job_id: str = None):
+        self.path = path
+        self.started_ns = time.time_ns()
+
+        self.trace = metrics.current() or metrics.start(job_id or os.path.basename(path))
+        self.trace.events = []
+
+        self.swapped = []
+        for name, holder, key in sessions:
+            original = _get(holder, key)
+            profiled = profiled_session(original, os.path.join(workdir, "ort_" + name))
+            _set(holder, key, profiled)
+            self.swapped.append((name, holder, key, original, profiled, time.time_ns()))
+
+        self.samples = []
+        self._thread_id = threading.get_ident()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._sampler.start()
+
+    def _sample(self):
+        while not self._stop.wait(SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None and len(stack) < MAX_STACK:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples.append((time.time_ns(), stack))
+
+    def finish(self):
+        self._stop.set()
+        self._sampler.join()
+
+        ort_profiles = []
+        for name, holder, key, original, profiled, created_ns in self.swapped:
+            _set(holder, key, original)
+            profile_file = profiled.end_profiling()
+            start_ns = profiled.get_profiling_start_time_ns()
+            if abs(start_ns - created_ns) > MAX_CLOCK_SKEW_NS:
+                start_ns = created_ns
+            with open(profile_file) as f:
+                ort_profiles.append((name, start_ns, json.load(f)))
+            os.remove(profile_file)
+
+        stage_events = sorted(self.trace.events, key=lambda e: e[1])
+        self.trace.events = None
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, "w") as f:
+            json.dump(self._chrome_trace(stage_events, ort_profiles), f)
+        return self.path
+
+    # -------------------------------------------------
+    # Merging
+    # -------------------------------------------------
+    def _chrome_trace(self, stage_events: list, ort_profiles: list) -> dict:
+        starts = [e[1] for e in stage_events]
+
+        def stage_at(ns):
+            i = bisect.bisect_right(starts, ns) - 1
+            if i >= 0 and stage_events[i][2] >= ns:
+                return stage_events[i][0]
+            return "other"
+
+        def us(ns):
+            return (ns - self.started_ns) / 1000
+
+        events = [
+            {"ph": "M", "name": "process_name", "pid": PID_STAGES, "args": {"name": "pipeline stages"}},
+            {"ph": "M", "name": "process_name", "pid": PID_PYTHON, "args": {"name": "python (sampled)"}}
+        ]
+        summary = {"stages": dict(self.trace.spans), "python": {}, "onnxruntime": {}}
+
+        for stage, start, end in stage_events:
+            events.append({"ph": "X", "name": stage, "cat": "stage", "pid": PID_STAGES, "tid": 0,
+                           "ts": us(start), "dur": (end - start) / 1000})
+
+        # consecutive samples with the same innermost frame become one slice
+        interval_ns = int(SAMPLE_INTERVAL * 1e9)
+        run = None
+        for ns, stack in self.samples + [(None, None)]:
+            if run is not None and (stack is None or stack[0] != run["stack"][0] or ns - run["end"] > 2 * interval_ns):
+                stage = stage_at(run["start"])
+                seconds = (run["end"] - run["start"] + interval_ns) / 1e9
+                events.append({"ph": "X", "name": run["stack"][0], "cat": "python", "pid": PID_PYTHON, "tid": 0,
+                               "ts": us(run["start"]), "dur": seconds * 1e6,
+                               "args": {"stage": stage, "stack": run["stack"]}})
+                functions = summary["python"].setdefault(stage, {})
+                functions[run["stack"][0]] = functions.get(run["stack"][0], 0.) + seconds
+                run = None
+            if stack is None:
+                break
+            if run is None:
+                run = {"start": ns, "end": ns, "stack": stack}
+            else:
+                run["end"] = ns
+
+        for n, (name, start_ns, profile) in enumerate(ort_profiles):
+            pid = PID_ORT + n
+            events.append({"ph": "M", "name": "process_name", "pid": pid, "args": {"name": "onnxruntime: " + name}})
+            for e in profile:
+                if e.get("ph") != "X":
+                    continue
+                ts_ns = start_ns + int(e["ts"] * 1000)
+                stage = stage_at(ts_ns + int(e.get("dur", 0) * 500))
+                args = dict(e.get("args", {}), stage=stage)
+                events.append({"ph": "X", "name": e["name"], "cat": e.get("cat", "ort"), "pid": pid,
+                               "tid": e.get("tid", 0), "ts": us(ts_ns), "dur": e.get("dur", 0), "args": args})
+                if e.get("cat") == "Node" and "op_name" in args:
+                    ops = summary["onnxruntime"].setdefault(stage, {})
+                    op = f"{name}:{args['op_name']}"
+                    ops[op] = ops.get(op, 0.) + e.get("dur", 0) / 1e6
+
+        for section in ("python", "onnxruntime"):
+            summary[section] = {
+                stage: dict(sorted(items.items(), key=lambda kv: -kv[1])[:SUMMARY_TOP])
+                for stage, items in summary[section].items()
+            }
+
+        return {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "metadata": {"job_id": self.trace.job_id, "sample_interval": SAMPLE_INTERVAL, "summary": summary}
+        }
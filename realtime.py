@@ -0,0 +1,417 @@
+import os
+import sys
+import json
+import time
+import asyncio
+
+import cv2
+import numpy as np
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+
+import audio
+import lipsync
+import batching
+
+# -------------------------------------------------
+# Real-time lip-sync sessions over a WebSocket
+#
+#   uvicorn realtime:app --host 0.0.0.0 --port 8001
+#
+# Protocol (/ws?format=jpeg|raw):
+#   server -> {"type": "ready", fps, width, height, sample_rate, format, latency_budget_ms}
+#   client -> binary messages of 16 kHz mono s16le PCM, as it is produced
+#   client -> {"type": "end"} once the utterance is complete
+#   server -> {"type": "frame", index, pts, latency_ms, reused} followed by one
+#             binary message (JPEG, or raw BGR width*height*3 bytes)
+#   server -> {"type": "stats", ...} every second and once more ({"final": true})
+#             before closing
+#
+# Env:
+#   REALTIME_AVATAR            avatar video whose faces are kept resident
+#   REALTIME_LATENCY_BUDGET    seconds from audio arrival to frame sent
+#   REALTIME_ON_LATE           "reuse" resends the previous frame, "drop" skips it
+#   REALTIME_MAX_SESSIONS      concurrent sessions per process
+#   REALTIME_BATCH_MAX         most frames of concurrent sessions run in one Wav2Lip batch
+#   REALTIME_BATCH_WAIT_MS     longest a frame waits for others to join its batch
+#   REALTIME_JPEG_QUALITY
+# -------------------------------------------------
+BASE_DIR = lipsync.BASE_DIR
+
+AVATAR = os.getenv("REALTIME_AVATAR", os.path.join(BASE_DIR, "inputs", "face_ref.mp4"))
+LATENCY_BUDGET = float(os.getenv("REALTIME_LATENCY_BUDGET", "0.5"))
+ON_LATE = os.getenv("REALTIME_ON_LATE", "reuse")
+MAX_SESSIONS = int(os.getenv("REALTIME_MAX_SESSIONS", "2"))
+BATCH_MAX = int(os.getenv("REALTIME_BATCH_MAX", "8"))
+BATCH_WAIT_MS = float(os.getenv("REALTIME_BATCH_WAIT_MS", "4"))
+JPEG_QUALITY = int(os.getenv("REALTIME_JPEG_QUALITY", "80"))
+
+# Same mel parameters as the batch renderer (hparams.py): 16 kHz, hop 200,
+# 80 mel frames per second, 16-frame window per video frame. MEL_PAD extra
+# hops on both sides cover the 800-sample STFT window of the edge columns.
+SAMPLE_RATE = 16000
+MEL_HOP_SIZE = 200
+MEL_STEP_SIZE = 16
+MEL_PAD = 2
+
+STATS_INTERVAL = 1.0
+
+app = FastAPI()
+
+engine = None
+avatar = None
+sessions = asyncio.Semaphore(MAX_SESSIONS)
+
+# -------------------------------------------------
+# Avatar kept resident between sessions
+# -------------------------------------------------
+class Avatar:
+    """
+    Frames, aligned faces, inverse matrices and Wav2Lip inputs of one
+    avatar video, computed once so a session only runs Wav2Lip and the
+    ROI composite per frame.
+    """
+
+    def __init__(self, face_path: str):
+        engine.configure([
+            "--checkpoint_path", lipsync.WAV2LIP_MODEL,
+            "--face", face_path,
+            "--audio", face_path
+        ])
+        self.model = engine.load_model(engine.device, lipsync.WAV2LIP_MODEL)
+        # frames of concurrent sessions share Wav2Lip runs (batching.py)
+        self.batcher = batching.MicroBatcher(self.model, BATCH_MAX, BATCH_WAIT_MS)
+
+        stream = cv2.VideoCapture(face_path)
+        self.fps = stream.get(cv2.CAP_PROP_FPS) or engine.args.fps
+        self.frames = []
+        while True:
+            ok, frame = stream.read()
+            if not ok:
+                break
+            self.frames.append(frame)
+        stream.release()
+        if not self.frames:
+            raise RuntimeError("Could not read avatar video: " + face_path)
+
+        self.height, self.width = self.frames[0].shape[:2]
+
+        target_id = engine.select_specific_face(engine.detector, self.frames[0], 256, crop_scale=1)
+        track = engine.face_detect(self.frames, target_id)
+        self.aligned = track.aligned
+        self.no_face = track.status != 0
+
+        self.static_face_mask, self.sub_face_mask = engine.face_masks()
+
+        size = engine.args.img_size
+        self.prepared = engine.is_prepared(self.model)
+        self.inputs = []
+        for sub_face in track.sub:
+            if self.prepared:
+                # the model masks and scales the uint8 crop itself
+                self.inputs.append(sub_face[np.newaxis])
+                continue
+            masked = sub_face.copy()
+            masked[size // 2:] = 0
+            img = np.concatenate((masked, sub_face), axis=2) / 255.
+            self.inputs.append(img.transpose(2, 0, 1)[np.newaxis].astype(np.float32))
+
+        # paste box of the Wav2Lip output inside the aligned 256x256 face
+        top, bottom = 65 - engine.padY, 241 - engine.padY
+        left, right = (62, 194) if engine.args.face_mode == 0 else (42, 214)
+        self.paste = (top, bottom, left, right)
+
+        # the face only covers a small part of the frame: warp and blend
+        # just its bounding box instead of the full frame
+        corners = np.float32([[0, 0, 1], [256, 0, 1], [0, 256, 1], [256, 256, 1]])
+        self.rois = []
+        self.roi_mats = []
+        for inverse in track.inverse:
+            points = corners @ inverse.T
+            x0, y0 = np.floor(points.min(axis=0)).astype(int)
+            x1, y1 = np.ceil(points.max(axis=0)).astype(int)
+            x0, y0 = max(0, x0), max(0, y0)
+            x1, y1 = min(self.width, x1), min(self.height, y1)
+
+            shifted = inverse.copy()
+            shifted[:, 2] -= (x0, y0)
+            self.rois.append((x0, y0, x1, y1))
+            self.roi_mats.append(shifted)
+
+    def __len__(self):
+        return len(self.frames)
+
+    def render(self, index: int, mel: np.ndarray) -> np.ndarray:
+        """Lip-sync avatar frame `index` to one (80, 16) mel window."""
+        mel_batch = mel[np.newaxis, np.newaxis].astype(np.float32)
+        if self.prepared:
+            pred = self.batcher.run({'mel_spectrogram': mel_batch, 'face': self.inputs[index]})[0][0]
+        else:
+            pred = self.batcher.run({'mel_spectrogram': mel_batch, 'video_frames': self.inputs[index]})[0][0]
+            pred = (pred.transpose(1, 2, 0) * 255).astype(np.uint8)
+
+        frame = self.frames[index]
+        x0, y0, x1, y1 = self.rois[index]
+        if self.no_face[index] or x1 <= x0 or y1 <= y0:
+            return frame
+
+        top, bottom, left, right = self.paste
+        aligned = self.aligned[index]
+        p_aligned = aligned.copy()
+        p_aligned[top:bottom, left:right] = cv2.resize(pred, (right - left, bottom - top))
+        face = (self.sub_face_mask * p_aligned + (1 - self.sub_face_mask) * aligned).astype(np.uint8)
+
+        size = (x1 - x0, y1 - y0)
+        dealigned = cv2.warpAffine(face, self.roi_mats[index], size)
+        mask = cv2.warpAffine(self.static_face_mask, self.roi_mats[index], size)
+
+        out = frame.copy()
+        region = out[y0:y1, x0:x1]
+        out[y0:y1, x0:x1] = (mask * dealigned + (1 - mask) * region).astype(np.uint8)
+        return out
+
+# -------------------------------------------------
+# Incremental mel
+# -------------------------------------------------
+class MelStream:
+    """
+    Wav2Lip mel windows for PCM that arrives in pieces.
+
+    Each window is computed from a short slice of audio around it, which
+    gives the same columns as the batch melspectrogram of the whole file
+    (away from the very first samples) without recomputing it per frame.
+    """
+
+    def __init__(self, fps: float):
+        self.mel_idx_multiplier = 80. / fps
+        self.samples = np.zeros(0, dtype=np.float32)
+        self.base = 0
+        self.total = 0
+        self.count = None
+        self.ended = False
+
+    def push(self, pcm: bytes):
+        samples = np.frombuffer(pcm[:len(pcm) - len(pcm) % 2], dtype="<i2").astype(np.float32) / 32768
+        self.samples = np.concatenate((self.samples, samples))
+        self.total += len(samples)
+
+    def end(self):
+        # same frame count as the batch renderer for the whole utterance
+        mel_len = 1 + self.total // MEL_HOP_SIZE
+        i = 0
+        while int(i * self.mel_idx_multiplier) + MEL_STEP_SIZE <= mel_len:
+            i += 1
+        self.count = i + 1
+        self.ended = True
+
+    def frame_count(self):
+        """Number of video frames once the audio has ended, else None."""
+        return self.count if self.ended else None
+
+    def ready(self, i: int) -> bool:
+        if self.ended:
+            return i < self.count
+        start = int(i * self.mel_idx_multiplier)
+        return self.total >= (start + MEL_STEP_SIZE + MEL_PAD) * MEL_HOP_SIZE
+
+    def window(self, i: int) -> np.ndarray:
+        start = int(i * self.mel_idx_multiplier)
+        if self.ended:
+            mel_len = 1 + self.total // MEL_HOP_SIZE
+            if start + MEL_STEP_SIZE > mel_len:
+                start = max(0, mel_len - MEL_STEP_SIZE)
+
+        first = max(0, start - MEL_PAD) * MEL_HOP_SIZE
+        last = min(self.total, (start + MEL_STEP_SIZE + MEL_PAD) * MEL_HOP_SIZE)
+        mel = audio.melspectrogram(self.samples[first - self.base:last - self.base])
+
+        k = start - first // MEL_HOP_SIZE
+        window = mel[:, k:k + MEL_STEP_SIZE]
+        if window.shape[1] < MEL_STEP_SIZE:
+            window = np.pad(window, ((0, 0), (0, MEL_STEP_SIZE - window.shape[1])), mode="edge")
+
+        # windows are requested in order: audio before this one is not needed again
+        drop = first - self.base
+        if drop > 0:
+            self.samples = self.samples[drop:]
+            self.base = first
+        return window
+
+# -------------------------------------------------
+# Session
+# -------------------------------------------------
+def percentile(values, q):
+    if not values:
+        return 0.
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Session:
+    def __init__(self, ws: WebSocket, fmt: str):
+        self.ws = ws
+        self.fmt = fmt
+        self.mel = MelStream(avatar.fps)
+        self.changed = asyncio.Event()
+
+        # time each frame's audio became complete, in frame order
+        self.ready_at = []
+
+        self.sent = 0
+        self.dropped = 0
+        self.reused = 0
+        self.latencies = []
+        self.first_sent = None
+        self.last_sent = None
+        self.render_time = 1. / avatar.fps
+        self.last_payload = None
+        self.closed = False
+
+    async def receive(self):
+        try:
+            while True:
+                message = await self.ws.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message.get("bytes"):
+                    self.mel.push(message["bytes"])
+                elif message.get("text") and json.loads(message["text"]).get("type") == "end":
+                    self.mel.end()
+                    break
+                self.mark_ready()
+        finally:
+            if not self.mel.ended:
+                self.closed = True
+            self.mark_ready()
+
+    def mark_ready(self):
+        now = time.monotonic()
+        while self.mel.ready(len(self.ready_at)):
+            self.ready_at.append(now)
+        self.changed.set()
+
+    def encode(self, frame: np.ndarray) -> bytes:
+        if self.fmt == "raw":
+            return frame.tobytes()
+        return cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])[1].tobytes()
+
+    def render(self, i: int, window: np.ndarray) -> bytes:
+        return self.encode(avatar.render(i % len(avatar), window))
+
+    def stats(self, final=False):
+        elapsed = (self.last_sent - self.first_sent) if self.sent > 1 else 0
+        return {
+            "type": "stats",
+            "final": final,
+            "frames": self.sent,
+            "dropped": self.dropped,
+            "reused": self.reused,
+            "fps": round((self.sent - 1) / elapsed, 2) if elapsed > 0 else 0.,
+            "latency_ms": {
+                "p50": round(percentile(self.latencies, 0.5) * 1000, 1),
+                "p95": round(percentile(self.latencies, 0.95) * 1000, 1),
+                "max": round(max(self.latencies, default=0.) * 1000, 1)
+            },
+            "batching": avatar.batcher.stats()
+        }
+
+    async def run(self):
+        receiver = asyncio.create_task(self.receive())
+        last_stats = time.monotonic()
+        i = 0
+        try:
+            while True:
+                count = self.mel.frame_count()
+                if self.closed or (count is not None and i >= count):
+                    break
+                if i >= len(self.ready_at):
+                    self.changed.clear()
+                    await self.changed.wait()
+                    continue
+
+                # skip inference for frames that would arrive after the budget
+                reused = False
+                if time.monotonic() + self.render_time - self.ready_at[i] > LATENCY_BUDGET:
+                    if ON_LATE == "reuse" and self.last_payload is not None:
+                        payload = self.last_payload
+                        reused = True
+                        self.reused += 1
+                    else:
+                        self.dropped += 1
+                        i += 1
+                        continue
+                else:
+                    started = time.monotonic()
+                    payload = await asyncio.to_thread(self.render, i, self.mel.window(i))
+                    self.render_time = 0.8 * self.render_time + 0.2 * (time.monotonic() - started)
+                    self.last_payload = payload
+
+                now = time.monotonic()
+                latency = now - self.ready_at[i]
+                await self.ws.send_text(json.dumps({
+                    "type": "frame",
+                    "index": i,
+                    "pts": round(i / avatar.fps, 4),
+                    "latency_ms": round(latency * 1000, 1),
+                    "reused": reused
+                }))
+                await self.ws.send_bytes(payload)
+
+                self.latencies.append(latency)
+                self.sent += 1
+                self.first_sent = self.first_sent or now
+                self.last_sent = now
+                i += 1
+
+                if now - last_stats >= STATS_INTERVAL:
+                    await self.ws.send_text(json.dumps(self.stats()))
+                    last_stats = now
+
+            if not self.closed:
+                await self.ws.send_text(json.dumps(self.stats(final=True)))
+        finally:
+            receiver.cancel()
+            print("realtime session: " + json.dumps(self.stats(final=True)), flush=True)
+
+# -------------------------------------------------
+# App
+# -------------------------------------------------
+@app.on_event("startup")
+def load_avatar():
+    global engine, avatar
+
+    # model paths inside the inference script are relative to the repo root
+    os.chdir(BASE_DIR)
+    sys.path.insert(0, BASE_DIR)
+
+    import inference_onnxModel
+    engine = inference_onnxModel
+    engine.keep_models = True
+    avatar = Avatar(AVATAR)
+
+
+@app.websocket("/ws")
+async def realtime_session(ws: WebSocket, format: str = "jpeg"):
+    if format not in ("jpeg", "raw"):
+        await ws.close(code=1003)
+        return
+    if sessions.locked():
+        await ws.close(code=1013)
+        return
+
+    async with sessions:
+        await ws.accept()
+        await ws.send_text(json.dumps({
+            "type": "ready",
+            "fps": avatar.fps,
+            "width": avatar.width,
+            "height": avatar.height,
+            "sample_rate": SAMPLE_RATE,
+            "format": format,
+            "latency_budget_ms": LATENCY_BUDGET * 1000
+        }))
+        try:
+            with avatar.batcher.client():
+                await Session(ws, format).run()
+            await ws.close()
+        except WebSocketDisconnect:
+            pass
@@ -0,0 +1,244 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+
+# -------------------------------------------------
+# Render job states
+# -------------------------------------------------
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# claims of one job before it is failed instead of handed out again, so a
+# job that keeps crashing its worker does not take down every worker in turn
+MAX_ATTEMPTS = 3
+
+
+class RenderQueue:
+    """
+    Backend interface between the web apps and the inference workers.
+
+    A render spec is a plain dict of lipsync.render() arguments; every
+    path in it must be visible to the workers (same box or a shared
+    filesystem).
+    """
+
+    def put(self, spec: dict) -> str:
+        raise NotImplementedError
+
+    def claim(self, worker_id: str, lease: float):
+        """Return `(job_id, spec)` for the next job, or None if idle."""
+        raise NotImplementedError
+
+    def heartbeat(self, job_id: str, lease: float):
+        raise NotImplementedError
+
+    def complete(self, job_id: str, error: str = None, result: dict = None, worker_id: str = None) -> bool:
+        """
+        Finish a job; `result` is a small JSON-able dict (e.g. timing spans)
+        for the submitter. With `worker_id`, only while that worker still
+        holds the job; returns False if it lost it to another worker.
+        """
+        raise NotImplementedError
+
+    def expire(self, job_id: str, error: str) -> bool:
+        """Fail a job that is still waiting for a worker; False if one claimed it meanwhile."""
+        raise NotImplementedError
+
+    def get(self, job_id: str):
+        raise NotImplementedError
+
+    def depth(self) -> int:
+        raise NotImplementedError
+
+    def prune(self, ttl: float):
+        """Forget finished jobs older than `ttl` seconds."""
+        raise NotImplementedError
+
+    def check(self, job_id: str, queue_timeout: float = None) -> dict:
+        """
+        The job's record. A job no worker claimed within `queue_timeout`
+        seconds is failed first, so a submitter does not wait forever when
+        no worker is running.
+        """
+        job = self.get(job_id)
+        if job is None:
+            raise KeyError(job_id)
+        if queue_timeout and job["status"] == QUEUED and time.time() - job["created"] > queue_timeout:
+            self.expire(job_id, f"no render worker picked the job up within {queue_timeout:g} s")
+            job = self.get(job_id)
+        return job
+
+    def wait(self, job_id: str, poll: float = 0.25, timeout: float = None, queue_timeout: float = None) -> dict:
+        """Block until the job finished and return its record."""
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            job = self.check(job_id, queue_timeout)
+            if job["status"] in (DONE, FAILED):
+                return job
+            if deadline is not None and time.time() > deadline:
+                raise TimeoutError(f"render {job_id} did not finish in time")
+            time.sleep(poll)
+
+
+# -------------------------------------------------
+# SQLite backend (default)
+# -------------------------------------------------
+class SQLiteRenderQueue(RenderQueue):
+    """
+    Local queue in a single SQLite file.
+
+    Claims are leases: a job whose worker stopped heart-beating is handed
+    to the next worker that asks, so a crashed worker never strands a job,
+    up to `max_attempts` claims; after that the job fails.
+    """
+
+    def __init__(self, path: str, max_attempts: int = MAX_ATTEMPTS):
+        self.path = path
+        self.max_attempts = max_attempts
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._local = threading.local()
+
+        db = self._connect()
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                spec TEXT NOT NULL,
+                status TEXT NOT NULL,
+                worker TEXT,
+                error TEXT,
+                created REAL NOT NULL,
+                started REAL,
+                finished REAL,
+                lease_expires REAL,
+                result TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created)")
+
+        # queue files created before results or attempts were stored
+        columns = [row["name"] for row in db.execute("PRAGMA table_info(jobs)")]
+        if "result" not in columns:
+            db.execute("ALTER TABLE jobs ADD COLUMN result TEXT")
+        if "attempts" not in columns:
+            db.execute("ALTER TABLE jobs ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+
+    def _connect(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.row_factory = sqlite3.Row
+            self._local.db = db
+        return db
+
+    def put(self, spec: dict) -> str:
+        job_id = uuid.uuid4().hex
+        self._connect().execute(
+            "INSERT INTO jobs (id, spec, status, created) VALUES (?, ?, ?, ?)",
+            (job_id, json.dumps(spec), QUEUED, time.time())
+        )
+        return job_id
+
+    def claim(self, worker_id: str, lease: float):
+        db = self._connect()
+        now = time.time()
+
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            # lost by as many workers as it may be claimed: do not hand it out again
+            db.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished = ?, lease_expires = NULL "
+                "WHERE status = ? AND lease_expires < ? AND attempts >= ?",
+                (FAILED, f"render worker lost {self.max_attempts} times", now, RUNNING, now, self.max_attempts)
+            )
+            row = db.execute(
+                "SELECT id, spec FROM jobs "
+                "WHERE status = ? OR (status = ? AND lease_expires < ?) "
+                "ORDER BY created LIMIT 1",
+                (QUEUED, RUNNING, now)
+            ).fetchone()
+            if row is None:
+                db.execute("COMMIT")
+                return None
+
+            db.execute(
+                "UPDATE jobs SET status = ?, worker = ?, started = ?, lease_expires = ?, attempts = attempts + 1 WHERE id = ?",
+                (RUNNING, worker_id, now, now + lease, row["id"])
+            )
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+
+        return row["id"], json.loads(row["spec"])
+
+    def heartbeat(self, job_id: str, lease: float):
+        self._connect().execute(
+            "UPDATE jobs SET lease_expires = ? WHERE id = ? AND status = ?",
+            (time.time() + lease, job_id, RUNNING)
+        )
+
+    def complete(self, job_id: str, error: str = None, result: dict = None, worker_id: str = None) -> bool:
+        query = "UPDATE jobs SET status = ?, error = ?, result = ?, finished = ?, lease_expires = NULL WHERE id = ?"
+        params = [FAILED if error else DONE, error, json.dumps(result) if result is not None else None,
+                  time.time(), job_id]
+        if worker_id is not None:
+            query += " AND worker = ? AND status = ?"
+            params += [worker_id, RUNNING]
+        return self._connect().execute(query, params).rowcount > 0
+
+    def expire(self, job_id: str, error: str) -> bool:
+        return self._connect().execute(
+            "UPDATE jobs SET status = ?, error = ?, finished = ? WHERE id = ? AND status = ?",
+            (FAILED, error, time.time(), job_id, QUEUED)
+        ).rowcount > 0
+
+    def get(self, job_id: str):
+        row = self._connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["spec"] = json.loads(job["spec"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def depth(self) -> int:
+        return self._connect().execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = ?", (QUEUED,)
+        ).fetchone()[0]
+
+    def prune(self, ttl: float):
+        self._connect().execute(
+            "DELETE FROM jobs WHERE finished IS NOT NULL AND finished < ?",
+            (time.time() - ttl,)
+        )
+
+
+# -------------------------------------------------
+# Backend selection
+# -------------------------------------------------
+BACKENDS = {
+    "sqlite": SQLiteRenderQueue
+}
+
+
+def open_queue(url: str) -> RenderQueue:
+    """
+    Open a queue from a url such as `sqlite:///temp/render_queue.db`
+    (relative) or `sqlite:////srv/shared/render_queue.db` (absolute).
+
+    Other backends register a class in BACKENDS that takes the part of
+    the url after `scheme:///`.
+    """
+    scheme, sep, location = url.partition("://")
+    if not sep or scheme not in BACKENDS:
+        raise ValueError(f"Unsupported render queue: {url}")
+    if location.startswith("/"):
+        location = location[1:]
+    return BACKENDS[scheme](location)
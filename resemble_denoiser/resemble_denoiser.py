@@ -2,6 +2,8 @@ import numpy as np
 import onnxruntime
 from librosa import stft, istft
 
+from utils.ort_profile import tuned
+
 class ResembleDenoiser:
     def __init__(self, model_path='denoiser_fp16.onnx', device='cpu'):
         self.stft_hop_length = 420
@@ -17,6 +19,7 @@ class ResembleDenoiser:
         if device == 'cuda':
             providers = [("CUDAExecutionProvider", {"cudnn_conv_algo_search": "DEFAULT"}), "CPUExecutionProvider"]
 
+        model_path, session_options = tuned(model_path, session_options)
         self.session = onnxruntime.InferenceSession(model_path, sess_options=session_options, providers=providers)
 
 
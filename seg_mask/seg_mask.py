@@ -1,32 +1,34 @@
 import cv2
 import onnxruntime
 import numpy as np
-import imutils
-from skimage.transform import resize
+
+from utils.face_alignment import resize_faces
+from utils.ort_binding import run_batch, into
+from utils.ort_profile import tuned
 
 class SEGMENTATION_MODULE:
+    # every region but the background
+    FACE_MASK_REGIONS = (1, 2, 3, 4)
+
     def __init__(self, model_path="vox-5segments.onnx", device='cpu'):
         session_options = onnxruntime.SessionOptions()
         session_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
         providers = ["CPUExecutionProvider"]
         if device == 'cuda':
             providers = [("CUDAExecutionProvider", {"cudnn_conv_algo_search": "DEFAULT"}),"CPUExecutionProvider"]
+        model_path, session_options = tuned(model_path, session_options)
         self.session = onnxruntime.InferenceSession(model_path, sess_options=session_options, providers=providers)
+        self.input_name = self.session.get_inputs()[0].name
 
         
-    def mask(self, face, FACE_MASK_REGIONS):
-        face = resize(face.astype(np.uint8), (256, 256))[..., :3]
-        face = face.transpose((2, 0, 1))
-        face = np.expand_dims(face, axis=0)
-        face = face.astype(np.float32)[:1,::-1]
-        
-        region_mask = self.session.run(None, {(self.session.get_inputs()[0].name):face})[0][0]
-        
-        region_mask = np.isin(region_mask.argmax(0), FACE_MASK_REGIONS)
+    def mask_batch(self, faces, FACE_MASK_REGIONS=None, out=None):
+        """(N, H, W, 3) BGR faces -> (N, 256, 256) float32 masks in [0, 1]."""
+        regions = self.FACE_MASK_REGIONS if FACE_MASK_REGIONS is None else FACE_MASK_REGIONS
+        batch = resize_faces(faces).astype(np.float32)[..., ::-1].transpose((0, 3, 1, 2)) / 255
+        region_mask = run_batch(self.session, {self.input_name: np.ascontiguousarray(batch)})
 
-        region_mask = region_mask.astype(np.uint8) *255
-        region_mask = cv2.GaussianBlur(region_mask,(5,5),cv2.BORDER_DEFAULT)
-        region_mask = cv2.resize(region_mask, (256,256))
-      
-        return region_mask
-        
+        region_mask = np.isin(region_mask.argmax(1), regions).astype(np.float32)
+        return into(np.stack([cv2.GaussianBlur(m, (5, 5), cv2.BORDER_DEFAULT) for m in region_mask]), out, owned=True)
+
+    def mask(self, face, FACE_MASK_REGIONS=None):
+        return self.mask_batch(face[np.newaxis], FACE_MASK_REGIONS)[0]
@@ -0,0 +1,104 @@
+import os
+import sys
+import threading
+from contextlib import ExitStack
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batching import MicroBatcher
+
+
+class Input:
+    def __init__(self, name, shape):
+        self.name = name
+        self.shape = shape
+
+
+class DoublingSession:
+    """Returns its input doubled; records the batch size of every call."""
+
+    def __init__(self, batch="N"):
+        self.batch = batch
+        self.calls = []
+
+    def get_inputs(self):
+        return [Input("x", [self.batch, 2])]
+
+    def run(self, output_names, feeds):
+        x = feeds["x"]
+        self.calls.append(len(x))
+        if (x < 0).any():
+            raise ValueError("negative input")
+        return [x * 2]
+
+
+def run_clients(batcher, feeds):
+    results = [None] * len(feeds)
+    errors = [None] * len(feeds)
+
+    def client(i):
+        try:
+            results[i] = batcher.run({"x": feeds[i]})[0]
+        except Exception as e:
+            errors[i] = e
+
+    with ExitStack() as stack:
+        for _ in feeds:
+            stack.enter_context(batcher.client())
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(len(feeds))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(timeout=5)
+    return results, errors
+
+
+def test_concurrent_requests_share_one_batch():
+    session = DoublingSession()
+    batcher = MicroBatcher(session, max_batch=8, max_wait_ms=5000)
+    feeds = [np.full((1, 2), i, dtype=np.float32) for i in range(4)]
+
+    results, errors = run_clients(batcher, feeds)
+
+    assert errors == [None] * 4
+    for feed, result in zip(feeds, results):
+        np.testing.assert_array_equal(result, feed * 2)
+    # a full round of registered clients runs without waiting out max_wait
+    assert session.calls == [4]
+    stats = batcher.stats()
+    assert stats["batched"] and stats["requests"] == 4 and stats["batches"] == 1 and stats["mean_batch"] == 4
+
+
+def test_batches_are_capped_at_max_batch():
+    session = DoublingSession()
+    batcher = MicroBatcher(session, max_batch=3, max_wait_ms=1)
+    feeds = [np.full((2, 2), i, dtype=np.float32) for i in range(4)]
+
+    results, errors = run_clients(batcher, feeds)
+
+    assert errors == [None] * 4
+    for feed, result in zip(feeds, results):
+        np.testing.assert_array_equal(result, feed * 2)
+    assert all(size <= 3 for size in session.calls) and sum(session.calls) == 8
+
+
+def test_error_reaches_every_request_in_the_batch():
+    session = DoublingSession()
+    batcher = MicroBatcher(session, max_batch=8, max_wait_ms=5000)
+    feeds = [np.ones((1, 2), dtype=np.float32), -np.ones((1, 2), dtype=np.float32)]
+
+    _, errors = run_clients(batcher, feeds)
+
+    assert all(isinstance(e, ValueError) for e in errors)
+
+
+def test_fixed_batch_of_one_runs_directly():
+    session = DoublingSession(batch=1)
+    batcher = MicroBatcher(session, max_batch=8)
+
+    assert not batcher.batched
+    result = batcher.run({"x": np.ones((1, 2), dtype=np.float32)})[0]
+    np.testing.assert_array_equal(result, np.full((1, 2), 2))
+    assert session.calls == [1] and batcher.stats()["batches"] == 0
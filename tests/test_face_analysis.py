@@ -0,0 +1,79 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import face_analysis
+from utils.face_alignment import TEMPLATE_FFHQ
+from utils.face_track import ARRAYS, NO_FACE, FaceTrack
+
+SETTINGS = {"still_threshold": 0, "face_mode": 0, "pad_y": 0, "img_size": 96}
+TARGET = np.eye(1, 8, dtype=np.float32)[0]
+
+
+class StubDetector:
+    """One face at the same landmarks in every frame."""
+
+    def detect(self, image, input_size, det_thresh):
+        return None, (TEMPLATE_FFHQ / 4)[np.newaxis]
+
+
+def stub_recognition(face):
+    return TARGET[np.newaxis]
+
+
+def test_shard_fills_its_rows(monkeypatch):
+    monkeypatch.setattr(face_analysis, "_detector", StubDetector())
+    monkeypatch.setattr(face_analysis, "_recognition", stub_recognition)
+
+    frames = face_analysis.SharedFrames(4, (128, 128, 3))
+    for i in range(4):
+        frames.put(i, np.full((128, 128, 3), i * 10, dtype=np.uint8))
+    track = FaceTrack(4, 96, face_analysis.CROP_SIZE)
+    shared = {name: face_analysis._Shared(getattr(track, name).shape, getattr(track, name).dtype) for name in ARRAYS}
+    for name, s in shared.items():
+        s.array[...] = getattr(track, name)
+    try:
+        missing, reused, _ = face_analysis._analyse_shard(
+            frames.spec(), {name: s.spec() for name, s in shared.items()}, 1, 3, TARGET, SETTINGS)
+        aligned, status = shared["aligned"].array.copy(), shared["status"].array.copy()
+    finally:
+        assert frames.close()
+        for s in shared.values():
+            assert s.close(unlink=True)
+
+    assert missing == [] and reused == 0
+    assert list(status) == [0, 0, 0, 0]
+    # rows 1 and 2 are this shard's, crops of uniform frames 10 and 20
+    assert not aligned[0].any() and not aligned[3].any()
+    assert (aligned[1] == 10).all() and (aligned[2] == 20).all()
+
+
+def pool(processes):
+    pool = face_analysis.FacePool.__new__(face_analysis.FacePool)
+    pool.processes = processes
+    return pool
+
+
+@pytest.mark.parametrize("runs, expected", [
+    ([(0, 10), (90, 100)], [(0, 10), (90, 100)]),
+    ([(0, 300)], [(0, 75), (75, 150), (150, 225), (225, 300)]),
+    ([(0, 100), (200, 260)], [(0, 40), (40, 80), (80, 100), (200, 240), (240, 260)]),
+])
+def test_shards_stay_inside_runs(runs, expected):
+    assert pool(4).shards(runs) == expected
+
+
+def test_fill_missing_restarts_each_run():
+    track = FaceTrack(6, 96, face_analysis.CROP_SIZE)
+    track.key[:] = np.arange(6)
+    face_analysis.fill_missing(track, [0, 3, 4], runs=[(0, 2), (3, 6)])
+
+    assert list(track.status) == [NO_FACE, 0, 0, NO_FACE, NO_FACE, 0]
+    assert (track.matrix[0] == face_analysis.EMPTY_MATRIX).all()
+    assert (track.matrix[3] == face_analysis.EMPTY_MATRIX).all()
+    # a gap inside a run repeats the previous frame
+    assert track.key[4] == 3
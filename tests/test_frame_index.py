@@ -0,0 +1,34 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.frame_index import FrameIndex, frame_runs
+
+
+@pytest.mark.parametrize("mode, offset, expected", [
+    ("loop", 0, [0, 1, 2, 3, 0, 1, 2, 3, 0, 1]),
+    ("loop", 2, [2, 3, 0, 1, 2, 3, 0, 1, 2, 3]),
+    ("pingpong", 0, [0, 1, 2, 3, 3, 2, 1, 0, 0, 1]),
+    ("pingpong", 3, [3, 3, 2, 1, 0, 0, 1, 2, 3, 3]),
+    ("static", 2, [0] * 10),
+])
+def test_frame_index(mode, offset, expected):
+    index = FrameIndex(4, mode, offset)
+    assert [index(i) for i in range(10)] == expected
+
+
+def test_frame_runs():
+    index = FrameIndex(100)
+    assert frame_runs(index, 0, 10) == [(0, 10)]
+    # wraps around the end of the video
+    assert frame_runs(index, 95, 105) == [(0, 5), (95, 100)]
+    assert frame_runs(FrameIndex(100, "static"), 0, 50) == [(0, 1)]
+    assert frame_runs(index, 5, 5) == []
+
+
+def test_pingpong_runs_are_not_repeated():
+    # output frames 8..13 show 8, 9, 9, 8, 7, 6
+    assert frame_runs(FrameIndex(10, "pingpong"), 8, 14) == [(6, 10)]
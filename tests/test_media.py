@@ -0,0 +1,74 @@
+import os
+import sys
+
+import pytest
+from fastapi import HTTPException, Request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from media import parse_range, video_response
+
+DATA = bytes(range(100))
+
+
+def request(method="GET", **headers):
+    raw = [(k.replace("_", "-").encode(), v.encode()) for k, v in headers.items()]
+    return Request({"type": "http", "method": method, "headers": raw})
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-9", (0, 9)),
+    ("bytes=90-", (90, 99)),
+    ("bytes=-10", (90, 99)),
+    ("bytes=-500", (0, 99)),
+    ("bytes=50-500", (50, 99)),
+    ("bytes=-", None),
+    ("bytes=0-1,5-6", None),
+    ("items=0-1", None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 100) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=100-", "bytes=10-5", "bytes=-0"])
+def test_unsatisfiable_range(header):
+    with pytest.raises(HTTPException) as e:
+        parse_range(header, 100)
+    assert e.value.status_code == 416
+    assert e.value.headers["Content-Range"] == "bytes */100"
+
+
+def test_full_response():
+    response = video_response(request(), "abc", "no-cache", data=DATA)
+    assert response.status_code == 200 and response.body == DATA
+    assert response.headers["etag"] == '"abc"' and response.headers["content-length"] == "100"
+
+
+def test_range_response():
+    response = video_response(request(range="bytes=10-19"), "abc", "no-cache", data=DATA)
+    assert response.status_code == 206 and response.body == DATA[10:20]
+    assert response.headers["content-range"] == "bytes 10-19/100"
+    assert response.headers["content-length"] == "10"
+
+
+def test_stale_if_range_sends_everything():
+    response = video_response(request(range="bytes=10-19", if_range='"old"'), "abc", "no-cache", data=DATA)
+    assert response.status_code == 200 and response.body == DATA
+
+
+def test_not_modified():
+    response = video_response(request(if_none_match='"xyz", "abc"'), "abc", "no-cache", data=DATA)
+    assert response.status_code == 304 and response.headers["etag"] == '"abc"'
+
+
+def test_file_range_and_head(tmp_path):
+    path = tmp_path / "clip.mp4"
+    path.write_bytes(DATA)
+
+    response = video_response(request(range="bytes=-4"), "abc", "no-cache", path=str(path))
+    assert response.status_code == 206 and response.headers["content-range"] == "bytes 96-99/100"
+
+    response = video_response(request("HEAD"), "abc", "no-cache", path=str(path), filename="clip.mp4")
+    assert response.status_code == 200 and response.body == b""
+    assert response.headers["content-length"] == "100"
+    assert response.headers["content-disposition"] == 'attachment; filename="clip.mp4"'
@@ -0,0 +1,60 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import audio
+from realtime import MEL_STEP_SIZE, SAMPLE_RATE, MelStream
+
+FPS = 25
+
+
+def speech_like(seconds):
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    rng = np.random.default_rng(0)
+    wav = 0.3 * np.sin(2 * np.pi * 220 * t) * (1 + np.sin(2 * np.pi * 3 * t)) + 0.05 * rng.standard_normal(len(t))
+    return (np.clip(wav, -1, 1) * 32767).astype("<i2")
+
+
+def batch_windows(wav):
+    # the batch renderer's windows over the whole file
+    mel = audio.melspectrogram(wav.astype(np.float32) / 32768)
+    multiplier = 80. / FPS
+    windows, i = [], 0
+    while True:
+        start = int(i * multiplier)
+        if start + MEL_STEP_SIZE > mel.shape[1]:
+            windows.append(mel[:, -MEL_STEP_SIZE:])
+            return windows
+        windows.append(mel[:, start:start + MEL_STEP_SIZE])
+        i += 1
+
+
+def test_stream_matches_batch_mel():
+    wav = speech_like(2.0)
+    expected = batch_windows(wav)
+
+    stream = MelStream(FPS)
+    pcm = wav.tobytes()
+    windows = []
+    for offset in range(0, len(pcm), 3000):
+        stream.push(pcm[offset:offset + 3000])
+        while stream.ready(len(windows)):
+            windows.append(stream.window(len(windows)))
+    stream.end()
+    while stream.ready(len(windows)):
+        windows.append(stream.window(len(windows)))
+
+    assert stream.frame_count() == len(expected) == len(windows)
+    for got, want in zip(windows, expected):
+        assert got.shape == (80, MEL_STEP_SIZE)
+        np.testing.assert_allclose(got, want, atol=1e-4)
+
+
+def test_not_ready_before_the_window_has_arrived():
+    stream = MelStream(FPS)
+    stream.push(speech_like(0.1).tobytes())
+    assert stream.ready(0) is False
+    assert stream.frame_count() is None
@@ -0,0 +1,54 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+onnx = pytest.importorskip("onnx")
+from onnx import TensorProto, helper
+
+from utils.ort_binding import run_batch, run_rows
+from blendmasker.blendmask import BLENDMASK
+
+
+def identity_model(path, shape):
+    """A model with a fixed batch of 1 that returns its input."""
+    graph = helper.make_graph(
+        [helper.make_node("Identity", ["input"], ["output"])],
+        "identity",
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, shape)],
+        [helper.make_tensor_value_info("output", TensorProto.FLOAT, shape)]
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    onnx.save(model, str(path))
+    return str(path)
+
+
+def test_run_rows_keeps_every_row(tmp_path):
+    import onnxruntime
+
+    session = onnxruntime.InferenceSession(identity_model(tmp_path / "identity.onnx", [1, 3]), providers=["CPUExecutionProvider"])
+    batch = np.arange(9, dtype=np.float32).reshape(3, 3)
+    np.testing.assert_array_equal(run_rows(session, "input", batch), batch)
+
+
+@pytest.mark.parametrize("batch_dim", [1, "N"])
+def test_run_batch_with_fixed_or_dynamic_batch(tmp_path, batch_dim):
+    import onnxruntime
+
+    session = onnxruntime.InferenceSession(identity_model(tmp_path / "identity.onnx", [batch_dim, 3]), providers=["CPUExecutionProvider"])
+    batch = np.arange(9, dtype=np.float32).reshape(3, 3)
+    np.testing.assert_array_equal(run_batch(session, {"input": batch}), batch)
+
+
+def test_mask_batch_with_fixed_batch_model(tmp_path):
+    masker = BLENDMASK(identity_model(tmp_path / "mask.onnx", [1, 3, 8, 8]))
+    faces = np.stack([np.full((8, 8, 3), i, dtype=np.uint8) for i in range(3)])
+
+    masks = masker.mask_batch(faces)
+
+    # one mask per face, not the last face's mask three times
+    assert [float(m[0, 0]) for m in masks * 255] == pytest.approx([0, 1, 2])
@@ -0,0 +1,109 @@
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from render_queue import DONE, FAILED, RUNNING, SQLiteRenderQueue, open_queue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return SQLiteRenderQueue(str(tmp_path / "queue.db"), max_attempts=2)
+
+
+def test_claim_hands_out_jobs_in_order(queue):
+    first = queue.put({"n": 1})
+    second = queue.put({"n": 2})
+
+    assert queue.claim("a", lease=60) == (first, {"n": 1})
+    assert queue.claim("b", lease=60) == (second, {"n": 2})
+    assert queue.claim("c", lease=60) is None
+    assert queue.get(first)["status"] == RUNNING and queue.get(first)["worker"] == "a"
+
+
+def test_complete_records_the_result(queue):
+    job_id = queue.put({})
+    queue.claim("a", lease=60)
+
+    assert queue.complete(job_id, result={"spans": 1}, worker_id="a")
+    job = queue.get(job_id)
+    assert job["status"] == DONE and job["result"] == {"spans": 1}
+
+
+def test_expired_lease_is_claimed_again(queue):
+    job_id = queue.put({})
+    queue.claim("a", lease=-1)
+
+    assert queue.claim("b", lease=60)[0] == job_id
+    job = queue.get(job_id)
+    assert job["worker"] == "b" and job["attempts"] == 2
+
+
+def test_heartbeat_keeps_the_lease(queue):
+    job_id = queue.put({})
+    queue.claim("a", lease=-1)
+    queue.heartbeat(job_id, lease=60)
+
+    assert queue.claim("b", lease=60) is None
+
+
+def test_job_lost_max_attempts_times_fails(queue):
+    job_id = queue.put({})
+    queue.claim("a", lease=-1)
+    queue.claim("b", lease=-1)
+
+    assert queue.claim("c", lease=60) is None
+    job = queue.get(job_id)
+    assert job["status"] == FAILED and "lost 2 times" in job["error"]
+
+
+def test_stale_worker_cannot_complete(queue):
+    job_id = queue.put({})
+    queue.claim("a", lease=-1)
+    queue.claim("b", lease=60)
+
+    assert not queue.complete(job_id, error="late", worker_id="a")
+    assert queue.get(job_id)["status"] == RUNNING
+    assert queue.complete(job_id, worker_id="b")
+    assert not queue.complete(job_id, worker_id="b")
+
+
+def test_unclaimed_job_times_out(queue):
+    job_id = queue.put({})
+    time.sleep(0.02)
+
+    job = queue.wait(job_id, poll=0.01, queue_timeout=0.01)
+    assert job["status"] == FAILED and "no render worker" in job["error"]
+
+
+def test_expire_leaves_claimed_jobs_alone(queue):
+    job_id = queue.put({})
+    queue.claim("a", lease=60)
+
+    assert not queue.expire(job_id, "too late")
+    assert queue.get(job_id)["status"] == RUNNING
+
+
+def test_depth_and_prune(queue):
+    done = queue.put({})
+    queue.put({})
+    assert queue.depth() == 2
+
+    queue.claim("a", lease=60)
+    queue.complete(done)
+    assert queue.depth() == 1
+
+    queue.prune(ttl=-1)
+    assert queue.get(done) is None
+    assert queue.depth() == 1
+
+
+def test_open_queue(tmp_path):
+    path = tmp_path / "q.db"
+    queue = open_queue("sqlite:///" + str(path))
+    assert isinstance(queue, SQLiteRenderQueue) and path.exists()
+    with pytest.raises(ValueError):
+        open_queue("redis://localhost")
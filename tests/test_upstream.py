@@ -0,0 +1,116 @@
+import os
+import sys
+import asyncio
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("groq")
+pytest.importorskip("sarvamai")
+
+from upstream import CircuitBreaker, UpstreamUnavailable, call_upstream
+
+
+class Rejected(Exception):
+    status_code = 400
+
+
+def half_open(breaker):
+    breaker.failures = breaker.threshold
+    breaker.opened_at = 0.
+
+
+def test_cancelled_trial_frees_the_slot():
+    breaker = CircuitBreaker("test", threshold=1, reset_timeout=0.)
+    half_open(breaker)
+
+    async def main():
+        started = asyncio.Event()
+
+        async def hang():
+            started.set()
+            await asyncio.sleep(60)
+
+        task = asyncio.create_task(call_upstream(breaker, hang, deadline=60))
+        await started.wait()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    assert not breaker.trial
+    breaker.before()
+
+
+def test_rejected_requests_leave_failures_alone():
+    breaker = CircuitBreaker("test", threshold=3)
+    breaker.failure()
+
+    async def reject():
+        raise Rejected()
+
+    for _ in range(3):
+        with pytest.raises(Rejected):
+            asyncio.run(call_upstream(breaker, reject, deadline=1))
+    assert breaker.failures == 1 and breaker.state == "closed"
+
+
+class Unavailable(Exception):
+    status_code = 503
+
+
+def test_opens_after_threshold_and_fails_fast():
+    breaker = CircuitBreaker("test", threshold=2, reset_timeout=60)
+    breaker.failure()
+    assert breaker.state == "closed"
+    breaker.failure()
+    assert breaker.state == "open"
+
+    async def answer():
+        return "ok"
+
+    with pytest.raises(UpstreamUnavailable):
+        asyncio.run(call_upstream(breaker, answer, deadline=1))
+
+
+def test_half_open_trial_closes_or_reopens():
+    breaker = CircuitBreaker("test", threshold=1, reset_timeout=60)
+    half_open(breaker)
+    breaker.before()
+    with pytest.raises(UpstreamUnavailable):
+        breaker.before()
+    breaker.success()
+    assert breaker.state == "closed" and breaker.failures == 0
+
+    half_open(breaker)
+    breaker.before()
+    breaker.failure()
+    assert breaker.state == "open" and not breaker.trial
+
+
+def test_retryable_errors_are_retried():
+    breaker = CircuitBreaker("test", threshold=5)
+    calls = []
+
+    async def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise Unavailable()
+        return "ok"
+
+    assert asyncio.run(call_upstream(breaker, flaky, deadline=1, attempts=3, base_delay=0)) == "ok"
+    assert len(calls) == 3 and breaker.failures == 0
+
+
+def test_non_idempotent_calls_are_not_retried():
+    breaker = CircuitBreaker("test", threshold=5)
+    calls = []
+
+    async def down():
+        calls.append(1)
+        raise Unavailable()
+
+    with pytest.raises(Unavailable):
+        asyncio.run(call_upstream(breaker, down, deadline=1, idempotent=False, base_delay=0))
+    assert len(calls) == 1 and breaker.failures == 1
@@ -0,0 +1,218 @@
+import os
+import time
+import random
+import asyncio
+
+import httpx
+from groq import AsyncGroq, APIConnectionError, APITimeoutError
+from sarvamai import AsyncSarvamAI
+
+import metrics
+
+# -------------------------------------------------
+# Settings
+# -------------------------------------------------
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL")
+SARVAM_BASE_URL = os.getenv("SARVAM_BASE_URL")
+
+GROQ_TIMEOUT = float(os.getenv("GROQ_TIMEOUT", "30"))
+SARVAM_TIMEOUT = float(os.getenv("SARVAM_TIMEOUT", "30"))
+
+UPSTREAM_RETRIES = int(os.getenv("UPSTREAM_RETRIES", "3"))
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "20"))
+
+LLM_MODEL = "llama-3.1-8b-instant"
+
+
+class UpstreamUnavailable(Exception):
+    """Raised without calling out when an upstream's circuit is open."""
+
+
+# -------------------------------------------------
+# Circuit breaker
+# -------------------------------------------------
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failures and rejects calls for
+    `reset_timeout` seconds; then lets a single trial call through and
+    closes again if it succeeds.
+    """
+
+    def __init__(self, name: str, threshold: int = 5, reset_timeout: float = 30):
+        self.name = name
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def before(self):
+        state = self.state
+        if state == "open" or (state == "half-open" and self.trial):
+            raise UpstreamUnavailable(f"{self.name} is unavailable, failing fast")
+        if state == "half-open":
+            self.trial = True
+
+    def success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+
+    def release(self):
+        """An outcome that says nothing about the upstream: only frees the trial slot."""
+        self.trial = False
+
+    def failure(self):
+        self.failures += 1
+        self.trial = False
+        if self.opened_at is not None or self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+
+# -------------------------------------------------
+# Retries
+# -------------------------------------------------
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, (asyncio.TimeoutError, httpx.TransportError, APIConnectionError, APITimeoutError)):
+        return True
+    status = getattr(error, "status_code", None)
+    return status is not None and (status == 429 or status >= 500)
+
+
+async def call_upstream(breaker: CircuitBreaker, fn, deadline: float, idempotent: bool = True,
+                        attempts: int = UPSTREAM_RETRIES, base_delay: float = 0.25, max_delay: float = 4.0):
+    """
+    Await `fn()` with a per-attempt deadline.
+
+    Idempotent calls are retried on timeouts, connection errors, 429 and
+    5xx with full-jitter exponential backoff. Timeouts, connection errors,
+    429 and 5xx count as failures for the breaker, answers as successes;
+    other errors (4xx, bad input) leave it as it is.
+    """
+    attempt = 0
+    while True:
+        breaker.before()
+        attempt += 1
+        try:
+            result = await asyncio.wait_for(fn(), timeout=deadline)
+        except Exception as e:
+            retryable = is_retryable(e)
+            if retryable:
+                breaker.failure()
+            else:
+                # only this request was rejected: a run of them must not
+                # reset the failures of an upstream that is degrading
+                breaker.release()
+            if not (retryable and idempotent and attempt < attempts):
+                raise
+            await asyncio.sleep(random.uniform(0, min(max_delay, base_delay * 2 ** attempt)))
+            continue
+        except BaseException:
+            # cancelled: no outcome, but a half-open trial must not keep its slot
+            breaker.release()
+            raise
+
+        breaker.success()
+        return result
+
+
+# -------------------------------------------------
+# Clients
+# -------------------------------------------------
+def pooled_http_client(timeout: float) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(timeout, connect=min(timeout, 5.0)),
+        limits=httpx.Limits(
+            max_connections=UPSTREAM_MAX_CONNECTIONS,
+            max_keepalive_connections=UPSTREAM_MAX_CONNECTIONS,
+            keepalive_expiry=60
+        )
+    )
+
+
+class GroqClient:
+    def __init__(self, api_key: str, base_url: str = GROQ_BASE_URL, timeout: float = GROQ_TIMEOUT):
+        self.timeout = timeout
+        self.breaker = CircuitBreaker("groq")
+        self.http = pooled_http_client(timeout)
+        # retries are handled by call_upstream, not by the SDK
+        self.client = AsyncGroq(api_key=api_key, base_url=base_url, http_client=self.http, max_retries=0)
+
+    async def chat(self, messages: list, model: str = LLM_MODEL) -> str:
+        async def create():
+            return await self.client.chat.completions.create(model=model, messages=messages)
+
+        with metrics.span("llm"):
+            resp = await call_upstream(self.breaker, create, self.timeout)
+        return resp.choices[0].message.content.strip()
+
+    async def stream_chat(self, messages: list, model: str = LLM_MODEL):
+        """
+        Yield reply text deltas as they arrive.
+
+        Only opening the stream is retried; once tokens have been handed
+        out a failure is raised to the caller instead of replaying them.
+        """
+        async def create():
+            return await self.client.chat.completions.create(model=model, messages=messages, stream=True)
+
+        # the llm span covers opening the stream up to its last token
+        with metrics.span("llm"):
+            stream = await call_upstream(self.breaker, create, self.timeout)
+        started = time.perf_counter()
+        try:
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(stream.__anext__(), timeout=self.timeout)
+                except StopAsyncIteration:
+                    break
+                yield chunk.choices[0].delta.content or ""
+        except Exception as e:
+            if is_retryable(e):
+                self.breaker.failure()
+            else:
+                self.breaker.release()
+            raise
+        finally:
+            await stream.close()
+            metrics.add("llm", time.perf_counter() - started)
+
+    async def close(self):
+        await self.http.aclose()
+
+
+class SarvamClient:
+    def __init__(self, api_key: str, base_url: str = SARVAM_BASE_URL, timeout: float = SARVAM_TIMEOUT):
+        self.timeout = timeout
+        self.breaker = CircuitBreaker("sarvam")
+        self.http = pooled_http_client(timeout)
+        self.client = AsyncSarvamAI(
+            api_subscription_key=api_key,
+            base_url=base_url,
+            timeout=timeout,
+            httpx_client=self.http
+        )
+
+    async def tts(self, text: str, speaker: str = None, language: str = "en-IN") -> str:
+        """Return the base64 encoded wav for `text`."""
+        kwargs = {"text": text, "target_language_code": language}
+        if speaker:
+            kwargs["speaker"] = speaker
+
+        async def convert():
+            return await self.client.text_to_speech.convert(**kwargs)
+
+        with metrics.span("tts"):
+            tts = await call_upstream(self.breaker, convert, self.timeout)
+        return tts.audios[0]
+
+    async def close(self):
+        await self.http.aclose()
@@ -1,6 +1,67 @@
 import cv2
 import numpy as np
 
+from utils.face_track import invert_affine
+
+# FFHQ landmarks (eyes, nose, mouth corners) in a 512x512 crop
+TEMPLATE_FFHQ = np.array(
+	[
+		[192.98138, 239.94708],
+		[318.90277, 240.19366],
+		[256.63416, 314.01935],
+		[201.26117, 371.41043],
+		[313.08905, 371.15118]
+	])
+
+
+def similarity_matrices(src, dst):
+    """
+    Least-squares similarity transforms (rotation, uniform scale and
+    translation) from every (K, 2) point set in `src` (N, K, 2) onto `dst`
+    (K, 2), as (N, 2, 3). This is the closed form of the fit
+    cv2.estimateAffinePartial2D converges to when all points are inliers.
+    """
+    src = np.asarray(src, dtype=np.float64)
+    dst = np.asarray(dst, dtype=np.float64)
+    src_mean = src.mean(axis=1)
+    dst_mean = dst.mean(axis=0)
+    s = src - src_mean[:, None]
+    d = dst - dst_mean
+
+    norm = (s ** 2).sum(axis=(1, 2))
+    a = (s[..., 0] * d[:, 0] + s[..., 1] * d[:, 1]).sum(axis=1) / norm
+    b = (s[..., 0] * d[:, 1] - s[..., 1] * d[:, 0]).sum(axis=1) / norm
+
+    matrices = np.empty((len(src), 2, 3))
+    matrices[:, 0, 0] = a
+    matrices[:, 0, 1] = -b
+    matrices[:, 1, 0] = b
+    matrices[:, 1, 1] = a
+    matrices[:, 0, 2] = dst_mean[0] - (a * src_mean[:, 0] - b * src_mean[:, 1])
+    matrices[:, 1, 2] = dst_mean[1] - (b * src_mean[:, 0] + a * src_mean[:, 1])
+    return matrices
+
+
+def head_matrices_256(landmarks, scale=1.4, size=512):
+    """get_cropped_head_256() transforms of (N, 5, 2) landmarks at once: (matrices, inverses)."""
+    landmarks = np.asarray(landmarks, dtype=np.float64).reshape(-1, 5, 2)
+    center = landmarks.mean(axis=1, keepdims=True)
+    landmarks = center + (landmarks - center) * scale
+    matrices = similarity_matrices(landmarks, TEMPLATE_FFHQ / 2 * (256 / size))
+    return matrices, invert_affine(matrices)
+
+
+def resize_faces(faces, size=256):
+    """(N, H, W, C) crops as (N, size, size, C), resized only if they are not already."""
+    faces = np.asarray(faces)
+    if faces.shape[1:3] != (size, size):
+        faces = np.stack([cv2.resize(face, (size, size)) for face in faces])
+    return faces
+
+
+def warp_crop(img, matrix, size):
+    return cv2.warpAffine(img, matrix, (size, size), borderMode=cv2.BORDER_REPLICATE)
+
 
 def align_crop(img, landmark, size):
     template_ffhq = np.array(
@@ -26,20 +87,8 @@ def get_cropped_head(img, landmark, scale=1.4, size=512):
 # --------------------------------------------------
     
 def align_crop_256(img, landmark, size):
-    template_ffhq = np.array(
-	[
-		[192.98138, 239.94708],
-		[318.90277, 240.19366],
-		[256.63416, 314.01935],
-		[201.26117, 371.41043],
-		[313.08905, 371.15118]
-	])
-    
-    template_ffhq = template_ffhq /2
-    template_ffhq *= (256 / size)
-    matrix = cv2.estimateAffinePartial2D(landmark, template_ffhq, method=cv2.RANSAC, ransacReprojThreshold=100)[0]
-    warped = cv2.warpAffine(img, matrix, (size, size), borderMode=cv2.BORDER_REPLICATE)
-    return warped, matrix
+    matrix = similarity_matrices(np.asarray(landmark)[np.newaxis], TEMPLATE_FFHQ / 2 * (256 / size))[0]
+    return warp_crop(img, matrix, size), matrix
 
 
 def get_cropped_head_256(img, landmark, scale=1.4, size=512):
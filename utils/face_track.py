@@ -0,0 +1,96 @@
+import os
+import json
+
+import numpy as np
+
+# per-frame status
+FOUND = 0
+NO_FACE = -1
+
+ARRAYS = ("aligned", "sub", "matrix", "inverse", "status", "key")
+
+
+def invert_affine(matrix):
+    """Inverse of a (..., 2, 3) stack of affine matrices; singular ones invert to zeros."""
+    matrix = np.asarray(matrix, dtype=np.float64)
+    a, b, tx = matrix[..., 0, 0], matrix[..., 0, 1], matrix[..., 0, 2]
+    c, d, ty = matrix[..., 1, 0], matrix[..., 1, 1], matrix[..., 1, 2]
+    det = a * d - b * c
+    ok = det != 0
+    inv_det = np.divide(1.0, det, out=np.zeros_like(det), where=ok)
+
+    inverse = np.empty(matrix.shape, dtype=np.float64)
+    inverse[..., 0, 0] = d * inv_det
+    inverse[..., 0, 1] = -b * inv_det
+    inverse[..., 1, 0] = -c * inv_det
+    inverse[..., 1, 1] = a * inv_det
+    inverse[..., 0, 2] = -(inverse[..., 0, 0] * tx + inverse[..., 0, 1] * ty)
+    inverse[..., 1, 2] = -(inverse[..., 1, 0] * tx + inverse[..., 1, 1] * ty)
+    return inverse.astype(np.float32)
+
+
+class FaceTrack:
+    """
+    Face data of every frame of a video, as contiguous arrays:
+
+    - aligned: (N, 256, 256, 3) uint8 aligned heads
+    - sub:     (N, S, S, 3) uint8 Wav2Lip input crops
+    - matrix:  (N, 2, 3) float32 frame -> aligned transforms
+    - inverse: (N, 2, 3) float32 aligned -> frame transforms
+    - status:  (N,) int8, FOUND or NO_FACE
+    - key:     (N,) int32, the keyframe whose geometry the frame uses;
+               frames sharing a key share matrix, inverse and warped masks
+
+    Slicing returns a FaceTrack of views. save() writes one .npy per
+    array so load() can memory-map them.
+    """
+
+    def __init__(self, count: int = 0, sub_size: int = 96, aligned_size: int = 256, arrays: dict = None):
+        if arrays is not None:
+            for name in ARRAYS:
+                setattr(self, name, arrays[name])
+            return
+
+        self.aligned = np.zeros((count, aligned_size, aligned_size, 3), dtype=np.uint8)
+        self.sub = np.zeros((count, sub_size, sub_size, 3), dtype=np.uint8)
+        self.matrix = np.zeros((count, 2, 3), dtype=np.float32)
+        self.inverse = np.zeros((count, 2, 3), dtype=np.float32)
+        self.status = np.zeros(count, dtype=np.int8)
+        self.key = np.arange(count, dtype=np.int32)
+
+    def __len__(self):
+        return len(self.status)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return FaceTrack(arrays={name: getattr(self, name)[index] for name in ARRAYS})
+        raise TypeError("index a FaceTrack with a slice, or its arrays with an int")
+
+    def set(self, i: int, aligned, sub, matrix, status: int = FOUND):
+        self.aligned[i] = aligned
+        self.sub[i] = sub
+        self.matrix[i] = matrix
+        self.status[i] = status
+
+    def copy_row(self, src: int, dst: int, status: int):
+        for name in ARRAYS:
+            getattr(self, name)[dst] = getattr(self, name)[src]
+        self.status[dst] = status
+
+    def update_inverse(self):
+        self.inverse[:] = invert_affine(self.matrix)
+
+    # -------------------------------------------------
+    # Storage
+    # -------------------------------------------------
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        for name in ARRAYS:
+            np.save(os.path.join(path, name + ".npy"), getattr(self, name))
+        with open(os.path.join(path, "track.json"), "w") as f:
+            json.dump({"frames": len(self), "sub_size": self.sub.shape[1]}, f)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True):
+        mode = "r" if mmap else None
+        return cls(arrays={name: np.load(os.path.join(path, name + ".npy"), mmap_mode=mode) for name in ARRAYS})
@@ -0,0 +1,31 @@
+class FrameIndex:
+    """
+    Source frame shown at output frame i: the first frame (static),
+    looping (loop) or forwards then backwards (pingpong), starting at
+    `offset`. Every per-frame list is read through it, never duplicated.
+    """
+
+    def __init__(self, count, mode="loop", offset=0):
+        self.count = count
+        self.mode = mode
+        self.offset = offset
+
+    def __call__(self, i):
+        if self.mode == "static":
+            return 0
+        j = i + self.offset
+        if self.mode == "pingpong":
+            j %= 2 * self.count
+            return j if j < self.count else 2 * self.count - 1 - j
+        return j % self.count
+
+
+def frame_runs(frame_index, first, last):
+    """The source frames output frames first..last show, as sorted contiguous (start, end) ranges."""
+    runs = []
+    for j in sorted({frame_index(i) for i in range(first, last)}):
+        if runs and runs[-1][1] == j:
+            runs[-1][1] = j + 1
+        else:
+            runs.append([j, j + 1])
+    return [tuple(run) for run in runs]
@@ -0,0 +1,120 @@
+import weakref
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import onnxruntime
+
+# -------------------------------------------------
+# Preallocated I/O binding for per-frame inference
+#
+# session.run() allocates new output arrays on every call. While rendering
+# the input shapes of a model hardly ever change, so run() below binds one
+# set of input and output buffers per input shape and reuses them: the
+# feeds are copied into the bound inputs and ORT writes its results
+# straight into the bound outputs.
+#
+# The arrays run() returns are those buffers, overwritten by the next call
+# with the same shapes. Callers consume or copy them before that; the
+# wrappers' `out=` arguments write their result into a buffer the caller
+# keeps, e.g. one per call site for the whole render.
+#
+# Bindings live as long as their session, so the profiler's swapped-in
+# sessions get their own, and belong to one thread, so concurrent renders
+# sharing a session never write into each other's buffers.
+# -------------------------------------------------
+MAX_BINDINGS = 8
+
+_local = threading.local()
+
+
+class _Binding:
+    def __init__(self, session, feeds: dict, output_names):
+        self.inputs = {name: np.empty_like(value, order="C") for name, value in feeds.items()}
+
+        # one plain run tells the output shapes and types
+        for name, value in feeds.items():
+            self.inputs[name][...] = value
+        first = session.run(output_names, self.inputs)
+        self.names = output_names or [o.name for o in session.get_outputs()]
+        self.outputs = [np.ascontiguousarray(value) for value in first]
+
+        self.io = session.io_binding()
+        # the OrtValues share memory with the NumPy buffers above
+        self.values = []
+        for name, buffer in self.inputs.items():
+            value = onnxruntime.OrtValue.ortvalue_from_numpy(buffer)
+            self.io.bind_ortvalue_input(name, value)
+            self.values.append(value)
+        for name, buffer in zip(self.names, self.outputs):
+            value = onnxruntime.OrtValue.ortvalue_from_numpy(buffer)
+            self.io.bind_ortvalue_output(name, value)
+            self.values.append(value)
+
+
+def _key(feeds: dict, output_names):
+    return tuple((name, value.shape, value.dtype.str) for name, value in feeds.items()), tuple(output_names or ())
+
+
+def run(session, feeds: dict, output_names=None) -> list:
+    """session.run(output_names, feeds) into buffers bound once per input shape."""
+    feeds = {name: np.asarray(value) for name, value in feeds.items()}
+    if not hasattr(_local, "bindings"):
+        _local.bindings = weakref.WeakKeyDictionary()
+    cache = _local.bindings.get(session)
+    if cache is None:
+        cache = _local.bindings[session] = OrderedDict()
+
+    key = _key(feeds, output_names)
+    binding = cache.get(key)
+    if binding is None:
+        if len(cache) >= MAX_BINDINGS:
+            cache.popitem(last=False)
+        binding = cache[key] = _Binding(session, feeds, output_names)
+        return binding.outputs
+    cache.move_to_end(key)
+
+    for name, value in feeds.items():
+        buffer = binding.inputs[name]
+        if value is not buffer:
+            np.copyto(buffer, value)
+    session.run_with_iobinding(binding.io)
+    return binding.outputs
+
+
+def run_rows(session, name: str, batch) -> np.ndarray:
+    """
+    The first output of a model with a fixed batch of 1 for every row of
+    `batch`, stacked. Each row's result is copied out before the next call
+    overwrites the bound buffer.
+    """
+    stacked = None
+    for i, x in enumerate(batch):
+        result = run(session, {name: x[np.newaxis]})[0]
+        if stacked is None:
+            stacked = np.empty((len(batch),) + result.shape[1:], dtype=result.dtype)
+        stacked[i] = result[0]
+    return stacked
+
+
+def run_batch(session, feeds: dict) -> np.ndarray:
+    """
+    The first output of a one-input model for a batch: one run(), or one
+    per row (run_rows) for a model exported with a fixed batch of 1.
+    """
+    (name, batch), = feeds.items()
+    model_input = next(i for i in session.get_inputs() if i.name == name)
+    if model_input.shape[0] == 1:
+        return run_rows(session, name, batch)
+    return run(session, feeds)[0]
+
+
+def into(result, out=None, owned=False):
+    """
+    `result` written into `out`. Without `out` the caller gets `result`
+    itself if it is `owned` (not a bound buffer), else a copy.
+    """
+    if out is None:
+        return result if owned else np.array(result)
+    np.copyto(out, result, casting="unsafe")
+    return out
@@ -0,0 +1,109 @@
+import os
+import json
+import platform
+
+import onnxruntime
+
+# -------------------------------------------------
+# Per-host ONNX Runtime session settings
+#
+# autotune.py measures every model on this host and writes the fastest
+# graph variant and SessionOptions per model into a profile. Every place
+# that creates a session passes its model path and options through
+# tuned(), which applies the profile if there is one; without a profile
+# the sessions keep their own settings.
+#
+# Env:
+#   ORT_PROFILE    profile file (default: ort_profiles/<hostname>.json in the repo)
+# -------------------------------------------------
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROFILE_DIR = os.path.join(BASE_DIR, "ort_profiles")
+
+# graph variants of one model, told apart by the suffix before .onnx
+VARIANT_SUFFIXES = (".u8.int8", ".int8", ".u8")
+
+EXECUTION_MODES = {
+    "sequential": onnxruntime.ExecutionMode.ORT_SEQUENTIAL,
+    "parallel": onnxruntime.ExecutionMode.ORT_PARALLEL
+}
+
+_profile = None
+
+# cap on intra-op threads of every session made in this process, 0 for none
+_max_threads = 0
+
+
+def profile_path() -> str:
+    return os.environ.get("ORT_PROFILE") or os.path.join(PROFILE_DIR, platform.node() + ".json")
+
+
+def model_key(path: str) -> str:
+    """The model `path` is a variant of, relative to the working directory like the engine's paths."""
+    root, ext = os.path.splitext(os.path.relpath(os.path.abspath(path)))
+    for suffix in VARIANT_SUFFIXES:
+        if root.endswith(suffix):
+            root = root[:-len(suffix)]
+            break
+    return (root + ext).replace(os.sep, "/")
+
+
+def load(path: str = None) -> dict:
+    """The models section of this host's profile, read once; {} without one."""
+    global _profile
+    if _profile is not None and path is None:
+        return _profile
+
+    path = path or profile_path()
+    models = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            profile = json.load(f)
+        if profile.get("cpus") != os.cpu_count() or profile.get("onnxruntime") != onnxruntime.__version__:
+            print(f"Ignoring ORT profile {path}: tuned for {profile.get('cpus')} CPUs and onnxruntime {profile.get('onnxruntime')}")
+        else:
+            models = profile.get("models", {})
+            print(f"Using ORT profile {path} ({len(models)} models)")
+    _profile = models
+    return models
+
+
+def apply(session_options, settings: dict):
+    """Set the tuned SessionOptions fields of `settings` on `session_options`."""
+    if "intra_op_num_threads" in settings:
+        session_options.intra_op_num_threads = settings["intra_op_num_threads"]
+    if "inter_op_num_threads" in settings:
+        session_options.inter_op_num_threads = settings["inter_op_num_threads"]
+    if "execution_mode" in settings:
+        session_options.execution_mode = EXECUTION_MODES[settings["execution_mode"]]
+    if "enable_mem_pattern" in settings:
+        session_options.enable_mem_pattern = settings["enable_mem_pattern"]
+    if "enable_cpu_mem_arena" in settings:
+        session_options.enable_cpu_mem_arena = settings["enable_cpu_mem_arena"]
+    return session_options
+
+
+def limit_threads(threads: int):
+    """Cap the intra-op threads of sessions created from now on, e.g. in one of many pool workers."""
+    global _max_threads
+    _max_threads = threads
+
+
+def tuned(model_path: str, session_options=None):
+    """
+    (model path, SessionOptions) for a new session of `model_path`: the
+    profile's variant and settings for it if it was tuned, else the
+    arguments as they are (new default options if none were given),
+    within the limit_threads() cap.
+    """
+    if session_options is None:
+        session_options = onnxruntime.SessionOptions()
+    entry = load().get(model_key(model_path)) or {}
+    variant = entry.get("variant")
+    if variant and os.path.exists(variant):
+        model_path = variant
+    apply(session_options, entry.get("options", {}))
+
+    if _max_threads and not 0 < session_options.intra_op_num_threads <= _max_threads:
+        session_options.intra_op_num_threads = _max_threads
+        session_options.inter_op_num_threads = 1
+    return model_path, session_options
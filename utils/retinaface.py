@@ -12,6 +12,9 @@ import os
 import cv2
 import sys
 
+from utils.ort_binding import run
+from utils.ort_profile import tuned
+
 def softmax(z):
     assert len(z.shape) == 2
     s = np.max(z, axis=1)
@@ -73,6 +76,7 @@ class RetinaFace:
         self.session_options = session_options
         if self.session_options is None:
             self.session_options = onnxruntime.SessionOptions()
+        self.model_file, self.session_options = tuned(self.model_file, self.session_options)
         self.session = onnxruntime.InferenceSession(self.model_file, providers=provider, sess_options=self.session_options)
         self.center_cache = {}
         self.nms_thresh = 0.4
@@ -142,7 +146,7 @@ class RetinaFace:
         kpss_list = []
         input_size = tuple(img.shape[0:2][::-1])
         blob = cv2.dnn.blobFromImage(img, 1.0/self.input_std, input_size, (self.input_mean, self.input_mean, self.input_mean), swapRB=True)
-        net_outs = self.session.run(self.output_names, {self.input_name : blob})
+        net_outs = run(self.session, {self.input_name : blob}, self.output_names)
 
         input_height = blob.shape[2]
         input_width = blob.shape[3]
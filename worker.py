@@ -0,0 +1,109 @@
+import os
+import sys
+import time
+import socket
+import argparse
+import threading
+import traceback
+import multiprocessing
+
+import lipsync
+import metrics
+from render_queue import open_queue
+
+# -------------------------------------------------
+# Arguments
+# -------------------------------------------------
+parser = argparse.ArgumentParser(description='Inference worker: preloads the ONNX sessions and renders jobs from the render queue')
+
+parser.add_argument('--queue', type=str, default=lipsync.RENDER_QUEUE, help='Render queue url, e.g. sqlite:///temp/render_queue.db')
+parser.add_argument('--processes', type=int, default=1, help='Number of worker processes to run on this box')
+parser.add_argument('--preload', nargs='*', default=[], choices=['gpen', 'gfpgan', 'codeformer', 'restoreformer', 'frame_enhancer', 'face_mask', 'face_occluder', 'segmentation', 'occluder', 'denoise'], help='Optional models to load at startup in addition to Wav2Lip, detector and recognition')
+parser.add_argument('--poll', type=float, default=0.5, help='Seconds to sleep when the queue is empty')
+parser.add_argument('--lease', type=float, default=60, help='Seconds a claimed job stays reserved without a heartbeat')
+parser.add_argument('--keep', type=float, default=86400, help='Seconds finished job records are kept in the queue')
+
+# -------------------------------------------------
+# Worker loop
+# -------------------------------------------------
+def heartbeat(queue, job_id, lease, stop):
+    while not stop.wait(lease / 3):
+        queue.heartbeat(job_id, lease)
+
+
+def run_worker(opts, index):
+    # model paths inside the inference script are relative to the repo root
+    os.chdir(lipsync.BASE_DIR)
+    sys.path.insert(0, lipsync.BASE_DIR)
+
+    # importing the engine loads the detector and recognition sessions
+    import inference_onnxModel as engine
+    engine.keep_models = True
+    engine.load_model(engine.device, lipsync.WAV2LIP_MODEL)
+    for name in opts.preload:
+        engine.get_model(name)
+
+    # image jobs on the bundled avatars start rendering straight away
+    for face in lipsync.bundled_avatars():
+        try:
+            engine.precompute_face(["--checkpoint_path", lipsync.WAV2LIP_MODEL, "--face", face, "--audio", face,
+                                    "--letterbox", lipsync.IMAGE_FRAME_SIZE])
+        except Exception as e:
+            print(f"Skipping avatar {face}: {e}", flush=True)
+
+    queue = open_queue(opts.queue)
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{index}"
+    print(f"[{worker_id}] ready", flush=True)
+
+    while True:
+        claimed = queue.claim(worker_id, opts.lease)
+        if claimed is None:
+            time.sleep(opts.poll)
+            continue
+
+        job_id, spec = claimed
+        stop = threading.Event()
+        threading.Thread(target=heartbeat, args=(queue, job_id, opts.lease, stop), daemon=True).start()
+
+        # spans go back to the submitting web app with the result
+        trace = metrics.start(spec.get("trace_id") or job_id)
+        error = None
+        try:
+            engine.configure(lipsync.render_argv(spec))
+            engine.main()
+            lipsync.finish_output(spec)
+        except BaseException as e:
+            # argparse exits on bad arguments; that fails the job, not the worker
+            traceback.print_exc()
+            error = str(e) or type(e).__name__
+            if isinstance(e, SystemExit):
+                error = f"render arguments rejected (exit code {e.code})"
+            if isinstance(e, KeyboardInterrupt):
+                queue.complete(job_id, error="worker stopped", result=trace.to_dict(), worker_id=worker_id)
+                raise
+        finally:
+            stop.set()
+
+        if not queue.complete(job_id, error=error, result=trace.to_dict(), worker_id=worker_id):
+            print(f"[{worker_id}] job {job_id} was reclaimed by another worker, result dropped", flush=True)
+
+        queue.prune(opts.keep)
+
+
+def main():
+    opts = parser.parse_args()
+
+    if opts.processes == 1:
+        run_worker(opts, 0)
+        return
+
+    ctx = multiprocessing.get_context("spawn")
+    workers = [ctx.Process(target=run_worker, args=(opts, i)) for i in range(opts.processes)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+
+
+if __name__ == '__main__':
+    main()
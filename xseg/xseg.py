@@ -1,7 +1,10 @@
-﻿import cv2
-import numpy as np
+﻿import numpy as np
 import onnxruntime
 
+from utils.face_alignment import resize_faces
+from utils.ort_binding import run_batch, into
+from utils.ort_profile import tuned
+
 class MASK:
     def __init__(self, model_path="xseg.onnx", device='cpu'):
         session_options = onnxruntime.SessionOptions()
@@ -9,17 +12,19 @@ class MASK:
         providers = ["CPUExecutionProvider"]
         if device == 'cuda':
             providers = [("CUDAExecutionProvider", {"cudnn_conv_algo_search": "DEFAULT"}),"CPUExecutionProvider"]
+        model_path, session_options = tuned(model_path, session_options)
         self.session = onnxruntime.InferenceSession(model_path, sess_options=session_options, providers=providers)
+        self.input_name = self.session.get_inputs()[0].name
+        self.prepared = self.session.get_inputs()[0].type == 'tensor(uint8)'
 
         
-    def mask(self, img):
+    def mask_batch(self, faces, out=None):
+        """(N, H, W, 3) BGR faces -> (N, 256, 256) float32 masks in [0, 1]."""
+        if self.prepared:
+            return into(run_batch(self.session, {self.input_name: np.ascontiguousarray(resize_faces(faces), dtype=np.uint8)}), out)
+        batch = resize_faces(faces).astype(np.float32)[..., ::-1] / 255
+        result = run_batch(self.session, {self.input_name: np.ascontiguousarray(batch)})
+        return into(result[..., 0], out)
 
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        img = cv2.resize(img, (256, 256))
-        img = img.astype(np.float32)
-        img = img / 255
-        img = np.expand_dims(img, axis=0).astype(np.float32) 
-              
-        result = self.session.run(None, {(self.session.get_inputs()[0].name):img})[0][0]
-
-        return result
+    def mask(self, img):
+        return self.mask_batch(img[np.newaxis])[0]